@@ -1,4 +1,6 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Deque
+from array import array
+from collections import deque
 
 def make_issue(rule_id: str, severity: str, message: str, start=None, end=None, snippet: str = None):
     return {
@@ -10,31 +12,186 @@ def make_issue(rule_id: str, severity: str, message: str, start=None, end=None,
         "snippet": snippet,
     }
 
+FindingKey = Tuple[Any, Any, Any, Any]
+
+def finding_key(it: Dict[str, Any]) -> FindingKey:
+    """去重键：(rule_id, message, start_line, end_line)"""
+    return (it.get("rule_id"), it.get("message"), it.get("start_line"), it.get("end_line"))
+
+def _as_line(v: Any) -> Optional[int]:
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, int):
+        return v
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    if isinstance(v, str) and v.strip().isdigit():
+        return int(v)
+    return None
+
+class Finding:
+    """紧凑的发现对象（__slots__，去重键构造时算好），用于合并与生成报告。
+
+    进程池、缓存与 LLM 输出之间仍以 make_issue 形状的 dict 交换；from_dict 只在报告阶段做一次字段
+    规整（替代逐条 Pydantic 校验），to_dict 还原为同样的 dict。
+    """
+    __slots__ = ("rule_id", "severity", "message", "start_line", "end_line", "snippet", "key")
+
+    def __init__(self, rule_id: str, severity: str, message: str, start_line: Optional[int] = None,
+                 end_line: Optional[int] = None, snippet: Optional[str] = None):
+        self.rule_id = rule_id
+        self.severity = severity
+        self.message = message
+        self.start_line = start_line
+        self.end_line = end_line
+        self.snippet = snippet
+        self.key: FindingKey = (rule_id, message, start_line, end_line)
+
+    @classmethod
+    def from_dict(cls, it: Any) -> Optional["Finding"]:
+        """analyzer 产出的 dict 原样接收；LLM 给出的字段做类型规整，非 dict 返回 None"""
+        if not isinstance(it, dict):
+            return None
+        rule_id, severity, message = it.get("rule_id"), it.get("severity"), it.get("message")
+        start, end, snippet = it.get("start_line"), it.get("end_line"), it.get("snippet")
+        if start is not None and type(start) is not int:
+            start = _as_line(start)
+        if end is not None and type(end) is not int:
+            end = _as_line(end)
+        return cls(
+            rule_id if type(rule_id) is str else str(rule_id or "UNKNOWN"),
+            severity if type(severity) is str else str(severity or "low"),
+            message if type(message) is str else str(message or ""),
+            start,
+            end,
+            snippet if snippet is None or type(snippet) is str else str(snippet),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"rule_id": self.rule_id, "severity": self.severity, "message": self.message,
+                "start_line": self.start_line, "end_line": self.end_line, "snippet": self.snippet}
+
+def _is_func_header(ln: str) -> bool:
+    return ("def " in ln or "function " in ln or "public " in ln or "void " in ln) and "(" in ln and ")" in ln
+
+class LongFunctionDetector:
+    """逐行喂入的过长函数检测，供单遍规则引擎复用"""
+
+    def __init__(self, threshold: int = 50):
+        self.threshold = threshold
+        self.in_func, self.start, self.count = False, 0, 0
+        self.issues: List[Dict[str, Any]] = []
+
+    def feed(self, i: int, ln: str):
+        if _is_func_header(ln):
+            if self.in_func and self.count > self.threshold:
+                self.issues.append(make_issue("SML.LONG_FUNC", "medium", f"函数过长: {self.count} 行", self.start, i-1))
+            self.in_func, self.start, self.count = True, i, 1
+        elif self.in_func:
+            self.count += 1
+
+    def finish(self) -> List[Dict[str, Any]]:
+        if self.in_func and self.count > self.threshold:
+            self.issues.append(make_issue("SML.LONG_FUNC", "medium", f"函数过长: {self.count} 行", self.start, self.start+self.count-1))
+            self.in_func = False
+        return self.issues
+
+_MOD = (1 << 61) - 1   # 梅森素数，滚动哈希取模
+_BASE = 1_000_003
+_MASK = (1 << 63) - 1
+
+class DuplicateBlockDetector:
+    """逐行喂入的重复代码块检测（Rabin-Karp 滚动哈希）
+
+    空行不参与窗口；每行先归一化（strip）并哈希为 64 位整数，窗口签名由行哈希滚动得到。
+    签名命中后再逐行比对 64 位行哈希排除碰撞；重复区间以首个命中窗口为锚点 (k0, j0)，之后窗口 k 只要与
+    原始位置 j0 + (k - k0) 的窗口相同就延伸，整段粘贴、同一块反复出现都只产生一条区间告警。
+    已告警区间内不再开始新的告警。
+
+    内存有界：只保留最近 window 行原文（用于片段），历史只存前 max_entries 个窗口的行号与哈希（数组），
+    之后的行仍与历史比对，但不再登记为新的原始位置。
+    """
+
+    def __init__(self, window: int = 6, max_entries: int = 200_000):
+        self.window = window
+        self.max_entries = max_entries
+        self.recent: Deque[Tuple[str, int, int]] = deque(maxlen=window)  # 最近 window 个非空行: (原文, 行号, 哈希)
+        self.n = 0                           # 已读入的非空行数
+        self.lineno = array("l")             # 历史非空行的原始行号（前 max_entries + window - 1 行）
+        self.lhash = array("q")              # 历史非空行的 64 位哈希
+        self.wsig = array("q")               # 历史窗口的签名（下标即窗口起始的非空行下标）
+        self.sig2pos: Dict[int, int] = {}    # 窗口签名 -> 首次出现的窗口下标
+        self.high = pow(_BASE, window - 1, _MOD)
+        self.sig = 0
+        self.run = None                      # 当前区间: [dup_start, orig_start, dup_last, 起始行号, 结束行号, 片段]
+        self.covered = 0                     # 已告警区间之后的第一个窗口下标
+        self.issues: List[Dict[str, Any]] = []
+
+    def feed(self, i: int, ln: str):
+        t = ln.strip()
+        if not t:
+            return
+        w = self.window
+        h = hash(t) & _MASK
+        if self.n >= w:
+            self.sig = (self.sig - self.recent[0][2] * self.high) % _MOD
+        self.sig = (self.sig * _BASE + h) % _MOD
+        self.recent.append((t, i, h))
+        if self.n < self.max_entries + w - 1:
+            self.lineno.append(i)
+            self.lhash.append(h)
+        self.n += 1
+        if self.n >= w:
+            self._check(self.n - w)
+
+    def _same(self, j: int) -> bool:
+        """历史窗口 j 与当前窗口（最近 window 行）是否相同：先比签名，再逐行比哈希"""
+        if j >= len(self.wsig) or self.wsig[j] != self.sig:
+            return False
+        return all(self.lhash[j + d] == h for d, (_, _, h) in enumerate(self.recent))
+
+    def _check(self, k: int):
+        sig = self.sig
+        if k < self.max_entries:
+            self.wsig.append(sig)
+        run = self.run
+        if run is not None:
+            if self._same(run[1] + k - run[0]):
+                run[2], run[4] = k, self.recent[-1][1]
+                return
+            self._flush()
+        j = self.sig2pos.get(sig)
+        if j is None:
+            if k < self.max_entries:
+                self.sig2pos[sig] = k
+        elif k >= self.covered and self._same(j):
+            recent = self.recent
+            self.run = [k, j, k, recent[0][1], recent[-1][1], "\n".join(t for t, _, _ in recent)]
+
+    def _flush(self):
+        if self.run is None:
+            return
+        k0, j0, k1, start, end, snippet = self.run
+        self.run = None
+        w = self.window
+        self.covered = k1 + w
+        o_start, o_end = self.lineno[j0], self.lineno[j0 + k1 - k0 + w - 1]
+        if k1 > k0:
+            snippet += "\n..."
+        self.issues.append(make_issue("SML.DUP_CODE", "low", f"疑似重复代码块（与第 {o_start}-{o_end} 行重复）", start, end, snippet))
+
+    def finish(self) -> List[Dict[str, Any]]:
+        self._flush()
+        return self.issues
+
 def long_function_detector(lines: List[str], threshold: int = 50) -> List[Dict[str, Any]]:
-    issues = []
-    in_func, start, count = False, 0, 0
+    det = LongFunctionDetector(threshold)
     for i, ln in enumerate(lines, start=1):
-        if ("def " in ln or "function " in ln or "public " in ln or "void " in ln) and "(" in ln and ")" in ln:
-            if in_func and count > threshold:
-                issues.append(make_issue("SML.LONG_FUNC", "medium", f"函数过长: {count} 行", start, i-1))
-            in_func, start, count = True, i, 1
-        elif in_func:
-            count += 1
-    if in_func and count > threshold:
-        issues.append(make_issue("SML.LONG_FUNC", "medium", f"函数过长: {count} 行", start, start+count-1))
-    return issues
+        det.feed(i, ln)
+    return det.finish()
 
 def duplicate_block_hash(lines: List[str], window: int = 6) -> List[Dict[str, Any]]:
-    import hashlib
-    sig2pos = {}
-    out = []
-    for i in range(len(lines)-window):
-        block = "\n".join(x.strip() for x in lines[i:i+window] if x.strip())
-        if not block:
-            continue
-        sig = hashlib.md5(block.encode()).hexdigest()
-        if sig in sig2pos:
-            out.append(make_issue("SML.DUP_CODE", "low", "疑似重复代码块", sig2pos[sig], i+window, block))
-        else:
-            sig2pos[sig] = i+1
-    return out
+    det = DuplicateBlockDetector(window)
+    for i, ln in enumerate(lines, start=1):
+        det.feed(i, ln)
+    return det.finish()
@@ -0,0 +1,89 @@
+from typing import Dict, Any, List, Optional, Tuple, Pattern
+from dataclasses import dataclass, replace
+import re
+from app.analyzers.common import make_issue, LongFunctionDetector, DuplicateBlockDetector
+
+# 规则集版本：新增/修改规则时递增，用于缓存失效等场景
+RULESET_VERSION = "2"
+
+@dataclass(frozen=True)
+class Rule:
+    """单行规则：字面量预过滤 + 可选正则 + 可选排除子串"""
+    rule_id: str
+    language: str
+    category: str            # issues / smells / security
+    severity: str
+    message: str
+    tokens: Tuple[str, ...]  # 预过滤字面量，行内至少出现一个才会继续匹配
+    pattern: Optional[Pattern] = None
+    exclude: Tuple[str, ...] = ()
+    ignore_case: bool = False
+
+# 语言 -> 规则列表（按注册顺序，决定同一行内的输出顺序）
+RULES: Dict[str, List[Rule]] = {}
+# 语言 -> 坏味道检测参数
+SMELL_OPTIONS: Dict[str, Dict[str, int]] = {}
+_ENGINES: Dict[str, "RuleEngine"] = {}
+
+def register_rule(rule: Rule) -> Rule:
+    if rule.ignore_case:
+        rule = replace(rule, tokens=tuple(t.lower() for t in rule.tokens))
+    RULES.setdefault(rule.language, []).append(rule)
+    _ENGINES.pop(rule.language, None)
+    return rule
+
+def register_smells(language: str, long_func_threshold: int, dup_window: int = 6):
+    SMELL_OPTIONS[language] = {"long_func_threshold": long_func_threshold, "dup_window": dup_window}
+    _ENGINES.pop(language, None)
+
+class RuleEngine:
+    """把某语言的全部规则编译为一次逐行扫描"""
+
+    def __init__(self, language: str):
+        self.language = language
+        self.rules = list(RULES.get(language, []))
+        self.options = SMELL_OPTIONS.get(language, {"long_func_threshold": 50, "dup_window": 6})
+        self.has_ci = any(r.ignore_case for r in self.rules)
+        # 多字面量预过滤：一次 search 判断该行是否可能命中任意规则
+        alts = []
+        for r in self.rules:
+            for t in r.tokens:
+                alts.append(("(?i:%s)" if r.ignore_case else "%s") % re.escape(t))
+        self.prefilter = re.compile("|".join(alts)) if alts else None
+
+    def run(self, code: str, detect_duplicates: bool = True) -> Dict[str, Any]:
+        """detect_duplicates=False 时跳过重复块检测（按函数单元分别分析时，由调用方对整文件单独检测）"""
+        out: Dict[str, List[dict]] = {"issues": [], "smells": [], "security": []}
+        long_func = LongFunctionDetector(self.options["long_func_threshold"])
+        dup = DuplicateBlockDetector(self.options["dup_window"]) if detect_duplicates else None
+        prefilter, rules, has_ci = self.prefilter, self.rules, self.has_ci
+
+        for i, ln in enumerate(code.splitlines(), start=1):
+            long_func.feed(i, ln)
+            if dup is not None:
+                dup.feed(i, ln)
+            if prefilter is None or prefilter.search(ln) is None:
+                continue
+            lowered = ln.lower() if has_ci else ln
+            for r in rules:
+                hay = lowered if r.ignore_case else ln
+                for t in r.tokens:
+                    if t in hay:
+                        break
+                else:
+                    continue
+                if r.exclude and any(x in ln for x in r.exclude):
+                    continue
+                if r.pattern is None or r.pattern.search(ln) is not None:
+                    out[r.category].append(make_issue(r.rule_id, r.severity, r.message, i, i, ln.strip()))
+
+        out["smells"] += long_func.finish()
+        if dup is not None:
+            out["smells"] += dup.finish()
+        return out
+
+def get_engine(language: str) -> RuleEngine:
+    eng = _ENGINES.get(language)
+    if eng is None:
+        eng = _ENGINES[language] = RuleEngine(language)
+    return eng
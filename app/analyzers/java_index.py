@@ -0,0 +1,224 @@
+from typing import List, Optional, Set, Tuple
+from array import array
+from bisect import bisect_right
+import re
+
+# 单遍词法扫描只产出结构相关的记号，普通标识符/数字/其余运算符由 finditer 直接跳过；
+# 行首的前瞻让空白等无关字符快速失败，标识符类记号要求不在单词中间开始
+TOKEN = re.compile(r"""
+  (?=[/"'@\w${}();+])
+  (?:
+    (?P<lc>//[^\n]*)
+  | (?P<bc>/\*.*?(?:\*/|\Z))
+  | (?P<tb>\"\"\"[\s\S]*?(?:\"\"\"|\Z))
+  | (?P<str>"(?:\\.|[^"\\\n])*"?)
+  | (?P<chr>'(?:\\.|[^'\\\n])+'?)
+  | (?P<anno>@(?!interface\b)\s*[A-Za-z_$][\w$.]*(?P<aparen>\s*\()?)
+  | (?P<decl>\b(?:class|interface|enum|record)\s+(?P<tname>[A-Za-z_$][\w$]*))
+  | (?P<tryp>\btry\s*\()
+  | (?P<new>\bnew\s+(?P<ntype>[A-Za-z_$][\w$.]*)\s*(?=[(<]))
+  | (?P<stype>\b(?:Prepared)?Statement\b)
+  | (?P<call>(?<![\w$])(?P<cname>[A-Za-z_$][\w$]*)\s*\()
+  | (?P<assign>(?<![\w$])(?P<aname>[A-Za-z_$][\w$]*)\s*(?P<aop>\+?=)(?!=))
+  | (?P<op>[{}();+])
+  )
+""", re.S | re.X)
+
+SQL_KEYWORDS = re.compile(r"\b(SELECT|UPDATE|DELETE|INSERT)\b", re.I)
+EXEC_CALLS = {"execute", "executeQuery", "executeUpdate", "executeLargeUpdate", "addBatch", "prepareStatement", "prepareCall"}
+RESOURCE_TYPES = {"FileInputStream", "FileOutputStream", "FileReader", "FileWriter", "BufferedReader", "BufferedWriter", "Scanner", "RandomAccessFile"}
+FIRST_ARG = re.compile(r"\s*([A-Za-z_$][\w$]*)\s*[,)]")
+NON_METHOD_CALLS = {"if", "for", "while", "switch", "catch", "synchronized", "return", "new", "throw", "super", "this"}
+
+CLASS, METHOD, BLOCK = 0, 1, 2
+
+class JavaIndex:
+    """Java 源码结构索引：类、方法、try-with-resources 的行/偏移数组，以及规则所需的命中点"""
+
+    def __init__(self, code: str):
+        self.code = code
+        self.line_starts = array("l", [0])
+        pos = code.find("\n")
+        while pos != -1:
+            self.line_starts.append(pos + 1)
+            pos = code.find("\n", pos + 1)
+        # 结构：均为 1-based 行号
+        self.class_names: List[str] = []
+        self.class_start = array("l")
+        self.class_end = array("l")
+        self.method_names: List[str] = []
+        self.method_start = array("l")   # 声明起始行（含注解/修饰符）
+        self.method_end = array("l")
+        self.try_res_start = array("l")  # try ( ... ) 资源声明的字符偏移区间
+        self.try_res_end = array("l")
+        self.comment_spans = array("l")  # 注释的 [start, end) 偏移，成对存放
+        # 规则命中点：(行号, 附加信息)
+        self.resource_news: List[Tuple[int, str, bool]] = []  # (行号, 类型, 是否在 try 资源声明内)
+        self.sql_concat: List[Tuple[int, int]] = []           # (语句起始行, 语句结束行)
+        self._scan()
+
+    def line_of(self, offset: int) -> int:
+        return bisect_right(self.line_starts, offset)
+
+    def _scan(self):
+        code = self.code
+        line_of = self.line_of
+        frames: List[Tuple[int, int, str, List[str], Set[str]]] = []  # (类型, 起始行, 名称, 外层圆括号栈, 外层污点集合)
+        parens: List[str] = []         # 当前花括号层内的圆括号用途：try / sig / anno / other
+        pending_class: Optional[str] = None
+        sig_name: Optional[str] = None  # 类体中的 name(...)，等待 { 判定为方法
+        decl_start = -1                 # 当前声明/语句首个记号的偏移
+        tainted: Set[str] = set()       # 由 SQL 拼接赋值得到的变量（按方法）
+        # 当前语句状态
+        st_concat = st_exec = st_stype = st_taint_arg = False
+        st_target: Optional[str] = None
+        prev_sql_str = prev_plus = False
+
+        def kind_top() -> int:
+            return frames[-1][0] if frames else CLASS
+
+        def end_statement(end_off: int):
+            nonlocal st_concat, st_exec, st_stype, st_taint_arg, st_target, decl_start
+            if decl_start >= 0:
+                if (st_concat and (st_exec or st_stype)) or (st_exec and st_taint_arg):
+                    self.sql_concat.append((line_of(decl_start), line_of(max(end_off - 1, decl_start))))
+                if st_concat and st_target:
+                    tainted.add(st_target)
+                elif st_target:
+                    tainted.discard(st_target)
+            st_concat = st_exec = st_stype = st_taint_arg = False
+            st_target = None
+            decl_start = -1
+
+        for m in TOKEN.finditer(code):
+            kind = m.lastgroup
+            start = m.start()
+            if kind == "lc" or kind == "bc":
+                self.comment_spans.append(start)
+                self.comment_spans.append(m.end())
+                continue
+            if decl_start < 0 and (kind != "op" or m.group() == "("):
+                decl_start = start
+
+            if kind == "str" or kind == "tb":
+                is_sql = SQL_KEYWORDS.search(m.group()) is not None
+                if is_sql and prev_plus:
+                    st_concat = True
+                prev_sql_str, prev_plus = is_sql, False
+                continue
+            if kind == "op":
+                ch = m.group()
+                if ch == "+":
+                    if prev_sql_str:
+                        st_concat = True
+                    prev_plus, prev_sql_str = True, False
+                    continue
+                prev_plus = prev_sql_str = False
+                if ch == "(":
+                    parens.append("other")
+                elif ch == ")":
+                    if parens and parens.pop() == "try":
+                        self.try_res_end.append(m.end())
+                elif ch == ";":
+                    if not parens:
+                        sig_name = None
+                        end_statement(m.end())
+                elif ch == "{":
+                    head = line_of(decl_start if decl_start >= 0 else start)
+                    if pending_class is not None:
+                        frames.append((CLASS, head, pending_class, parens, tainted))
+                        pending_class = None
+                    elif kind_top() == CLASS and sig_name is not None and not parens:
+                        frames.append((METHOD, head, sig_name, parens, tainted))
+                        tainted = set()
+                    else:
+                        frames.append((BLOCK, 0, "", parens, tainted))
+                    sig_name = None
+                    end_statement(start)
+                    # 花括号内（如 lambda / 匿名类体）重新计圆括号深度
+                    parens = []
+                elif ch == "}":
+                    end_statement(start)
+                    sig_name = None
+                    if frames:
+                        fkind, fline, fname, parens, outer_taint = frames.pop()
+                        end_line = line_of(start)
+                        if fkind == CLASS:
+                            self.class_names.append(fname)
+                            self.class_start.append(fline)
+                            self.class_end.append(end_line)
+                        elif fkind == METHOD:
+                            self.method_names.append(fname)
+                            self.method_start.append(fline)
+                            self.method_end.append(end_line)
+                            tainted = outer_taint
+                continue
+
+            prev_plus = prev_sql_str = False
+            if kind == "anno":
+                if m.group("aparen"):
+                    parens.append("anno")
+            elif kind == "decl":
+                pending_class = m.group("tname")
+            elif kind == "tryp":
+                parens.append("try")
+                self.try_res_start.append(m.end() - 1)
+            elif kind == "new":
+                ntype = m.group("ntype").rsplit(".", 1)[-1]
+                if ntype in RESOURCE_TYPES:
+                    self.resource_news.append((line_of(start), ntype, "try" in parens))
+            elif kind == "stype":
+                st_stype = True
+            elif kind == "call":
+                name = m.group("cname")
+                if kind_top() == CLASS and not parens and name not in NON_METHOD_CALLS:
+                    parens.append("sig")
+                    sig_name = name
+                else:
+                    parens.append("other")
+                    if name in EXEC_CALLS:
+                        st_exec = True
+                        arg = FIRST_ARG.match(code, m.end())
+                        if arg and arg.group(1) in tainted:
+                            st_taint_arg = True
+            elif kind == "assign":
+                if st_target is None and not parens:
+                    st_target = m.group("aname")
+                if m.group("aop") == "+=" and st_target in tainted:
+                    st_concat = True
+
+        # 未闭合的类/方法（代码被截断）按文件末尾结束
+        last = len(self.line_starts)
+        while frames:
+            fkind, fline, fname, _, _ = frames.pop()
+            if fkind == CLASS:
+                self.class_names.append(fname)
+                self.class_start.append(fline)
+                self.class_end.append(last)
+            elif fkind == METHOD:
+                self.method_names.append(fname)
+                self.method_start.append(fline)
+                self.method_end.append(last)
+
+    def methods(self) -> List[Tuple[str, int, int]]:
+        """按起始行排序的 (名称, 起始行, 结束行)"""
+        return sorted(zip(self.method_names, self.method_start, self.method_end), key=lambda x: x[1])
+
+    def classes(self) -> List[Tuple[str, int, int]]:
+        return sorted(zip(self.class_names, self.class_start, self.class_end), key=lambda x: x[1])
+
+    def code_lines(self) -> List[str]:
+        """去掉注释后的源码行（行号不变），供重复块等按行检测复用"""
+        if not self.comment_spans:
+            return self.code.splitlines()
+        parts, pos, code, spans = [], 0, self.code, self.comment_spans
+        for k in range(0, len(spans), 2):
+            a, b = spans[k], spans[k + 1]
+            parts.append(code[pos:a])
+            parts.append("\n" * code.count("\n", a, b))
+            pos = b
+        parts.append(code[pos:])
+        return "".join(parts).splitlines()
+
+def build_index(code: str) -> JavaIndex:
+    return JavaIndex(code)
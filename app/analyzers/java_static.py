@@ -1,29 +1,41 @@
 from typing import Dict, Any, List
-import re
-from app.analyzers.common import make_issue, long_function_detector, duplicate_block_hash
+from app.analyzers.common import make_issue, duplicate_block_hash
+from app.analyzers.engine import register_smells, SMELL_OPTIONS
+from app.analyzers.java_index import JavaIndex, build_index
 
-RESOURCE = re.compile(r"new\s+(FileInputStream|BufferedReader|Scanner)\(")
-SQL_PLUS = re.compile(r"(Statement|PreparedStatement)\s+.*=\s*.*\+.*;")
+# 坏味道
+register_smells("java", long_func_threshold=60, dup_window=6)
 
-def analyze_java(code: str) -> Dict[str, Any]:
-    lines = code.splitlines()
+def _snippet(lines: List[str], i: int) -> str:
+    return lines[i - 1].strip() if 0 < i <= len(lines) else ""
 
-    issues: List[dict] = []
-    smells: List[dict] = []
-    security: List[dict] = []
+def analyze_index(idx: JavaIndex, detect_duplicates: bool = True) -> Dict[str, Any]:
+    """在结构索引上执行全部 Java 规则（注释、字符串内的文本不会误报）"""
+    opts = SMELL_OPTIONS["java"]
+    lines = idx.code.splitlines()
+    out: Dict[str, List[dict]] = {"issues": [], "smells": [], "security": []}
 
-    # 资源未关闭
-    for i, ln in enumerate(lines, start=1):
-        if RESOURCE.search(ln) and "try (" not in ln:
-            issues.append(make_issue("BUG.RES_NOT_CLOSED", "medium", "资源可能未关闭，建议使用 try-with-resources", i, i, ln.strip()))
+    # 资源未关闭：资源创建不在任何 try ( ... ) 资源声明内（支持资源声明跨多行）
+    for line, _, in_try in idx.resource_news:
+        if not in_try:
+            out["issues"].append(make_issue("BUG.RES_NOT_CLOSED", "medium", "资源可能未关闭，建议使用 try-with-resources",
+                                            line, line, _snippet(lines, line)))
 
-    # 坏味道
-    smells += long_function_detector(lines, threshold=60)
-    smells += duplicate_block_hash(lines, window=6)
+    # SQL 字符串拼接：拼接语句本身执行/声明 Statement，或拼接结果的变量随后被 execute*/prepareStatement 使用
+    for start, end in idx.sql_concat:
+        out["security"].append(make_issue("SEC.SQLI", "high", "SQL 语句字符串拼接，建议使用参数化 PreparedStatement",
+                                          start, end, _snippet(lines, start)))
 
-    # SQL 字符串拼接
-    for i, ln in enumerate(lines, start=1):
-        if SQL_PLUS.search(ln):
-            security.append(make_issue("SEC.SQLI", "high", "SQL 语句字符串拼接，建议使用参数化 PreparedStatement", i, i, ln.strip()))
+    # 过长方法：按真实方法跨度（花括号配对）计算
+    for _, start, end in idx.methods():
+        length = end - start + 1
+        if length > opts["long_func_threshold"]:
+            out["smells"].append(make_issue("SML.LONG_FUNC", "medium", f"函数过长: {length} 行", start, end))
 
-    return {"issues": issues, "smells": smells, "security": security}
+    # 重复块：复用索引去掉注释后的行，注释差异不影响判定
+    if detect_duplicates:
+        out["smells"] += duplicate_block_hash(idx.code_lines(), window=opts["dup_window"])
+    return out
+
+def analyze_java(code: str, detect_duplicates: bool = True) -> Dict[str, Any]:
+    return analyze_index(build_index(code), detect_duplicates=detect_duplicates)
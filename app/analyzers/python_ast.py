@@ -0,0 +1,178 @@
+from typing import Dict, Any, List, Set
+import ast
+import re
+from app.analyzers.common import make_issue, duplicate_block_hash
+from app.analyzers.engine import SMELL_OPTIONS
+from app.analyzers.python_static import analyze_python
+
+SQL_KEYWORDS = re.compile(r"\b(SELECT|UPDATE|DELETE|INSERT)\b", re.I)
+WEAK_RNG_FUNCS = {"random", "randint", "choice", "randrange", "uniform", "sample", "shuffle"}
+SQL_EXEC_FUNCS = {"execute", "executemany", "executescript", "raw"}
+CMD_FUNCS = {("os", "system"), ("os", "popen")}
+SUBPROCESS_FUNCS = {"run", "call", "check_call", "check_output", "Popen"}
+
+COMPLEXITY_THRESHOLD = 10
+PARAMS_THRESHOLD = 5
+
+def _is_dynamic_str(node: ast.AST) -> bool:
+    """字符串拼接 / f-string / % 格式化 / .format()"""
+    if isinstance(node, ast.JoinedStr):
+        return any(isinstance(v, ast.FormattedValue) for v in node.values)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Mod)):
+        return True
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "format"
+
+def _has_sql_literal(node: ast.AST) -> bool:
+    for n in ast.walk(node):
+        if isinstance(n, ast.Constant) and isinstance(n.value, str) and SQL_KEYWORDS.search(n.value):
+            return True
+    return False
+
+class _Visitor(ast.NodeVisitor):
+    """一次遍历计算全部 Python 规则、函数跨度、圈复杂度与参数个数"""
+
+    def __init__(self, lines: List[str], long_threshold: int):
+        self.lines = lines
+        self.long_threshold = long_threshold
+        self.issues: List[dict] = []
+        self.smells: List[dict] = []
+        self.security: List[dict] = []
+        self.with_items: Set[int] = set()      # 作为 with 上下文表达式的节点 id
+        # 模块名默认按惯用名识别（按函数单元分析时看不到 import），再补充 import 别名
+        self.random_names: Set[str] = {"random"}
+        self.rng_funcs: Set[str] = set()       # from random import randint 等
+        self.os_names: Set[str] = {"os"}
+        self.subprocess_names: Set[str] = {"subprocess"}
+        self.sql_vars: List[Set[str]] = [set()]  # 按作用域记录由 SQL 字符串拼接得到的变量
+        self.complexity: List[int] = []
+
+    def _snippet(self, node: ast.AST) -> str:
+        return self.lines[node.lineno - 1].strip() if 0 < node.lineno <= len(self.lines) else ""
+
+    def _add(self, bucket: List[dict], rule: str, sev: str, msg: str, node: ast.AST):
+        bucket.append(make_issue(rule, sev, msg, node.lineno, node.lineno, self._snippet(node)))
+
+    # 导入别名
+    def visit_Import(self, node: ast.Import):
+        for a in node.names:
+            name = a.asname or a.name
+            if a.name == "random":
+                self.random_names.add(name)
+            elif a.name == "os":
+                self.os_names.add(name)
+            elif a.name == "subprocess":
+                self.subprocess_names.add(name)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        if node.module == "random":
+            self.rng_funcs.update(a.asname or a.name for a in node.names if a.name in WEAK_RNG_FUNCS)
+
+    # 作用域与函数度量
+    def _visit_func(self, node):
+        end = getattr(node, "end_lineno", node.lineno)
+        length = end - node.lineno + 1
+        if length > self.long_threshold:
+            self.smells.append(make_issue("SML.LONG_FUNC", "medium", f"函数过长: {length} 行", node.lineno, end))
+        args = node.args
+        params = [a.arg for a in args.posonlyargs + args.args + args.kwonlyargs if a.arg not in ("self", "cls")]
+        if args.vararg:
+            params.append(args.vararg.arg)
+        if args.kwarg:
+            params.append(args.kwarg.arg)
+        if len(params) > PARAMS_THRESHOLD:
+            self.smells.append(make_issue("SML.TOO_MANY_PARAMS", "low", f"参数过多: {len(params)} 个（{node.name}）", node.lineno, node.lineno, self._snippet(node)))
+
+        self.complexity.append(1)
+        self.sql_vars.append(set())
+        self.generic_visit(node)
+        self.sql_vars.pop()
+        cc = self.complexity.pop()
+        if cc > COMPLEXITY_THRESHOLD:
+            self.smells.append(make_issue("SML.COMPLEX_FUNC", "medium", f"圈复杂度过高: {cc}（{node.name}）", node.lineno, end, self._snippet(node)))
+
+    visit_FunctionDef = _visit_func
+    visit_AsyncFunctionDef = _visit_func
+
+    def _branch(self, node, n: int = 1):
+        if self.complexity:
+            self.complexity[-1] += n
+        self.generic_visit(node)
+
+    def visit_If(self, node): self._branch(node)
+    def visit_For(self, node): self._branch(node)
+    def visit_AsyncFor(self, node): self._branch(node)
+    def visit_While(self, node): self._branch(node)
+    def visit_ExceptHandler(self, node): self._branch(node)
+    def visit_IfExp(self, node): self._branch(node)
+    def visit_comprehension(self, node): self._branch(node, 1 + len(node.ifs))
+    def visit_BoolOp(self, node): self._branch(node, len(node.values) - 1)
+    def visit_Assert(self, node): self._branch(node)
+
+    def visit_match_case(self, node):
+        self._branch(node)
+
+    # with 上下文
+    def _visit_with(self, node):
+        for item in node.items:
+            self.with_items.add(id(item.context_expr))
+        self.generic_visit(node)
+
+    visit_With = _visit_with
+    visit_AsyncWith = _visit_with
+
+    # SQL 拼接的简单数据流：sql = "SELECT ..." + x; cur.execute(sql)
+    def visit_Assign(self, node: ast.Assign):
+        tainted = _is_dynamic_str(node.value) and _has_sql_literal(node.value)
+        for t in node.targets:
+            if isinstance(t, ast.Name):
+                if tainted:
+                    self.sql_vars[-1].add(t.id)
+                else:
+                    self.sql_vars[-1].discard(t.id)
+        self.generic_visit(node)
+
+    def _is_sql_arg(self, arg: ast.AST) -> bool:
+        if _is_dynamic_str(arg) and _has_sql_literal(arg):
+            return True
+        return isinstance(arg, ast.Name) and arg.id in self.sql_vars[-1]
+
+    def visit_Call(self, node: ast.Call):
+        f = node.func
+        if isinstance(f, ast.Name):
+            if f.id == "open" and id(node) not in self.with_items:
+                self._add(self.issues, "BUG.FILE_NOT_CLOSED", "medium", "文件打开未使用 with 上下文管理，可能导致资源泄露", node)
+            elif f.id in self.rng_funcs:
+                self._add(self.security, "SEC.WEAK_RNG", "low", "安全用途请改用 secrets 模块生成随机数", node)
+        elif isinstance(f, ast.Attribute):
+            owner = f.value.id if isinstance(f.value, ast.Name) else None
+            if f.attr in SQL_EXEC_FUNCS and node.args and self._is_sql_arg(node.args[0]):
+                self._add(self.security, "SEC.SQLI", "high", "可能的字符串拼接 SQL 注入风险，建议使用参数化查询", node)
+            elif owner in self.os_names and ("os", f.attr) in CMD_FUNCS and node.args and not isinstance(node.args[0], ast.Constant):
+                self._add(self.security, "SEC.CMD_INJECT", "high", "可能的命令注入风险，避免字符串拼接系统命令", node)
+            elif owner in self.subprocess_names and f.attr in SUBPROCESS_FUNCS and node.args \
+                    and not isinstance(node.args[0], (ast.Constant, ast.List, ast.Tuple)) \
+                    and any(k.arg == "shell" and isinstance(k.value, ast.Constant) and k.value.value is True for k in node.keywords):
+                self._add(self.security, "SEC.CMD_INJECT", "high", "可能的命令注入风险，避免 shell=True 拼接系统命令", node)
+            elif owner in self.random_names and f.attr in WEAK_RNG_FUNCS:
+                self._add(self.security, "SEC.WEAK_RNG", "low", "安全用途请改用 secrets 模块生成随机数", node)
+        self.generic_visit(node)
+
+def analyze_python_ast(code: str, detect_duplicates: bool = True) -> Dict[str, Any]:
+    """基于 ast 的 Python 分析：一次 NodeVisitor 遍历；语法错误时回退到逐行规则"""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        out = analyze_python(code)
+        if not detect_duplicates:
+            out["smells"] = [x for x in out["smells"] if x["rule_id"] != "SML.DUP_CODE"]
+        return out
+
+    opts = SMELL_OPTIONS.get("python", {"long_func_threshold": 50, "dup_window": 6})
+    lines = code.splitlines()
+    v = _Visitor(lines, opts["long_func_threshold"])
+    v.visit(tree)
+    by_line = lambda x: (x["start_line"] or 0, x["rule_id"])
+    smells = sorted(v.smells, key=by_line)
+    if detect_duplicates:
+        smells += duplicate_block_hash(lines, window=opts["dup_window"])
+    return {"issues": sorted(v.issues, key=by_line), "smells": smells, "security": sorted(v.security, key=by_line)}
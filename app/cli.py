@@ -0,0 +1,229 @@
+"""仓库级扫描：不启动服务，直接对目录树运行本地规则，结果以 SARIF 或 NDJSON 流式输出（CI 使用）。
+
+    python -m app.cli scan .                                  # SARIF 输出到 stdout
+    python -m app.cli scan src --format ndjson -o out.ndjson --exclude "tests/**"
+    python -m app.cli scan . -o report.sarif --fail-on high   # 存在 high 级别发现时退出码 1
+
+按扩展名识别语言（.py / .java），文件在进程池中读取（大文件用 mmap）并分析；
+按文件内容哈希缓存结果（--cache，默认 .cache/scan.db），未改动的文件直接复用。
+吞吐报告（文件/秒、行/秒、缓存命中）写到 stderr。
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import mmap
+import os
+import sys
+import time
+from multiprocessing import Pool
+from typing import Any, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from app.services.batch import detect_language, BATCH_MAX_FILE_BYTES
+from app.services.cache import SqliteStore
+from app.services.executor import run_local, RULESET_TAG, ANALYSIS_WORKERS
+
+DEFAULT_EXCLUDES = (".git/**", "**/.git/**", "**/node_modules/**", "**/__pycache__/**", "**/.venv/**",
+                    "**/venv/**", "**/build/**", "**/target/**", "**/.cache/**")
+MMAP_MIN_BYTES = 1 << 20
+CACHE_TTL = 30 * 86400
+SEVERITY_ORDER = {"low": 0, "medium": 1, "high": 2}
+SARIF_LEVELS = {"high": "error", "medium": "warning", "low": "note"}
+CATEGORIES = ("issues", "smells", "security")
+
+def _match(rel: str, patterns: Sequence[str]) -> bool:
+    # "**/x/**" 也应匹配顶层的 "x/..."
+    return any(fnmatch.fnmatch(rel, p) or (p.startswith("**/") and fnmatch.fnmatch(rel, p[3:])) for p in patterns)
+
+def walk(root: str, include: Sequence[str], exclude: Sequence[str], max_bytes: int) -> Iterator[Tuple[str, str, str]]:
+    """产出 (绝对路径, 相对路径, 语言)；相对路径统一为 / 分隔，排除的目录不再下探"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root).replace(os.sep, "/")
+        rel_dir = "" if rel_dir == "." else rel_dir + "/"
+        dirnames[:] = sorted(d for d in dirnames if not _match(rel_dir + d + "/", exclude))
+        for name in sorted(filenames):
+            lang = detect_language(name)
+            if lang is None:
+                continue
+            rel = rel_dir + name
+            if (include and not _match(rel, include)) or _match(rel, exclude):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                if os.path.getsize(path) > max_bytes:
+                    continue
+            except OSError:
+                continue
+            yield path, rel, lang
+
+def read_file(path: str) -> bytes:
+    """一次性读入；大文件经 mmap 映射后整体拷贝，避免缓冲读的多次系统调用"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_MIN_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[:]
+        return f.read()
+
+def cache_key(lang: str, digest: str) -> str:
+    return f"{RULESET_TAG}:{lang}:{digest}"
+
+_worker_cache: Optional[SqliteStore] = None
+
+def _init_worker(cache_path: Optional[str]):
+    global _worker_cache
+    _worker_cache = SqliteStore(cache_path, CACHE_TTL) if cache_path else None
+
+def scan_file(item: Tuple[str, str, str]) -> Dict[str, Any]:
+    """读取、哈希、查缓存、分析单个文件（在工作进程中执行）"""
+    path, rel, lang = item
+    row: Dict[str, Any] = {"path": rel, "language": lang}
+    try:
+        data = read_file(path)
+    except OSError as e:
+        row["error"] = str(e)
+        return row
+    digest = hashlib.sha256(data).hexdigest()
+    code = data.decode("utf-8", errors="replace")
+    row.update(sha256=digest, lines=code.count("\n") + 1)
+    raw = _worker_cache.get(cache_key(lang, digest)) if _worker_cache is not None else None
+    if raw is not None:
+        row.update(cached=True, result=json.loads(raw))
+        return row
+    try:
+        result = run_local(lang, code)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        return row
+    row.update(cached=False, result={k: result.get(k, []) for k in CATEGORIES})
+    return row
+
+def scan(root: str, include: Sequence[str], exclude: Sequence[str], workers: int,
+         cache_path: Optional[str], max_bytes: int) -> Iterator[Dict[str, Any]]:
+    """按完成顺序产出每个文件的结果；新结果由主进程写入缓存（单写者）"""
+    items = walk(root, include, exclude, max_bytes)
+    store = SqliteStore(cache_path, CACHE_TTL) if cache_path else None
+    if workers <= 0:
+        _init_worker(cache_path)
+        rows = map(scan_file, items)
+        pool = None
+    else:
+        pool = Pool(workers, initializer=_init_worker, initargs=(cache_path,))
+        rows = pool.imap_unordered(scan_file, items, chunksize=8)
+    try:
+        for row in rows:
+            if store is not None and row.get("cached") is False:
+                store.set(cache_key(row["language"], row["sha256"]), json.dumps(row["result"], ensure_ascii=False))
+            yield row
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+class NdjsonWriter:
+    def __init__(self, out: TextIO):
+        self.out = out
+
+    def file(self, row: Dict[str, Any]):
+        self.out.write(json.dumps({"type": "file", **row}, ensure_ascii=False) + "\n")
+
+    def close(self, summary: Dict[str, Any]):
+        self.out.write(json.dumps({"type": "summary", **summary}, ensure_ascii=False) + "\n")
+
+class SarifWriter:
+    """SARIF 2.1.0，边扫描边写 results；规则表在结尾写出（JSON 对象内字段顺序无关）"""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self.rules: Dict[str, Dict[str, Any]] = {}
+        self.first = True
+        out.write('{"$schema": "https://json.schemastore.org/sarif-2.1.0.json", "version": "2.1.0", '
+                  '"runs": [{"results": [')
+
+    def file(self, row: Dict[str, Any]):
+        for category in CATEGORIES:
+            for f in (row.get("result") or {}).get(category, []):
+                rule_id = f.get("rule_id") or "UNKNOWN"
+                severity = f.get("severity") or "low"
+                if rule_id not in self.rules:
+                    self.rules[rule_id] = {"id": rule_id, "properties": {"category": category},
+                                           "defaultConfiguration": {"level": SARIF_LEVELS.get(severity, "note")}}
+                region = {"startLine": f.get("start_line") or 1}
+                if f.get("end_line"):
+                    region["endLine"] = max(f["end_line"], region["startLine"])
+                if f.get("snippet"):
+                    region["snippet"] = {"text": f["snippet"]}
+                result = {
+                    "ruleId": rule_id,
+                    "level": SARIF_LEVELS.get(severity, "note"),
+                    "message": {"text": f.get("message") or rule_id},
+                    "locations": [{"physicalLocation": {"artifactLocation": {"uri": row["path"]}, "region": region}}],
+                    "properties": {"category": category, "severity": severity},
+                }
+                self.out.write(("" if self.first else ",\n") + json.dumps(result, ensure_ascii=False))
+                self.first = False
+
+    def close(self, summary: Dict[str, Any]):
+        tool = {"driver": {"name": "SmartCodeReview", "version": RULESET_TAG, "rules": list(self.rules.values())}}
+        invocation = {"executionSuccessful": summary["errors"] == 0, "properties": summary}
+        self.out.write("], " + f'"tool": {json.dumps(tool, ensure_ascii=False)}, '
+                       f'"invocations": [{json.dumps(invocation, ensure_ascii=False)}]' + "}]}\n")
+
+def _parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    p = argparse.ArgumentParser(prog="python -m app.cli", description="Smart Code Review 本地规则扫描")
+    sub = p.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("scan", help="扫描目录树")
+    s.add_argument("root", nargs="?", default=".")
+    s.add_argument("--format", choices=("sarif", "ndjson"), default="sarif")
+    s.add_argument("-o", "--output", help="输出文件，默认 stdout")
+    s.add_argument("--include", action="append", default=[], help="只扫描匹配的相对路径（glob，可重复）")
+    s.add_argument("--exclude", action="append", default=[], help="跳过匹配的相对路径（glob，可重复）")
+    s.add_argument("--no-default-excludes", action="store_true", help="不跳过 .git/node_modules/venv/build 等目录")
+    s.add_argument("--workers", type=int, default=ANALYSIS_WORKERS, help="分析进程数，0 为在主进程内执行")
+    s.add_argument("--cache", default=".cache/scan.db", help="结果缓存（SQLite）路径")
+    s.add_argument("--no-cache", action="store_true")
+    s.add_argument("--max-bytes", type=int, default=BATCH_MAX_FILE_BYTES, help="跳过超过该大小的文件")
+    s.add_argument("--fail-on", choices=("low", "medium", "high"), help="存在该级别及以上的发现时退出码 1")
+    return p.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _parse_args(argv)
+    exclude = list(args.exclude) + ([] if args.no_default_excludes else list(DEFAULT_EXCLUDES))
+    cache_path = None if args.no_cache else args.cache
+    if cache_path and os.path.dirname(cache_path):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    writer = SarifWriter(out) if args.format == "sarif" else NdjsonWriter(out)
+    threshold = SEVERITY_ORDER[args.fail_on] if args.fail_on else None
+
+    started = time.perf_counter()
+    files = lines = cached = errors = findings = 0
+    worst = -1
+    try:
+        for row in scan(args.root, args.include, exclude, args.workers, cache_path, args.max_bytes):
+            files += 1
+            if "error" in row:
+                errors += 1
+            lines += row.get("lines", 0)
+            cached += bool(row.get("cached"))
+            for category in CATEGORIES:
+                for f in (row.get("result") or {}).get(category, []):
+                    findings += 1
+                    worst = max(worst, SEVERITY_ORDER.get(f.get("severity"), 0))
+            writer.file(row)
+        elapsed = time.perf_counter() - started
+        summary = {"files": files, "lines": lines, "cached": cached, "errors": errors, "findings": findings,
+                   "seconds": round(elapsed, 3),
+                   "files_per_second": round(files / elapsed, 1) if elapsed > 0 else 0.0,
+                   "lines_per_second": round(lines / elapsed, 1) if elapsed > 0 else 0.0}
+        writer.close(summary)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"scanned {files} files / {lines} lines in {summary['seconds']}s "
+          f"({summary['files_per_second']} files/s, {summary['lines_per_second']} lines/s), "
+          f"{cached} cached, {findings} findings, {errors} errors", file=sys.stderr)
+    return 1 if threshold is not None and worst >= threshold else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,47 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Literal
+import json
+import time
+import asyncio
 
-from app.analyzers.python_static import analyze_python
-from app.analyzers.java_static import analyze_java
-from app.services.llm import llm_review
+from app.prompt.prompts import PROMPT_VERSION
+from app.services.llm import llm_review, llm_review_stream, backends_tag, PROVIDER
+from app.services.cache import result_cache, make_key
+from app.services import http_pool, metrics
+from app.services.metrics import stage, start_request, REQUESTS, INPUT_BYTES, CACHE_LOOKUPS, LLM_FAILURES
+from app.services.report import build_report, dumps, shape_snippets
+from app.services.compression import CompressionMiddleware
+from app.analyzers.common import finding_key
+from app.services.governor import ProviderUnavailable, governor_stats
+from app.services.executor import run_cpu, run_local, shutdown_executor, RULESET_TAG
+from app.services.incremental import incremental_analyze
+from app.services.clone_index import clone_index, clone_scan
+from app.services.jobs import JobQueue, QueueFull, CallbackRejected, check_callback_url, job_store, public_view
+from app.services.batch import read_archive, detect_language, BatchSummary, BATCH_MAX_FILES, BATCH_LLM_CONCURRENCY
 
-app = FastAPI(title="Smart Code Review Assistant", version="0.1.0")
+job_queue: Optional[JobQueue] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 应用级 HTTP 连接池：启动时创建，关闭时释放；分析工作池在关闭时一并释放
+    global job_queue
+    http_pool.get_pool()
+    if job_store is not None:
+        # 上次未完成的任务在此重新排队
+        job_queue = JobQueue(job_store, _run_job)
+        await job_queue.start()
+    yield
+    if job_queue is not None:
+        await job_queue.stop()
+        job_queue = None
+    await http_pool.close_pool()
+    shutdown_executor()
+
+app = FastAPI(title="Smart Code Review Assistant", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,11 +50,21 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 按 Accept-Encoding 压缩响应（gzip/br），并解压带 Content-Encoding 的请求体
+app.add_middleware(CompressionMiddleware)
+
+SnippetMode = Literal["full", "table", "none"]
 
 class AnalyzeRequest(BaseModel):
     language: str = Field(..., description="python 或 java")
     code: str = Field(..., description="待分析代码")
     enable_llm: bool = True
+    incremental: bool = Field(False, description="按函数单元增量分析，复用未改动单元的缓存结果")
+    base_code: Optional[str] = Field(None, description="上一版本代码（可选，提供时隐含 incremental）")
+    diff: Optional[str] = Field(None, description="相对上一版本的 unified diff（可选，提供时隐含 incremental）")
+    timings: bool = Field(False, description="在 meta.timings 中返回各阶段耗时（毫秒）")
+    path: Optional[str] = Field(None, description="文件路径（可选）；启用克隆索引时用于登记本文件并排除自身")
+    snippets: SnippetMode = Field("full", description="full：内联 snippet；table：去重后放入顶层 snippets，发现中以 snippet_ref 引用；none：不返回 snippet")
 
 class Issue(BaseModel):
     rule_id: str
@@ -29,6 +73,7 @@ class Issue(BaseModel):
     start_line: Optional[int] = None
     end_line: Optional[int] = None
     snippet: Optional[str] = None
+    snippet_ref: Optional[int] = Field(None, description="snippets=table 时为顶层 snippets 的下标")
 
 class AnalyzeResponse(BaseModel):
     issues: List[Issue]
@@ -36,56 +81,337 @@ class AnalyzeResponse(BaseModel):
     security: List[Issue]
     suggestions_markdown: str
     meta: Dict[str, Any] = {}
+    snippets: Optional[List[str]] = Field(None, description="snippets=table 时的片段表")
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {"status": "ok", "http_pool": http_pool.get_pool().stats(), "llm_governor": governor_stats(),
+            "clone_index": clone_index.stats() if clone_index is not None else None}
 
-@app.post("/analyze", response_model=AnalyzeResponse)
-async def analyze(req: AnalyzeRequest):
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus 文本格式：分阶段耗时直方图、重试次数、缓存命中、在途 LLM 调用、输入大小"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def _check_request(req: AnalyzeRequest):
     code = req.code or ""
     lang = req.language.lower()
     if not code.strip():
         raise HTTPException(status_code=400, detail="代码内容为空")
+    if lang not in ("python", "java"):
+        raise HTTPException(status_code=400, detail="不支持的语言，只支持 python/java")
+    return code, lang
+
+def _cache_key(lang: str, code: str, enable_llm: bool) -> Optional[str]:
+    if result_cache is None:
+        return None
+    llm_part = (*backends_tag(), PROMPT_VERSION) if enable_llm else ("none",)
+    return make_key(lang, RULESET_TAG, *llm_part, code=code)
+
+class FastJSONResponse(JSONResponse):
+    """报告已由 build_report 规整为 AnalyzeResponse 的形状：直接序列化，跳过 response_model 的逐条校验"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def _llm_failed_note(e: Exception) -> str:
+    LLM_FAILURES.inc(PROVIDER)
+    return f"\n> [LLM 调用失败，已仅使用本地规则] {e}\n"
+
+_ANSWER_META_KEYS = ("backend", "hedged", "failed_backends")
+
+def _llm_answer_meta(llm: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """回答本次审查的后端、是否触发了对冲请求、出错后被跳过的后端"""
+    meta = (llm or {}).get("meta") or {}
+    return {k: meta[k] for k in _ANSWER_META_KEYS if k in meta}
 
-    if lang == "python":
-        local = analyze_python(code)
-    elif lang == "java":
-        local = analyze_java(code)
+def _llm_failed_meta(e: Exception) -> Dict[str, Any]:
+    """熔断打开/限流等待过长时未发出请求，meta.llm_unavailable 说明原因与建议重试时间"""
+    if isinstance(e, ProviderUnavailable):
+        return {"llm_unavailable": {"provider": e.provider, "reason": e.reason, "retry_in": round(e.retry_in, 3)}}
+    return {}
+
+def _cache_lookup(cache_key: Optional[str]):
+    if cache_key is None:
+        return None, "off"
+    with stage("cache_lookup"):
+        cached, tier = result_cache.get(cache_key)
+    CACHE_LOOKUPS.inc(tier)
+    return cached, tier
+
+async def _analyze_code(lang: str, code: str, enable_llm: bool, llm_limit: Optional[asyncio.Semaphore] = None,
+                        incremental: bool = False, base_code: Optional[str] = None, diff: Optional[str] = None,
+                        timings: bool = False, on_local: Optional[Callable[[Dict[str, Any]], None]] = None,
+                        path: Optional[str] = None) -> Dict[str, Any]:
+    """单个文件的完整分析流程（缓存 → 本地规则 → LLM → 合并），返回响应字典；timings=True 时附带 meta.timings。
+    on_local 在本地规则完成、LLM 审查开始前以本地发现调用（任务的部分结果）。
+    启用克隆索引时另查跨文件相似块（结果依赖索引状态，不进入结果缓存），给出 path 时同时登记本文件。"""
+    t = start_request()
+    INPUT_BYTES.observe(len(code.encode("utf-8", "ignore")), lang)
+    with stage("total"):
+        resp = await _analyze_code_stages(lang, code, enable_llm, llm_limit, incremental, base_code, diff, on_local)
+        clones = await _clone_findings(lang, code, path)
+        if clones:
+            resp = {**resp, "smells": resp["smells"] + clones}
+    if timings:
+        resp["meta"] = {**resp["meta"], "timings": t.to_dict()}
+    return resp
+
+async def _clone_findings(lang: str, code: str, path: Optional[str]) -> List[Dict[str, Any]]:
+    """跨文件克隆发现（smells 类）；未启用克隆索引时为空"""
+    if clone_index is None:
+        return []
+    with stage("clone_index"):
+        return await run_cpu(clone_scan, lang, code, path, size=len(code))
+
+async def _analyze_code_stages(lang: str, code: str, enable_llm: bool, llm_limit: Optional[asyncio.Semaphore],
+                               incremental: bool, base_code: Optional[str], diff: Optional[str],
+                               on_local: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    cache_key = _cache_key(lang, code, enable_llm)
+    cached, tier = _cache_lookup(cache_key)
+    if cached is not None:
+        return {**cached, "meta": {**cached.get("meta", {}), "cache": tier}}
+
+    llm, suggestions_md, llm_ok, extra_meta = None, "", True, {}
+    if incremental or base_code is not None or diff:
+        with stage("incremental"):
+            local, llm, llm_error, extra_meta = await incremental_analyze(lang, code, enable_llm, base_code, diff)
+        if llm_error is not None:
+            llm_ok = False
+            suggestions_md += _llm_failed_note(llm_error)
+            extra_meta = {**extra_meta, **_llm_failed_meta(llm_error)}
+        elif llm is not None:
+            suggestions_md = llm.get("suggestions_markdown", "")
+            extra_meta = {**extra_meta, **_llm_answer_meta(llm)}
     else:
-        raise HTTPException(status_code=400, detail="不支持的语言，只支持 python/java")
+        with stage("static"):
+            local = await run_cpu(run_local, lang, code, size=len(code))
+        if on_local is not None and enable_llm:
+            on_local(local)
+        if enable_llm:
+            try:
+                if llm_limit is None:
+                    llm = await llm_review(language=lang, code=code, local_findings=local)
+                else:
+                    with stage("llm_queue"):
+                        await llm_limit.acquire()
+                    try:
+                        llm = await llm_review(language=lang, code=code, local_findings=local)
+                    finally:
+                        llm_limit.release()
+                suggestions_md = llm.get("suggestions_markdown", "")
+                extra_meta = _llm_answer_meta(llm)
+            except Exception as e:
+                llm_ok = False
+                suggestions_md += _llm_failed_note(e)
+                extra_meta = _llm_failed_meta(e)
 
-    issues = local.get("issues", [])
-    smells = local.get("smells", [])
-    security = local.get("security", [])
+    with stage("report"):
+        resp = await run_cpu(build_report, local, llm, suggestions_md, enable_llm, size=len(code) + len(suggestions_md))
+    # LLM 失败的结果不缓存，下次请求重新调用
+    if cache_key is not None and llm_ok:
+        result_cache.set(cache_key, resp)
+    # 浅拷贝后再写 meta，避免改动内存缓存中的同一对象
+    return {**resp, "meta": {**resp["meta"], **extra_meta, "cache": "miss" if cache_key is not None else "off"}}
 
-    suggestions_md = ""
-    if req.enable_llm:
+@app.post("/analyze", response_model=AnalyzeResponse)
+async def analyze(req: AnalyzeRequest):
+    code, lang = _check_request(req)
+    REQUESTS.inc("analyze")
+    resp = await _analyze_code(lang, code, req.enable_llm,
+                               incremental=req.incremental, base_code=req.base_code, diff=req.diff, timings=req.timings,
+                               path=req.path)
+    return FastJSONResponse(shape_snippets(resp, req.snippets))
+
+class JobRequest(AnalyzeRequest):
+    callback_url: Optional[str] = Field(None, description="任务结束后 POST 任务视图（同 GET /jobs/{id}）到该地址；"
+                                                         "主机须在 JOB_CALLBACK_ALLOWED_HOSTS 中")
+
+async def _run_job(request: Dict[str, Any], on_local: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    return await _analyze_code(request["language"], request["code"], request["enable_llm"],
+                               incremental=request["incremental"], base_code=request["base_code"], diff=request["diff"],
+                               timings=request["timings"], on_local=on_local, path=request.get("path"))
+
+@app.post("/jobs", status_code=202)
+async def create_job(req: JobRequest):
+    """异步分析：立即返回任务 id，由任务工作池处理；结果持久化在 SQLite，重启后未完成的任务继续执行"""
+    code, lang = _check_request(req)
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="任务队列未启用（JOBS_ENABLED=1 开启）")
+    if req.callback_url:
         try:
-            llm = await llm_review(language=lang, code=code, local_findings=local)
-            suggestions_md = llm.get("suggestions_markdown", "")
-            issues += llm.get("issues", [])
-            smells += llm.get("smells", [])
-            security += llm.get("security", [])
+            check_callback_url(req.callback_url)
+        except CallbackRejected as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    REQUESTS.inc("jobs")
+    request = req.model_dump(exclude={"callback_url"})
+    request.update(language=lang, code=code)
+    try:
+        job_id = await job_queue.submit(request, req.callback_url)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"id": job_id, "status": "queued", "url": f"/jobs/{job_id}"}
+
+@app.delete("/clones")
+async def delete_clone_file(path: str):
+    """从克隆索引中删除某个文件登记的全部块（文件被删除或迁出时调用）"""
+    if clone_index is None:
+        raise HTTPException(status_code=503, detail="克隆索引未启用（CLONE_INDEX_ENABLED=1 开启）")
+    if not await asyncio.to_thread(clone_index.remove, path):
+        raise HTTPException(status_code=404, detail="索引中没有该文件")
+    return {"path": path, "removed": True}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """任务状态（queued/running/done/failed）、部分结果（本地规则发现）与最终报告"""
+    job = await asyncio.to_thread(job_store.get, job_id) if job_store is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return public_view(job)
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _finding_key(item: Any):
+    if not isinstance(item, dict):
+        return repr(item)
+    return finding_key(item)
+
+@app.post("/analyze/stream")
+async def analyze_stream(req: AnalyzeRequest):
+    """SSE：先推送本地结果（local），再转发 LLM 增量（token）与解析出的发现（finding），最后推送完整报告（report）"""
+    code, lang = _check_request(req)
+    cache_key = _cache_key(lang, code, req.enable_llm)
+    REQUESTS.inc("analyze_stream")
+
+    async def events():
+        t = start_request()
+        INPUT_BYTES.observe(len(code.encode("utf-8", "ignore")), lang)
+        started = time.perf_counter()
+        cached, tier = _cache_lookup(cache_key)
+        if cached is not None:
+            yield _sse("local", shape_snippets({k: cached[k] for k in ("issues", "smells", "security")}, req.snippets))
+            clones = await _clone_findings(lang, code, req.path)
+            for item in clones:
+                yield _sse("finding", {"category": "smells", "item": item})
+            resp = {**cached, "smells": cached["smells"] + clones, "meta": {**cached.get("meta", {}), "cache": tier}}
+            yield _sse("report", shape_snippets(resp, req.snippets))
+            return
+
+        with stage("static"):
+            local = await run_cpu(run_local, lang, code, size=len(code))
+        yield _sse("local", shape_snippets(local, req.snippets))
+
+        llm, suggestions_md, llm_ok, extra_meta = None, "", True, {}
+        if req.enable_llm:
+            try:
+                sent = set()
+                async for kind, value in llm_review_stream(language=lang, code=code, local_findings=local):
+                    if kind == "token":
+                        yield _sse("token", {"text": value})
+                    elif kind == "finding":
+                        # 发现对象在模型输出中一闭合就推送，无需等待整段回复
+                        sent.add((value["category"], _finding_key(value["item"])))
+                        yield _sse("finding", value)
+                    else:
+                        llm = value
+                suggestions_md = llm.get("suggestions_markdown", "")
+                extra_meta = _llm_answer_meta(llm)
+                # 补发流式阶段未推送的发现（分块审查、内层 JSON 合并）
+                for cat in ("issues", "smells", "security"):
+                    for item in llm.get(cat, []):
+                        if (cat, _finding_key(item)) not in sent:
+                            yield _sse("finding", {"category": cat, "item": item})
+            except Exception as e:
+                llm_ok = False
+                suggestions_md += _llm_failed_note(e)
+                extra_meta = _llm_failed_meta(e)
+
+        # 与 /analyze 一致：克隆发现依赖索引状态，在写入结果缓存之后再并入报告
+        clones = await _clone_findings(lang, code, req.path)
+        for item in clones:
+            yield _sse("finding", {"category": "smells", "item": item})
+
+        with stage("report"):
+            resp = await run_cpu(build_report, local, llm, suggestions_md, req.enable_llm, size=len(code) + len(suggestions_md))
+        if cache_key is not None and llm_ok:
+            result_cache.set(cache_key, resp)
+        resp = {**resp, "smells": resp["smells"] + clones,
+                "meta": {**resp["meta"], **extra_meta, "cache": "miss" if cache_key is not None else "off"}}
+        metrics.observe_stage("total", time.perf_counter() - started)
+        if req.timings:
+            resp["meta"]["timings"] = t.to_dict()
+        yield _sse("report", shape_snippets(resp, req.snippets))
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+class BatchFile(BaseModel):
+    path: str = Field(..., description="文件路径，仅用于结果标识")
+    language: Optional[str] = Field(None, description="python 或 java；缺省时按扩展名识别")
+    code: str
+
+class BatchRequest(BaseModel):
+    files: List[BatchFile]
+    enable_llm: bool = True
+    snippets: SnippetMode = "full"
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: Request, enable_llm: bool = True, snippets: SnippetMode = "full"):
+    """批量分析：JSON {files: [{path, language, code}], enable_llm} 或直接上传 zip/tar 包体。
+
+    以 NDJSON 流式返回，每完成一个文件输出一行 {"type": "file", ...}，最后一行为 {"type": "summary", ...}。
+    """
+    body = await request.body()
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            breq = BatchRequest.model_validate_json(body)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        files = [f.model_dump() for f in breq.files]
+        enable_llm = breq.enable_llm
+        snippets = breq.snippets
+    else:
+        try:
+            files = await asyncio.to_thread(read_archive, body)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if not files:
+        raise HTTPException(status_code=400, detail="没有可分析的 python/java 文件")
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"文件数超过上限 {BATCH_MAX_FILES}")
+
+    REQUESTS.inc("analyze_batch")
+    llm_limit = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+    summary = BatchSummary(len(files))
+
+    async def one(f: Dict[str, Any]):
+        path, code = f["path"], f.get("code") or ""
+        lang = (f.get("language") or detect_language(path) or "").lower()
+        if lang not in ("python", "java"):
+            return path, code, None, "不支持的语言，只支持 python/java"
+        if not code.strip():
+            return path, code, None, "代码内容为空"
+        try:
+            return path, code, await _analyze_code(lang, code, enable_llm, llm_limit, path=path), None
         except Exception as e:
-            suggestions_md += f"\n> [LLM 调用失败，已仅使用本地规则] {e}\n"
-
-    def key(x):
-        return (x.get("rule_id"), x.get("message"), x.get("start_line"), x.get("end_line"))
-    def dedup(lst):
-        seen, out = set(), []
-        for it in lst:
-            k = key(it)
-            if k in seen:
-                continue
-            seen.add(k)
-            out.append(it)
-        return out
-
-    return AnalyzeResponse(
-        issues=[Issue(**x) for x in dedup(issues)],
-        smells=[Issue(**x) for x in dedup(smells)],
-        security=[Issue(**x) for x in dedup(security)],
-        suggestions_markdown=suggestions_md or "- 暂无额外建议",
-        meta={"llm": req.enable_llm}
-    )
+            return path, code, None, str(e)
+
+    async def lines():
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(one(f)) for f in files]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                path, code, result, error = await fut
+                summary.add(code, result)
+                row = {"type": "file", "path": path, "result": shape_snippets(result, snippets) if result else result}
+                if error:
+                    row["error"] = error
+                yield json.dumps(row, ensure_ascii=False) + "\n"
+            yield json.dumps({"type": "summary", **summary.to_dict(time.perf_counter() - started)}, ensure_ascii=False) + "\n"
+        finally:
+            # 客户端断开时取消尚未完成的文件
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -1,6 +1,22 @@
 from textwrap import dedent
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
 import json
 
+# 提示词版本：修改 system/user prompt 或 SCHEMA 时递增，用于缓存失效
+PROMPT_VERSION = "2"
+
+CATEGORIES = ("issues", "smells", "security")
+# 超出预算时按此顺序从低到高丢弃本地发现
+SEVERITY_RANK = {"critical": 4, "high": 3, "medium": 2, "low": 1, "info": 0}
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：ASCII 约 4 字符 1 token，其余（中文等）约 1 字符 1 token。
+    只做两次 C 层遍历，不依赖具体模型的分词器。"""
+    ascii_len = len(text.encode("ascii", "ignore"))
+    return (ascii_len + 3) // 4 + (len(text) - ascii_len)
+
+@lru_cache(maxsize=1)
 def build_system_prompt() -> str:
     return dedent(
         """
@@ -20,9 +36,8 @@ SCHEMA = {
     "required": ["suggestions_markdown"]
 }
 
-def build_user_prompt(language: str, code: str, local_findings: dict) -> str:
-    local_json = json.dumps(local_findings, ensure_ascii=False)
-    return dedent(f"""
+# 静态部分只在导入时序列化一次
+_USER_HEAD = dedent("""
     任务：对以下 {language} 代码进行严格的审查，结合我提供的本地静态检查结果，补充发现并生成可读报告。
 
     要求：
@@ -31,14 +46,60 @@ def build_user_prompt(language: str, code: str, local_findings: dict) -> str:
        - suggestions_markdown: 面向开发者的精简建议（Markdown），包含示例代码。
     2) 不要重复本地结果，侧重高价值问题与修复建议；如与本地结果冲突，以更严格、安全的方案为准。
 
-    本地静态检查结果（仅供参考）：
-    {local_json}
+    本地静态检查结果（仅供参考，每行：类别 | 规则 | 级别 | 行范围）：
+    """).strip()
+_USER_TAIL = "请仅返回一个 JSON 对象，符合此 JSON Schema：\n" + json.dumps(SCHEMA, ensure_ascii=False, separators=(",", ":"))
+_STATIC_TOKENS = estimate_tokens(_USER_HEAD) + estimate_tokens(_USER_TAIL)
+
+def _range(it: Dict[str, Any]) -> str:
+    start, end = it.get("start_line"), it.get("end_line")
+    if start is None:
+        return "-"
+    return str(start) if end in (None, start) else f"{start}-{end}"
 
-    代码：
-    ```{language}
-    {code}
-    ```
+def compact_findings(local_findings: Dict[str, Any], budget: int) -> Tuple[str, int]:
+    """把本地发现压缩成按 (类别, 规则, 级别) 分组的行范围表（不含 snippet/message），
+    估算 token 超出 budget 时先丢弃低级别发现。返回 (表格文本, 丢弃条数)。"""
+    items: List[Tuple[int, int, str, int, str, str]] = []
+    for ci, cat in enumerate(CATEGORIES):
+        for it in local_findings.get(cat) or []:
+            sev = str(it.get("severity") or "low")
+            items.append((-SEVERITY_RANK.get(sev, 1), ci, str(it.get("rule_id") or "?"), it.get("start_line") or 0, sev, _range(it)))
+    if not items:
+        return "（无）", 0
+    # 级别高的优先；同级别按类别、规则、行号，保证分组内行号有序
+    items.sort(key=lambda x: x[:4])
 
-    请仅返回一个 JSON 对象，符合此 JSON Schema：
-    {json.dumps(SCHEMA, ensure_ascii=False)}
-    """).strip()
+    groups: Dict[Tuple[str, str, str], List[str]] = {}
+    used = kept = 0
+    for _, ci, rule, _, sev, rng in items:
+        key = (CATEGORIES[ci], rule, sev)
+        cost = estimate_tokens(rng) + 1 if key in groups else estimate_tokens(f"{key[0]} | {rule} | {sev} | {rng}") + 1
+        if used + cost > budget:
+            break
+        used += cost
+        kept += 1
+        groups.setdefault(key, []).append(rng)
+
+    dropped = len(items) - kept
+    lines = [f"{cat} | {rule} | {sev} | {', '.join(rngs)}" for (cat, rule, sev), rngs in groups.items()]
+    if dropped:
+        lines.append(f"（预算所限，另有 {dropped} 条较低级别的发现未列出）")
+    return "\n".join(lines) if lines else "（无）", dropped
+
+def build_user_prompt(language: str, code: str, local_findings: dict, budget: int = 0) -> str:
+    """budget 为整个 user prompt 的 token 预算（估算值），0 表示不限制本地发现表的长度；
+    代码本身由调用方按 MAX_INPUT_CHARS 截断/分块，不在此处裁剪"""
+    fixed = _STATIC_TOKENS + estimate_tokens(code) + 16
+    table, _ = compact_findings(local_findings, max(0, budget - fixed) if budget > 0 else 1 << 60)
+    return "\n".join((
+        _USER_HEAD.format(language=language),
+        table,
+        "",
+        "代码：",
+        f"```{language}",
+        code,
+        "```",
+        "",
+        _USER_TAIL,
+    ))
@@ -0,0 +1,134 @@
+# app/services/backends.py
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, Awaitable, AsyncIterator, Deque
+
+from dotenv import load_dotenv
+from app.services.metrics import Counter
+
+load_dotenv()
+
+# 对冲：主后端耗时超过其近期成功耗时的该分位数时，向下一个后端发出重复请求（0 表示关闭对冲，仅故障转移）
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# 样本不足时使用的对冲延迟，以及自适应延迟的下限（秒）
+HEDGE_INITIAL_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "10"))
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+LLM_HEDGES = Counter("scr_llm_hedges_total", "Hedged duplicate requests fired, by backend that received the hedge", ("backend",))
+LLM_FAILOVERS = Counter("scr_llm_failovers_total", "Backend errors that moved a review to the next backend", ("backend",))
+LLM_ANSWERS = Counter("scr_llm_answers_total", "LLM reviews answered, by backend", ("backend",))
+
+class Backend:
+    """LLM 后端接口：complete 返回整段回复文本，stream 逐个产出内容增量。
+
+    新后端继承本类并用 register_backend 注册，再在 LLM_BACKENDS 中按优先级列出名称即可。
+    """
+
+    name = ""
+    model = ""
+
+    async def complete(self, messages: List[Dict[str, str]]) -> str:
+        raise NotImplementedError
+
+    def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+_FACTORIES: Dict[str, Callable[[], Backend]] = {}
+
+def register_backend(name: str, factory: Callable[[], Backend]):
+    _FACTORIES[name] = factory
+
+def build_backends(names: List[str]) -> List[Backend]:
+    unknown = [n for n in names if n not in _FACTORIES]
+    if unknown:
+        raise RuntimeError("Provider not implemented: " + ", ".join(unknown))
+    return [_FACTORIES[n]() for n in names]
+
+class LatencyTracker:
+    """单个后端最近 LATENCY_WINDOW 次成功调用的耗时，用于计算对冲延迟"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        """None 表示不对冲"""
+        if HEDGE_PERCENTILE <= 0:
+            return None
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_INITIAL_DELAY
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))
+        return max(HEDGE_MIN_DELAY, ordered[idx])
+
+_latency: Dict[str, LatencyTracker] = {}
+
+def latency(name: str) -> LatencyTracker:
+    t = _latency.get(name)
+    if t is None:
+        t = _latency[name] = LatencyTracker()
+    return t
+
+async def hedged_call(backends: List[Backend], call: Callable[[Backend], Awaitable[str]],
+                      valid: Callable[[str], bool]) -> Dict[str, Any]:
+    """按顺序调用后端，返回首个有效回复：{"content", "backend", "hedged", "failed"}。
+
+    - 当前最后发出的请求超过其后端的对冲延迟仍未返回时，向下一个后端发出重复请求（hedged=True）；
+    - 请求出错或回复无效时立即转向下一个后端（failed 记录出错的后端名）；
+    - 得到有效回复后取消其余在途请求；全部失败时抛出最后一个异常。
+    """
+    pending: Dict["asyncio.Task", Backend] = {}
+    started: Dict[str, float] = {}
+    failed: List[str] = []
+    hedged = False
+    last_error: Optional[BaseException] = None
+    nxt = 0
+
+    def launch():
+        nonlocal nxt
+        b = backends[nxt]
+        nxt += 1
+        started[b.name] = time.perf_counter()
+        pending[asyncio.ensure_future(call(b))] = b
+
+    launch()
+    try:
+        while pending:
+            timeout = None
+            if nxt < len(backends):
+                # 以最近发出的请求为准计算对冲时刻
+                newest = backends[nxt - 1]
+                delay = latency(newest.name).hedge_delay()
+                if delay is not None:
+                    timeout = max(0.0, started[newest.name] + delay - time.perf_counter())
+            done, _ = await asyncio.wait(set(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                LLM_HEDGES.inc(backends[nxt].name)
+                launch()
+                continue
+            for task in done:
+                b = pending.pop(task)
+                err = task.exception()
+                if err is None:
+                    content = task.result()
+                    if valid(content):
+                        latency(b.name).add(time.perf_counter() - started[b.name])
+                        LLM_ANSWERS.inc(b.name)
+                        return {"content": content, "backend": b.name, "hedged": hedged, "failed": failed}
+                    err = ValueError(f"{b.name} 返回了无效回复")
+                last_error = err
+                failed.append(b.name)
+                LLM_FAILOVERS.inc(b.name)
+            if not pending and nxt < len(backends):
+                launch()
+        raise last_error
+    finally:
+        for task in pending:
+            task.cancel()
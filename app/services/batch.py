@@ -0,0 +1,86 @@
+# app/services/batch.py
+import io
+import os
+import tarfile
+import zipfile
+from typing import Dict, Any, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+BATCH_MAX_FILE_BYTES = int(os.getenv("BATCH_MAX_FILE_BYTES", str(2 * 1024 * 1024)))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+EXT_LANG = {".py": "python", ".java": "java"}
+
+def detect_language(path: str) -> Optional[str]:
+    return EXT_LANG.get(os.path.splitext(path)[1].lower())
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8", errors="replace")
+
+def read_archive(data: bytes) -> List[Dict[str, str]]:
+    """从 zip / tar(.gz) 中读出可分析的源文件，按扩展名识别语言，跳过超限文件"""
+    files: List[Dict[str, str]] = []
+    if zipfile.is_zipfile(io.BytesIO(data)):
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            for info in zf.infolist():
+                lang = detect_language(info.filename)
+                if info.is_dir() or lang is None or info.file_size > BATCH_MAX_FILE_BYTES:
+                    continue
+                files.append({"path": info.filename, "language": lang, "code": _decode(zf.read(info))})
+                if len(files) >= BATCH_MAX_FILES:
+                    break
+        return files
+    try:
+        tf = tarfile.open(fileobj=io.BytesIO(data), mode="r:*")
+    except tarfile.TarError:
+        raise ValueError("无法识别的压缩包格式，只支持 zip / tar / tar.gz")
+    with tf:
+        for member in tf:
+            lang = detect_language(member.name)
+            if not member.isfile() or lang is None or member.size > BATCH_MAX_FILE_BYTES:
+                continue
+            f = tf.extractfile(member)
+            if f is None:
+                continue
+            files.append({"path": member.name, "language": lang, "code": _decode(f.read())})
+            if len(files) >= BATCH_MAX_FILES:
+                break
+    return files
+
+class BatchSummary:
+    """逐个文件累加的汇总统计"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.lines = 0
+        self.counts: Dict[str, int] = {"issues": 0, "smells": 0, "security": 0}
+        self.severity: Dict[str, int] = {}
+
+    def add(self, code: str, result: Optional[Dict[str, Any]]):
+        self.done += 1
+        self.lines += code.count("\n") + 1
+        if result is None:
+            self.failed += 1
+            return
+        for cat in self.counts:
+            for it in result.get(cat, []):
+                self.counts[cat] += 1
+                sev = it.get("severity") or "unknown"
+                self.severity[sev] = self.severity.get(sev, 0) + 1
+
+    def to_dict(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "files": self.total,
+            "completed": self.done,
+            "failed": self.failed,
+            "lines": self.lines,
+            "findings": self.counts,
+            "severity": self.severity,
+            "elapsed_seconds": round(elapsed, 3),
+        }
@@ -0,0 +1,140 @@
+# app/services/cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") not in ("0", "false", "False")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL = float(os.getenv("CACHE_TTL_SECONDS", "86400"))
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "")  # 为空则不启用磁盘层
+
+def normalize_code(code: str) -> str:
+    """统一换行并去掉行尾空白（不改变行号）"""
+    return "\n".join(ln.rstrip() for ln in code.replace("\r\n", "\n").split("\n")).rstrip("\n")
+
+def make_key(*parts: Any, code: str = "") -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(str(p).encode())
+        h.update(b"\0")
+    h.update(normalize_code(code).encode())
+    return h.hexdigest()
+
+class MemoryLRU:
+    """进程内 LRU：按条目数 + 总字节数 + TTL 淘汰"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.data: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            expires, size, value = item
+            if expires < time.time():
+                del self.data[key]
+                self.bytes -= size
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict[str, Any], size: int):
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.data[key] = (time.time() + self.ttl, size, value)
+            self.bytes += size
+            while len(self.data) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, s, _) = self.data.popitem(last=False)
+                self.bytes -= s
+
+class SqliteStore:
+    """磁盘层：重启后保留，多个 uvicorn worker 共享同一文件"""
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self.local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, expires REAL, value TEXT)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT expires, value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[0] < time.time():
+            conn = self._conn()
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            conn.commit()
+            return None
+        return row[1]
+
+    def set(self, key: str, raw: str):
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO results (key, expires, value) VALUES (?, ?, ?)", (key, time.time() + self.ttl, raw))
+        conn.commit()
+
+class ResultCache:
+    """两级结果缓存；get 返回 (值, 命中层级)，层级为 memory / sqlite / miss"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL, sqlite_path: str = CACHE_SQLITE_PATH):
+        self.memory = MemoryLRU(max_entries, max_bytes, ttl)
+        self.disk = SqliteStore(sqlite_path, ttl) if sqlite_path else None
+
+    def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value, "memory"
+        if self.disk is not None:
+            try:
+                raw = self.disk.get(key)
+            except sqlite3.Error:
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.memory.set(key, value, len(raw))
+                return value, "sqlite"
+        return None, "miss"
+
+    def set(self, key: str, value: Dict[str, Any]):
+        raw = json.dumps(value, ensure_ascii=False)
+        self.memory.set(key, value, len(raw))
+        if self.disk is not None:
+            try:
+                self.disk.set(key, raw)
+            except sqlite3.Error:
+                pass
+
+result_cache = ResultCache() if CACHE_ENABLED else None
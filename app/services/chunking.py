@@ -0,0 +1,122 @@
+# app/services/chunking.py
+import re
+from typing import Dict, Any, List, NamedTuple, Tuple
+
+from app.analyzers.common import _as_line
+from app.analyzers.java_index import build_index
+
+PY_UNIT = re.compile(r"^(\s{0,4})(async\s+def|def|class)\s+\w+|^@\w")
+
+class Chunk(NamedTuple):
+    start_line: int  # 1-based，含
+    end_line: int    # 1-based，含
+    text: str
+
+def unit_starts(lines: List[str], language: str) -> List[int]:
+    """函数/类边界的起始行下标（0-based）；装饰器/注解与其后的定义归为同一单元"""
+    if language == "java":
+        # Java 复用结构索引：花括号配对得到的类/方法声明起始行（含注解、修饰符）
+        idx = build_index("\n".join(lines))
+        heads = {s - 1 for s in idx.class_start} | {s - 1 for s in idx.method_start}
+        return [0] + sorted(h for h in heads if 0 < h < len(lines))
+    pat = PY_UNIT
+    starts = [0]
+    prev_is_header = False
+    for i, ln in enumerate(lines):
+        is_header = bool(pat.match(ln))
+        if is_header and not prev_is_header and i > 0:
+            starts.append(i)
+        prev_is_header = is_header and ln.lstrip().startswith("@")
+    return starts
+
+def make_chunks(code: str, language: str, budget: int) -> List[Chunk]:
+    """按函数/类边界切分，贪心合并相邻单元直至字符预算；超出预算的单元按行硬切"""
+    lines = code.splitlines()
+    if not lines:
+        return []
+    starts = unit_starts(lines, language) + [len(lines)]
+    units = [(starts[k], starts[k + 1]) for k in range(len(starts) - 1) if starts[k] < starts[k + 1]]
+
+    # 超预算的单元按行再切
+    pieces = []
+    for a, b in units:
+        size, s = 0, a
+        for i in range(a, b):
+            n = len(lines[i]) + 1
+            if size + n > budget and i > s:
+                pieces.append((s, i))
+                s, size = i, 0
+            size += n
+        pieces.append((s, b))
+
+    chunks: List[Chunk] = []
+    cur_a, cur_b, cur_size = pieces[0][0], pieces[0][0], 0
+    for a, b in pieces:
+        n = sum(len(lines[i]) + 1 for i in range(a, b))
+        if cur_size and cur_size + n > budget:
+            chunks.append(Chunk(cur_a + 1, cur_b, "\n".join(lines[cur_a:cur_b])))
+            cur_a, cur_size = a, 0
+        cur_b, cur_size = b, cur_size + n
+    chunks.append(Chunk(cur_a + 1, cur_b, "\n".join(lines[cur_a:cur_b])))
+    return chunks
+
+def chunks_for_ranges(code: str, language: str, budget: int, ranges: List[Tuple[int, int]]) -> List[Chunk]:
+    """只对给定行范围（1-based，含两端）分块，块的行号仍为整文件的绝对行号"""
+    lines = code.splitlines()
+    out: List[Chunk] = []
+    for a, b in ranges:
+        for c in make_chunks("\n".join(lines[a - 1:b]), language, budget):
+            out.append(Chunk(c.start_line + a - 1, c.end_line + a - 1, c.text))
+    return out
+
+def _shift(item: Dict[str, Any], offset: int) -> Dict[str, Any]:
+    """行号加偏移；LLM 常返回 "12" / 12.0，按 Finding 的同一规则转为整数后再平移"""
+    out = dict(item)
+    for k in ("start_line", "end_line"):
+        v = _as_line(out.get(k))
+        if v is not None:
+            out[k] = v + offset
+    return out
+
+def findings_for_chunk(local: Dict[str, Any], chunk: Chunk) -> Dict[str, Any]:
+    """只保留与该块行范围重叠的本地发现，行号改为块内相对行号"""
+    out: Dict[str, Any] = {}
+    for cat in ("issues", "smells", "security"):
+        kept = []
+        for it in local.get(cat, []):
+            s = it.get("start_line")
+            e = it.get("end_line") or s
+            if s is None or e < chunk.start_line or s > chunk.end_line:
+                continue
+            it = _shift(it, 1 - chunk.start_line)
+            it["start_line"] = max(it["start_line"], 1)
+            if it.get("end_line") is not None:
+                it["end_line"] = min(it["end_line"], chunk.end_line - chunk.start_line + 1)
+            kept.append(it)
+        out[cat] = kept
+    return out
+
+def merge_chunk_results(chunks: List[Chunk], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """把各块结果行号还原为绝对行号，跨块去重，拼接建议"""
+    merged: Dict[str, Any] = {"issues": [], "smells": [], "security": []}
+    seen = set()
+    md_parts = []
+    truncated = False
+    for chunk, res in zip(chunks, results):
+        for cat in ("issues", "smells", "security"):
+            for it in res.get(cat) or []:
+                if not isinstance(it, dict):
+                    continue
+                it = _shift(it, chunk.start_line - 1)
+                k = (cat, it.get("rule_id"), it.get("message"), it.get("start_line"), it.get("end_line"))
+                if k in seen:
+                    continue
+                seen.add(k)
+                merged[cat].append(it)
+        md = (res.get("suggestions_markdown") or "").strip()
+        if md:
+            md_parts.append(f"### 第 {chunk.start_line}-{chunk.end_line} 行\n\n{md}")
+        truncated = truncated or bool((res.get("meta") or {}).get("truncated"))
+    merged["suggestions_markdown"] = "\n\n".join(md_parts)
+    merged["meta"] = {"truncated": truncated, "chunks": len(chunks)}
+    return merged
@@ -0,0 +1,236 @@
+# app/services/clone_index.py
+import os
+import re
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Dict, Any, List, NamedTuple, Optional, Sequence
+
+from dotenv import load_dotenv
+from app.analyzers.common import make_issue
+from app.services.chunking import unit_starts
+
+load_dotenv()
+
+# 跨提交的近似重复索引（默认关闭）：函数/类单元 → 规整后的 token 片段 → MinHash 签名 → LSH 分桶，存于 SQLite
+CLONE_INDEX_ENABLED = os.getenv("CLONE_INDEX_ENABLED", "0") in ("1", "true", "True")
+CLONE_INDEX_PATH = os.getenv("CLONE_INDEX_PATH", ".cache/clones.db")
+CLONE_THRESHOLD = float(os.getenv("CLONE_THRESHOLD", "0.8"))           # 估计 Jaccard 相似度下限
+CLONE_MIN_TOKENS = int(os.getenv("CLONE_MIN_TOKENS", "40"))             # 过短的单元不登记、不查询
+CLONE_MAX_LINES = int(os.getenv("CLONE_MAX_LINES", "80"))               # 过长的单元按行切成多个块
+CLONE_MAX_BLOCKS = int(os.getenv("CLONE_INDEX_MAX_BLOCKS", "2000000"))  # 超出后淘汰最久未更新的文件
+CLONE_MAX_CANDIDATES = int(os.getenv("CLONE_MAX_CANDIDATES", "200"))    # 每个块最多比较的候选数（热门桶截断）
+CLONE_CACHE_KB = int(os.getenv("CLONE_INDEX_CACHE_KB", "16384"))        # SQLite 页缓存上限，内存占用与语料规模无关
+
+SHINGLE = 5            # token k-gram
+BANDS, ROWS = 8, 4     # 32 个 MinHash 值；相似度 0.6 时命中概率约 0.5，0.8 时约 0.97
+NUM_HASHES = BANDS * ROWS
+_EMPTY = 0xFFFFFFFF
+
+_TOKEN = re.compile(r'[A-Za-z_$][\w$]*|\d[\w.]*|"(?:\\.|[^"\\])*"?|\'(?:\\.|[^\'\\])*\'?|\S')
+_COMMENT = {"python": re.compile(r"#.*$"), "java": re.compile(r"//.*$")}
+
+class Block(NamedTuple):
+    start_line: int  # 1-based，含
+    end_line: int    # 1-based，含
+    sig: array       # NUM_HASHES 个 32 位 MinHash 值
+
+def tokenize(lines: Sequence[str], language: str) -> List[str]:
+    """去注释后切分 token；字符串与数字字面量规整为占位符（只改字面量的复制粘贴仍算相似）"""
+    comment = _COMMENT.get(language, _COMMENT["python"])
+    out: List[str] = []
+    for ln in lines:
+        ln = comment.sub("", ln)
+        for t in _TOKEN.findall(ln):
+            c = t[0]
+            if c == '"' or c == "'":
+                out.append("S")
+            elif c.isdigit():
+                out.append("N")
+            else:
+                out.append(t)
+    return out
+
+def signature(tokens: Sequence[str]) -> array:
+    """单次哈希的 MinHash（one-permutation hashing）：每个 k-gram 只哈希一次，低 5 位选桶、其余位取最小值；
+    空桶向后借用最近的非空桶（densification），使相似度估计对短块仍然无偏"""
+    sig = array("I", [_EMPTY]) * NUM_HASHES
+    k = SHINGLE
+    for i in range(max(1, len(tokens) - k + 1)):
+        h = zlib.crc32(" ".join(tokens[i:i + k]).encode())
+        b = h % NUM_HASHES
+        v = h // NUM_HASHES
+        if v < sig[b]:
+            sig[b] = v
+    if _EMPTY in sig and sig.count(_EMPTY) < NUM_HASHES:
+        orig = sig.tolist()
+        for j in range(NUM_HASHES):
+            if orig[j] == _EMPTY:
+                d = 1
+                while orig[(j + d) % NUM_HASHES] == _EMPTY:
+                    d += 1
+                # 加上距离偏移，避免借用的值与被借桶完全相同而高估相似度
+                sig[j] = (orig[(j + d) % NUM_HASHES] + d * 0x9E3779B1) & 0x07FFFFFF
+    return sig
+
+def band_keys(sig: array) -> List[int]:
+    return [(b << 32) | zlib.crc32(sig[b * ROWS:(b + 1) * ROWS].tobytes()) for b in range(BANDS)]
+
+def similarity(a: array, b: array) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_HASHES
+
+def split_blocks(code: str, language: str) -> List[Block]:
+    """按函数/类边界切块（过长的按 CLONE_MAX_LINES 再切），过短的块丢弃"""
+    lines = code.splitlines()
+    starts = unit_starts(lines, language) + [len(lines)]
+    out: List[Block] = []
+    for k in range(len(starts) - 1):
+        for a in range(starts[k], starts[k + 1], CLONE_MAX_LINES):
+            b = min(a + CLONE_MAX_LINES, starts[k + 1])
+            tokens = tokenize(lines[a:b], language)
+            if len(tokens) >= CLONE_MIN_TOKENS:
+                out.append(Block(a + 1, b, signature(tokens)))
+    return out
+
+class Match(NamedTuple):
+    block: Block
+    path: str
+    start_line: int
+    end_line: int
+    similarity: float
+
+class CloneIndex:
+    """磁盘上的 LSH 索引：按文件路径增量登记/删除；查询只读取命中桶中的候选，与语料规模近似无关"""
+
+    def __init__(self, path: str, max_blocks: int = CLONE_MAX_BLOCKS):
+        self.path = path
+        self.max_blocks = max_blocks
+        self.local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE, digest TEXT, updated REAL);"
+            "CREATE INDEX IF NOT EXISTS files_updated ON files (updated);"
+            "CREATE TABLE IF NOT EXISTS blocks (id INTEGER PRIMARY KEY, file INTEGER, start_line INTEGER,"
+            " end_line INTEGER, sig BLOB);"
+            "CREATE INDEX IF NOT EXISTS blocks_file ON blocks (file);"
+            "CREATE TABLE IF NOT EXISTS buckets (key INTEGER, block INTEGER, PRIMARY KEY (key, block)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);"
+            "INSERT OR IGNORE INTO meta VALUES ('blocks', 0);"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA cache_size=-{CLONE_CACHE_KB}")
+            self.local.conn = conn
+        return conn
+
+    def query(self, blocks: Sequence[Block], exclude_path: Optional[str] = None,
+              threshold: float = CLONE_THRESHOLD) -> List[Match]:
+        """每个块返回相似度最高且不低于 threshold 的已登记块（排除 exclude_path 自身）"""
+        conn = self._conn()
+        out: List[Match] = []
+        for blk in blocks:
+            keys = band_keys(blk.sig)
+            rows = conn.execute(
+                "SELECT b.sig, b.start_line, b.end_line, f.path FROM blocks b JOIN files f ON f.id = b.file"
+                f" WHERE b.id IN (SELECT DISTINCT block FROM buckets WHERE key IN ({','.join('?' * len(keys))}) LIMIT ?)",
+                (*keys, CLONE_MAX_CANDIDATES),
+            ).fetchall()
+            best: Optional[Match] = None
+            for raw, s, e, path in rows:
+                if path == exclude_path:
+                    continue
+                sim = similarity(blk.sig, array("I", raw))
+                if sim >= threshold and (best is None or sim > best.similarity):
+                    best = Match(blk, path, s, e, sim)
+            if best is not None:
+                out.append(best)
+        return out
+
+    def add(self, path: str, blocks: Sequence[Block], digest: str = ""):
+        """登记（或替换）一个文件的全部块；内容未变（digest 相同）时只刷新更新时间"""
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT id, digest FROM files WHERE path = ?", (path,)).fetchone()
+            if row is not None and digest and row[1] == digest:
+                conn.execute("UPDATE files SET updated = ? WHERE id = ?", (time.time(), row[0]))
+                return
+            if row is not None:
+                self._delete_blocks(conn, row[0])
+                conn.execute("UPDATE files SET digest = ?, updated = ? WHERE id = ?", (digest, time.time(), row[0]))
+                file_id = row[0]
+            else:
+                file_id = conn.execute("INSERT INTO files (path, digest, updated) VALUES (?, ?, ?)",
+                                       (path, digest, time.time())).lastrowid
+            for blk in blocks:
+                block_id = conn.execute("INSERT INTO blocks (file, start_line, end_line, sig) VALUES (?, ?, ?, ?)",
+                                        (file_id, blk.start_line, blk.end_line, blk.sig.tobytes())).lastrowid
+                conn.executemany("INSERT OR IGNORE INTO buckets (key, block) VALUES (?, ?)",
+                                 [(k, block_id) for k in band_keys(blk.sig)])
+            conn.execute("UPDATE meta SET value = value + ? WHERE name = 'blocks'", (len(blocks),))
+            self._evict(conn)
+
+    def remove(self, path: str) -> bool:
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT id FROM files WHERE path = ?", (path,)).fetchone()
+            if row is None:
+                return False
+            self._delete_file(conn, row[0])
+        return True
+
+    def _delete_blocks(self, conn: sqlite3.Connection, file_id: int):
+        rows = conn.execute("SELECT id, sig FROM blocks WHERE file = ?", (file_id,)).fetchall()
+        # 桶键可由签名重新算出，按主键删除，不需要 block 列上的二级索引
+        conn.executemany("DELETE FROM buckets WHERE key = ? AND block = ?",
+                         [(k, block_id) for block_id, raw in rows for k in band_keys(array("I", raw))])
+        conn.execute("DELETE FROM blocks WHERE file = ?", (file_id,))
+        conn.execute("UPDATE meta SET value = value - ? WHERE name = 'blocks'", (len(rows),))
+
+    def _delete_file(self, conn: sqlite3.Connection, file_id: int):
+        self._delete_blocks(conn, file_id)
+        conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def _evict(self, conn: sqlite3.Connection):
+        while self._count(conn) > self.max_blocks:
+            row = conn.execute("SELECT id FROM files ORDER BY updated LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._delete_file(conn, row[0])
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT value FROM meta WHERE name = 'blocks'").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        return {"files": conn.execute("SELECT count(*) FROM files").fetchone()[0], "blocks": self._count(conn),
+                "max_blocks": self.max_blocks}
+
+def clone_findings(matches: Sequence[Match]) -> List[Dict[str, Any]]:
+    return [make_issue("SML.CROSS_FILE_CLONE", "low",
+                       f"与 {m.path} 第 {m.start_line}-{m.end_line} 行的代码块相似（约 {m.similarity:.0%}）",
+                       m.block.start_line, m.block.end_line)
+            for m in matches]
+
+def clone_scan(lang: str, code: str, path: Optional[str]) -> List[Dict[str, Any]]:
+    """查询相似块并（提供 path 时）登记本文件；返回 smells 类发现（模块级函数，可在工作池中执行）"""
+    if clone_index is None:
+        return []
+    blocks = split_blocks(code, lang)
+    matches = clone_index.query(blocks, exclude_path=path)
+    if path:
+        clone_index.add(path, blocks, hashlib.sha256(code.encode("utf-8", "ignore")).hexdigest())
+    return clone_findings(matches)
+
+clone_index = CloneIndex(CLONE_INDEX_PATH) if CLONE_INDEX_ENABLED else None
@@ -0,0 +1,217 @@
+# app/services/compression.py
+import os
+import json
+import zlib
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+from dotenv import load_dotenv
+
+try:
+    import brotli  # 可选：pip install brotli，启用 br 编码
+except ImportError:
+    brotli = None
+
+load_dotenv()
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") not in ("0", "false", "False")
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+# 压缩请求体解压后的上限（防压缩炸弹），超出返回 413
+MAX_DECOMPRESSED_BYTES = int(os.getenv("MAX_DECOMPRESSED_BYTES", str(256 * 1024 * 1024)))
+# SSE 需要逐条送达，不压缩
+_SKIP_TYPES = ("text/event-stream",)
+
+Message = Dict[str, Any]
+
+class _Encoder:
+    """gzip / br 增量压缩；feed(final=False) 会 flush，产出到目前为止可解码的完整压缩块（流式响应逐块送达）"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self.c = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self.c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def feed(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self.c.process(data)
+            return out + (self.c.finish() if final else self.c.flush())
+        out = self.c.compress(data)
+        return out + self.c.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class _Decoder:
+    """gzip / deflate / br 增量解压；feed 的 limit 为本次最多产出的字节数（zlib 可在解压中途截停）"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self.d = brotli.Decompressor()
+        else:
+            self.d = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding == "gzip" else zlib.MAX_WBITS)
+
+    def feed(self, data: bytes, limit: int) -> Optional[bytes]:
+        """超出 limit 时返回 None"""
+        if self.encoding == "br":
+            # output_buffer_limit 让 brotli 在产出约 limit 字节后暂停，剩余输出用空输入继续取，压缩炸弹不会整段展开
+            parts = [self.d.process(data, output_buffer_limit=limit + 1)]
+            size = len(parts[0])
+            while size <= limit and not self.d.can_accept_more_data():
+                parts.append(self.d.process(b"", output_buffer_limit=limit + 1 - size))
+                size += len(parts[-1])
+            return b"".join(parts) if size <= limit else None
+        out = self.d.decompress(data, limit + 1)
+        return None if self.d.unconsumed_tail or len(out) > limit else out
+
+    def close(self) -> bytes:
+        return b"" if self.encoding == "br" else self.d.flush()
+
+# 请求体的 br 解压需要能限制输出大小（brotli >= 1.2 的 output_buffer_limit），旧版本只用于压缩响应
+_BR_BOUNDED = brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data")
+_DECODABLE = ("gzip", "deflate", "br") if _BR_BOUNDED else ("gzip", "deflate")
+_DECODE_ERRORS = (zlib.error, ValueError) + ((brotli.error,) if brotli is not None else ())
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """按 Accept-Encoding 选择 br（已安装 brotli 时）或 gzip；q=0 视为拒绝"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name] = q
+    for enc in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(enc, accepted.get("*", 0.0)) > 0:
+            return enc
+    return None
+
+def _header(headers: List, name: bytes) -> str:
+    for k, v in headers:
+        if k.lower() == name:
+            return v.decode("latin-1")
+    return ""
+
+async def _send_error(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+class CompressionMiddleware:
+    """ASGI 中间件：按 Accept-Encoding 协商 gzip/br 压缩响应；解压带 Content-Encoding 的请求体。
+
+    整体响应低于 COMPRESSION_MIN_BYTES 时不压缩；流式响应（NDJSON）逐块压缩并 flush，SSE 不压缩。
+    """
+
+    def __init__(self, app: Callable[..., Awaitable[None]]):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        headers = scope.get("headers") or []
+        content_encoding = _header(headers, b"content-encoding").strip().lower()
+        if content_encoding and content_encoding != "identity":
+            if content_encoding not in _DECODABLE:
+                await _send_error(send, 415, f"unsupported Content-Encoding: {content_encoding}")
+                return
+            try:
+                body = await self._decompress(receive, _Decoder(content_encoding))
+            except _DECODE_ERRORS:
+                await _send_error(send, 400, f"invalid {content_encoding} request body")
+                return
+            if body is None:
+                await _send_error(send, 413, "decompressed request body too large")
+                return
+            scope = dict(scope)
+            scope["headers"] = [(k, v) for k, v in headers if k.lower() not in (b"content-encoding", b"content-length")]
+            scope["headers"].append((b"content-length", str(len(body)).encode()))
+            receive = self._replay(body, receive)
+
+        encoding = negotiate(_header(headers, b"accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _ResponseCompressor(send, encoding).send)
+
+    @staticmethod
+    async def _decompress(receive, decoder: _Decoder) -> Optional[bytes]:
+        """读完并解压请求体；解压后超过 MAX_DECOMPRESSED_BYTES 时返回 None"""
+        parts: List[bytes] = []
+        size = 0
+        more = True
+        while more:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            more = message.get("more_body", False)
+            chunk = decoder.feed(message.get("body", b""), MAX_DECOMPRESSED_BYTES - size)
+            if chunk is None:
+                return None
+            size += len(chunk)
+            parts.append(chunk)
+        tail = decoder.close()
+        if size + len(tail) > MAX_DECOMPRESSED_BYTES:
+            return None
+        parts.append(tail)
+        return b"".join(parts)
+
+    @staticmethod
+    def _replay(body: bytes, receive):
+        sent = False
+
+        async def replay() -> Message:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()  # 之后只会收到 http.disconnect
+
+        return replay
+
+class _ResponseCompressor:
+    def __init__(self, send, encoding: str):
+        self._send = send
+        self.encoding = encoding
+        self.start: Optional[Message] = None
+        self.encoder: Optional[_Encoder] = None
+        self.passthrough = False
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = message.get("headers") or []
+            ctype = _header(headers, b"content-type")
+            self.passthrough = bool(_header(headers, b"content-encoding")) or ctype.startswith(_SKIP_TYPES)
+            if self.passthrough:
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body, more = message.get("body", b""), message.get("more_body", False)
+        if self.encoder is None:
+            if not more and len(body) < COMPRESSION_MIN_BYTES:
+                # 小响应原样发出
+                self.passthrough = True
+                await self._send(self.start)
+                await self._send(message)
+                return
+            self.encoder = _Encoder(self.encoding)
+            headers = [(k, v) for k, v in self.start.get("headers") or [] if k.lower() != b"content-length"]
+            headers += [(b"content-encoding", self.encoding.encode()), (b"vary", b"Accept-Encoding")]
+            if not more:
+                data = self.encoder.feed(body, final=True)
+                headers.append((b"content-length", str(len(data)).encode()))
+                await self._send({**self.start, "headers": headers})
+                await self._send({"type": "http.response.body", "body": data})
+                return
+            await self._send({**self.start, "headers": headers})
+        await self._send({"type": "http.response.body", "body": self.encoder.feed(body, final=not more), "more_body": more})
@@ -0,0 +1,59 @@
+# app/services/executor.py
+import os
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Any, Optional, Callable, TypeVar
+
+from dotenv import load_dotenv
+from app.analyzers.python_static import analyze_python
+from app.analyzers.java_static import analyze_java
+from app.analyzers.python_ast import analyze_python_ast
+from app.analyzers.engine import RULESET_VERSION, get_engine
+
+load_dotenv()
+
+ANALYSIS_EXECUTOR = os.getenv("ANALYSIS_EXECUTOR", "thread").lower()  # thread / process / inline
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(min(8, os.cpu_count() or 2))))
+# 小于该字符数的输入直接在事件循环内执行，避免线程/进程切换开销
+INLINE_MAX_CHARS = int(os.getenv("ANALYSIS_INLINE_MAX_CHARS", "20000"))
+# Python 分析器：regex（逐行规则，默认）/ ast（单次语法树遍历，含圈复杂度与参数个数）
+PYTHON_ANALYZER = os.getenv("PYTHON_ANALYZER", "regex").lower()
+# 参与缓存键的规则集标识：切换分析器后旧缓存自动失效
+RULESET_TAG = f"{RULESET_VERSION}-{PYTHON_ANALYZER}"
+
+T = TypeVar("T")
+
+_executor: Optional[Executor] = None
+
+def run_local(lang: str, code: str, detect_duplicates: bool = True) -> Dict[str, Any]:
+    """本地规则分析（模块级函数，可被进程池序列化）"""
+    if lang == "python" and PYTHON_ANALYZER == "ast":
+        return analyze_python_ast(code, detect_duplicates=detect_duplicates)
+    if lang == "java":
+        return analyze_java(code, detect_duplicates=detect_duplicates)
+    if not detect_duplicates:
+        return get_engine(lang).run(code, detect_duplicates=False)
+    return analyze_python(code)
+
+def get_executor() -> Optional[Executor]:
+    global _executor
+    if _executor is None and ANALYSIS_EXECUTOR != "inline":
+        if ANALYSIS_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+    return _executor
+
+async def run_cpu(fn: Callable[..., T], *args, size: int = 0) -> T:
+    """在工作池中执行 CPU 密集任务；size 低于阈值时内联执行。
+    进程池模式下 fn 与参数须可 pickle（模块级函数 + 普通 dict/list/str）。"""
+    executor = get_executor()
+    if executor is None or size < INLINE_MAX_CHARS:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
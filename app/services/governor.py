@@ -0,0 +1,189 @@
+# app/services/governor.py
+import os
+import time
+import asyncio
+import random
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, AsyncIterator
+
+from dotenv import load_dotenv
+from app.services.metrics import observe_stage, LLM_REJECTED, LLM_CIRCUIT_OPEN
+
+load_dotenv()
+
+# 每个 Provider 的进程级限额（0 表示不限制）
+LLM_RPM = float(os.getenv("LLM_RPM", "0"))                      # 每分钟请求数
+LLM_TPM = float(os.getenv("LLM_TPM", "0"))                      # 每分钟 token 数（提示词估算 + 实际输出）
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# 等待限流（retry-after / 令牌桶）超过该秒数时直接放弃，返回仅本地结果
+LLM_MAX_WAIT = float(os.getenv("LLM_MAX_WAIT", "20"))
+LLM_JITTER = float(os.getenv("LLM_JITTER", "0.4"))
+# 熔断：连续失败（5xx/网络错误）达到阈值后打开，冷却后放行一个探测请求
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class ProviderUnavailable(RuntimeError):
+    """熔断打开或限流等待过长：不发请求，直接失败（调用方降级为仅本地结果）"""
+
+    def __init__(self, provider: str, reason: str, retry_in: float):
+        self.provider, self.reason, self.retry_in = provider, reason, retry_in
+        super().__init__(f"{provider} 暂不可用（{reason}），约 {retry_in:.0f}s 后重试")
+
+class TokenBucket:
+    """预约式令牌桶：take(n) 立即扣减（可为负）并返回需要等待的秒数，先到先得、无需轮询"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute  # 允许一分钟额度的突发
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, n: float) -> float:
+        """不扣减，只计算取 n 个令牌需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(time.monotonic())
+        return max(0.0, (n - self.tokens) / self.rate)
+
+    def take(self, n: float):
+        if self.rate > 0:
+            self._refill(time.monotonic())
+            self.tokens -= n
+
+class CircuitBreaker:
+    def __init__(self, failures: int, cooldown: float):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def retry_in(self) -> float:
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def allow(self) -> Optional[bool]:
+        """None：拒绝；True：本次为半开探测；False：正常放行"""
+        if self.state == OPEN:
+            if self.retry_in() > 0:
+                return None
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self.probing:
+                return None
+            self.probing = True
+            return True
+        return False
+
+    def success(self):
+        self.state, self.failures, self.probing = CLOSED, 0, False
+
+    def failure(self) -> bool:
+        """记一次失败，返回是否因此打开"""
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.threshold > 0 and self.failures >= self.threshold):
+            self.state, self.opened_at, self.probing = OPEN, time.monotonic(), False
+            return True
+        return False
+
+class Governor:
+    """单个 Provider 的进程级调度：并发上限 + 请求/token 令牌桶 + 全局 retry-after + 熔断。
+
+    所有请求共享同一个 retry-after 截止时间：一次 429 让全部后续请求一起等待，
+    到期后再经令牌桶与随机抖动错开放行，避免各请求各自退避后同步重试形成风暴。
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.requests = TokenBucket(LLM_RPM)
+        self.tokens = TokenBucket(LLM_TPM)
+        self.sem = asyncio.Semaphore(LLM_MAX_CONCURRENCY) if LLM_MAX_CONCURRENCY > 0 else None
+        self.breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN)
+        self.blocked_until = 0.0
+        self.inflight = 0
+        self.waiting = 0
+
+    def _reject(self, reason: str, retry_in: float):
+        LLM_REJECTED.inc(self.provider, reason)
+        raise ProviderUnavailable(self.provider, reason, retry_in)
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0) -> AsyncIterator[None]:
+        """获取一次调用的许可；熔断打开或预计等待超过 LLM_MAX_WAIT 时立即抛出 ProviderUnavailable"""
+        probe = self.breaker.allow()
+        if probe is None:
+            self._reject("circuit_open", self.breaker.retry_in())
+        try:
+            t0 = time.perf_counter()
+            self.waiting += 1
+            try:
+                while True:
+                    # 全局 retry-after 期间可能被再次延长，醒来后重新计算
+                    blocked = self.blocked_until - time.monotonic()
+                    wait = max(blocked, self.requests.wait_for(1), self.tokens.wait_for(tokens))
+                    if wait > LLM_MAX_WAIT:
+                        self._reject("rate_limited", wait)
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait + (random.uniform(0, LLM_JITTER) if blocked > 0 else 0.0))
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                if self.sem is not None:
+                    await self.sem.acquire()
+            finally:
+                self.waiting -= 1
+                waited = time.perf_counter() - t0
+                if waited > 0.001:
+                    observe_stage("llm_throttle", waited)
+            self.inflight += 1
+            try:
+                yield
+            finally:
+                self.inflight -= 1
+                if self.sem is not None:
+                    self.sem.release()
+        finally:
+            if probe:
+                # 探测请求未能给出结果（被取消、限流拒绝等）时交还探测机会
+                self.breaker.probing = False
+
+    def rate_limited(self, delay: float):
+        """收到 429（或带 retry-after 的 503）：所有请求共同等待到 now + delay"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+    def success(self, used_tokens: int = 0):
+        self.breaker.success()
+        LLM_CIRCUIT_OPEN.set(0, self.provider)
+        if used_tokens:
+            self.tokens.take(used_tokens)
+
+    def failure(self):
+        if self.breaker.failure():
+            LLM_CIRCUIT_OPEN.set(1, self.provider)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retry_in": round(self.breaker.retry_in(), 3) if self.breaker.state == OPEN else 0.0,
+            "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 3),
+            "inflight": self.inflight,
+            "waiting": self.waiting,
+        }
+
+_governors: Dict[str, Governor] = {}
+
+def get_governor(provider: str) -> Governor:
+    gov = _governors.get(provider)
+    if gov is None:
+        gov = _governors[provider] = Governor(provider)
+    return gov
+
+def governor_stats() -> Dict[str, Any]:
+    return {p: g.stats() for p, g in _governors.items()}
@@ -0,0 +1,113 @@
+# app/services/http_pool.py
+import os
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, AsyncIterator
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TIMEOUT = int(os.getenv("TIMEOUT_SECONDS", "45"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2 = os.getenv("HTTP2", "0") in ("1", "true", "True")
+
+# Provider -> (环境变量名, 默认 base URL)
+PROVIDER_BASE_URLS = {
+    "deepseek": ("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1"),
+    "openai": ("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+}
+
+def base_url(provider: str) -> str:
+    env, default = PROVIDER_BASE_URLS[provider]
+    return os.getenv(env, default).rstrip("/")
+
+def _http2_available() -> bool:
+    # httpx 的 HTTP/2 支持依赖 h2（pip install httpx[http2]），这里只探测是否已安装
+    return importlib.util.find_spec("h2") is not None
+
+class ClientPool:
+    """应用级连接池：每个 Provider 一个长连接 AsyncClient，在 FastAPI 启动时创建、关闭时释放"""
+
+    def __init__(self):
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.in_flight: Dict[str, int] = {}
+        self.requests: Dict[str, int] = {}
+        self.http2 = HTTP2 and _http2_available()
+
+    def get(self, provider: str) -> httpx.AsyncClient:
+        client = self.clients.get(provider)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=base_url(provider),
+                timeout=TIMEOUT,
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+            )
+            self.clients[provider] = client
+        return client
+
+    async def post(self, provider: str, path: str, headers: Dict[str, str], payload: Dict[str, Any]) -> httpx.Response:
+        client = self.get(provider)
+        self.in_flight[provider] = self.in_flight.get(provider, 0) + 1
+        self.requests[provider] = self.requests.get(provider, 0) + 1
+        try:
+            return await client.post(path, headers=headers, json=payload)
+        finally:
+            self.in_flight[provider] -= 1
+
+    @asynccontextmanager
+    async def stream(self, provider: str, path: str, headers: Dict[str, str], payload: Dict[str, Any]) -> AsyncIterator[httpx.Response]:
+        client = self.get(provider)
+        self.in_flight[provider] = self.in_flight.get(provider, 0) + 1
+        self.requests[provider] = self.requests.get(provider, 0) + 1
+        try:
+            async with client.stream("POST", path, headers=headers, json=payload) as r:
+                yield r
+        finally:
+            self.in_flight[provider] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        out = {}
+        for provider, client in self.clients.items():
+            # 连接数来自 httpcore 连接池，属于内部字段，取不到时返回 None
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            conns = getattr(pool, "connections", None)
+            out[provider] = {
+                "base_url": str(client.base_url),
+                "http2": self.http2,
+                "in_flight": self.in_flight.get(provider, 0),
+                "requests": self.requests.get(provider, 0),
+                "connections": len(conns) if conns is not None else None,
+                "idle_connections": sum(1 for c in conns if c.is_idle()) if conns is not None else None,
+                "max_connections": HTTP_MAX_CONNECTIONS,
+                "max_keepalive": HTTP_MAX_KEEPALIVE,
+            }
+        return out
+
+    async def aclose(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+
+pool: Optional[ClientPool] = None
+
+def get_pool() -> ClientPool:
+    """未经 FastAPI 启动（如脚本/CLI 直接调用）时惰性创建"""
+    global pool
+    if pool is None:
+        pool = ClientPool()
+    return pool
+
+async def close_pool():
+    global pool
+    if pool is not None:
+        await pool.aclose()
+        pool = None
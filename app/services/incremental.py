@@ -0,0 +1,181 @@
+# app/services/incremental.py
+import re
+import bisect
+import difflib
+import hashlib
+import textwrap
+from typing import Dict, Any, List, NamedTuple, Optional, Set, Tuple
+
+from app.analyzers.common import duplicate_block_hash, _as_line
+from app.analyzers.engine import get_engine
+from app.prompt.prompts import PROMPT_VERSION
+from app.services.cache import ResultCache, make_key
+from app.services.chunking import unit_starts
+from app.services.executor import run_cpu, run_local, RULESET_TAG
+from app.services.llm import llm_review_ranges, backends_tag
+
+CATS = ("issues", "smells", "security")
+HUNK = re.compile(r"^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+# 函数单元级缓存：键为单元内容哈希，值中的行号均相对于单元首行
+unit_cache = ResultCache()
+
+class Unit(NamedTuple):
+    start_line: int  # 1-based，含
+    end_line: int    # 1-based，含
+    text: str
+    digest: str
+
+def split_units(code: str, language: str) -> List[Unit]:
+    """按函数/类边界切成单元，并计算与位置无关的内容哈希"""
+    lines = code.splitlines()
+    starts = unit_starts(lines, language) + [len(lines)]
+    units = []
+    for k in range(len(starts) - 1):
+        a, b = starts[k], starts[k + 1]
+        if a >= b:
+            continue
+        text = "\n".join(lines[a:b])
+        digest = hashlib.sha256("\n".join(ln.rstrip() for ln in lines[a:b]).encode()).hexdigest()
+        units.append(Unit(a + 1, b, text, digest))
+    return units
+
+def changed_lines(code: str, base_code: Optional[str] = None, diff: Optional[str] = None) -> Optional[Set[int]]:
+    """新版本中被修改/新增的行号集合；未提供 base_code/diff 时返回 None（完全依赖内容哈希）"""
+    if diff:
+        out: Set[int] = set()
+        new_no = old_left = new_left = 0
+        for ln in diff.splitlines():
+            if old_left <= 0 and new_left <= 0:
+                # 块外只有文件头（diff --git / --- / +++ 等）与下一个块头；块内行数由块头给出（省略时为 1）
+                m = HUNK.match(ln)
+                if m:
+                    old_left, new_no, new_left = int(m.group(1) or 1), int(m.group(2)), int(m.group(3) or 1)
+                continue
+            # 块内只看首字符：新增行 "++i;" 在 diff 中是 "+++i;"，不能当作文件头跳过
+            tag = ln[:1]
+            if tag == "+":
+                out.add(new_no)
+                new_no += 1
+                new_left -= 1
+            elif tag == "-":
+                out.add(new_no)  # 删除处：标记其后一行所在单元为已改动
+                old_left -= 1
+            elif tag != "\\":  # "\ No newline at end of file"
+                new_no += 1
+                new_left -= 1
+                old_left -= 1
+        return out
+    if base_code is not None:
+        out = set()
+        sm = difflib.SequenceMatcher(None, base_code.splitlines(), code.splitlines(), autojunk=False)
+        for tag, _, _, j1, j2 in sm.get_opcodes():
+            if tag != "equal":
+                out.update(range(j1 + 1, max(j2, j1 + 1) + 1))
+        return out
+    return None
+
+def _rebase(findings: Dict[str, Any], offset: int) -> Dict[str, Any]:
+    out = {}
+    for cat in CATS:
+        items = []
+        for it in findings.get(cat) or []:
+            it = dict(it)
+            for k in ("start_line", "end_line"):
+                v = _as_line(it.get(k))
+                if v is not None:
+                    it[k] = v + offset
+            items.append(it)
+        out[cat] = items
+    return out
+
+def _split_by_unit(findings: Dict[str, Any], units: List[Unit]) -> List[Dict[str, Any]]:
+    """把绝对行号的发现按起始行分配给单元，并转为单元内相对行号"""
+    starts = [u.start_line for u in units]
+    per_unit = [{cat: [] for cat in CATS} for _ in units]
+    for cat in CATS:
+        for it in findings.get(cat) or []:
+            s = _as_line(it.get("start_line"))
+            if s is None:
+                continue
+            k = max(bisect.bisect_right(starts, s) - 1, 0)
+            per_unit[k][cat].append(it)
+    return [_rebase(f, 1 - u.start_line) for f, u in zip(per_unit, units)]
+
+def _analyze_units(lang: str, texts: List[str]) -> List[Dict[str, Any]]:
+    """逐单元做本地分析（重复块需跨单元，由调用方对整文件检测）；
+    类内方法单元先去掉公共缩进，便于 ast 模式解析，行号不变"""
+    return [run_local(lang, textwrap.dedent(t), detect_duplicates=False) for t in texts]
+
+def _ranges(units: List[Unit]) -> List[Tuple[int, int]]:
+    """把相邻的单元合并为连续行范围"""
+    out: List[Tuple[int, int]] = []
+    for u in units:
+        if out and out[-1][1] + 1 == u.start_line:
+            out[-1] = (out[-1][0], u.end_line)
+        else:
+            out.append((u.start_line, u.end_line))
+    return out
+
+async def incremental_analyze(lang: str, code: str, enable_llm: bool,
+                              base_code: Optional[str] = None, diff: Optional[str] = None):
+    """函数级增量分析：只重新分析内容变化的单元，其余单元复用缓存并重定位行号。
+
+    返回 (local, llm, llm_error, meta)；llm 的 Markdown 只来自本次重新审查的单元，复用单元的 LLM 发现直接并入。
+    """
+    units = split_units(code, lang)
+    touched = changed_lines(code, base_code, diff)
+    llm_tag = (*backends_tag(), PROMPT_VERSION) if enable_llm else ("none",)
+    keys = [make_key("unit", lang, RULESET_TAG, *llm_tag, u.digest) for u in units]
+    marks = sorted(touched) if touched is not None else None
+
+    entries: List[Optional[Dict[str, Any]]] = []
+    for u, key in zip(units, keys):
+        # diff/base_code 标记为改动过的单元直接重新分析，不查缓存
+        forced = marks is not None and bisect.bisect_left(marks, u.start_line) < bisect.bisect_right(marks, u.end_line)
+        entries.append(None if forced else unit_cache.get(key)[0])
+
+    # 静态：缺失的单元重新分析（在工作池中）
+    todo = [k for k, e in enumerate(entries) if e is None or "static" not in e]
+    if todo:
+        size = sum(len(units[k].text) for k in todo)
+        results = await run_cpu(_analyze_units, lang, [units[k].text for k in todo], size=size)
+        for k, res in zip(todo, results):
+            entries[k] = {"static": res}
+
+    local: Dict[str, Any] = {cat: [] for cat in CATS}
+    for u, e in zip(units, entries):
+        abs_static = _rebase(e["static"], u.start_line - 1)
+        for cat in CATS:
+            local[cat] += abs_static[cat]
+    # 重复块跨单元，整文件重新检测（滚动哈希，开销很小）
+    local["smells"] += duplicate_block_hash(code.splitlines(), window=get_engine(lang).options["dup_window"])
+
+    # LLM：只审查没有缓存结果的单元；失败时仍返回（并缓存）静态结果
+    llm, llm_error = None, None
+    llm_todo = [k for k, e in enumerate(entries) if "llm" not in e] if enable_llm else []
+    if llm_todo:
+        try:
+            review = await llm_review_ranges(lang, code, local, _ranges([units[k] for k in llm_todo]))
+        except Exception as e:
+            llm_error = e
+        else:
+            fresh = _split_by_unit(review, [units[k] for k in llm_todo])
+            for k, f in zip(llm_todo, fresh):
+                entries[k]["llm"] = f
+            llm = {"suggestions_markdown": review.get("suggestions_markdown", ""), "meta": review.get("meta", {})}
+    if enable_llm and llm_error is None:
+        llm = llm or {"suggestions_markdown": "", "meta": {}}
+        for cat in CATS:
+            llm[cat] = []
+        for u, e in zip(units, entries):
+            abs_llm = _rebase(e["llm"], u.start_line - 1)
+            for cat in CATS:
+                llm[cat] += abs_llm[cat]
+
+    redone = set(todo) | set(llm_todo)
+    for k in redone:
+        unit_cache.set(keys[k], entries[k])
+
+    meta = {"units": len(units), "units_reused": len(units) - len(redone), "units_reanalyzed": len(redone)}
+    return local, llm, llm_error, meta
@@ -0,0 +1,284 @@
+# app/services/jobs.py
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+from app.services.metrics import Counter, Gauge
+from app.services.report import shape_snippets
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "0") in ("1", "true", "True")  # 默认关闭：开启后导入时创建数据库
+JOBS_SQLITE_PATH = os.getenv("JOBS_SQLITE_PATH", ".cache/jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOBS_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", "1000"))
+JOBS_TTL = float(os.getenv("JOBS_TTL_SECONDS", str(7 * 86400)))  # 已结束任务的保留时间
+# 执行超过该时长仍为 running 的任务视为执行者已失联，启动时重新排队
+JOBS_STALE_SECONDS = float(os.getenv("JOBS_STALE_SECONDS", "3600"))
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+JOB_CALLBACK_RETRIES = int(os.getenv("JOB_CALLBACK_RETRIES", "3"))
+# 回调只允许发往这些主机（逗号分隔；以 . 开头表示该域名下的所有子域名）；为空时不接受 callback_url
+JOB_CALLBACK_ALLOWED_HOSTS = [h.strip().lower() for h in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if h.strip()]
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+OWNER = f"{socket.gethostname()}:{os.getpid()}"  # 领取任务的执行者标识（主机:进程号）
+
+JOBS = Counter("scr_jobs_total", "Analysis jobs by final status (done/failed)", ("status",))
+JOBS_PENDING = Gauge("scr_jobs_pending", "Jobs queued or running")
+
+class QueueFull(RuntimeError):
+    pass
+
+class CallbackRejected(ValueError):
+    pass
+
+def check_callback_url(url: str) -> str:
+    """只接受 http/https 且主机在 JOB_CALLBACK_ALLOWED_HOSTS 中的回调地址（防止借回调访问内网、元数据服务）"""
+    if not JOB_CALLBACK_ALLOWED_HOSTS:
+        raise CallbackRejected("未启用任务回调（设置 JOB_CALLBACK_ALLOWED_HOSTS 开启）")
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").rstrip(".")
+        parts.port  # 非法端口在此抛出 ValueError
+    except ValueError:
+        raise CallbackRejected("callback_url 格式错误")
+    if parts.scheme not in ("http", "https") or not host:
+        raise CallbackRejected("callback_url 只支持 http/https")
+    for allowed in JOB_CALLBACK_ALLOWED_HOSTS:
+        if host == allowed or (allowed.startswith(".") and host.endswith(allowed)):
+            return url
+    raise CallbackRejected(f"callback_url 的主机 {host} 不在 JOB_CALLBACK_ALLOWED_HOSTS 中")
+
+def _owner_gone(owner: Optional[str]) -> bool:
+    """owner 为本机已退出的进程（含 pid 被本进程复用的前一次运行）。其他主机、以及 Windows 上
+    （os.kill 会终止目标进程，不能用来探测）无法判断，只按 JOBS_STALE_SECONDS 超时处理"""
+    if not owner:
+        return True
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if owner == OWNER:
+        return True
+    if os.name == "nt":
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass  # 进程存在，属于其他用户
+    return False
+
+# 任务参数：language, code, enable_llm, incremental, base_code, diff, timings, snippets
+Runner = Callable[[Dict[str, Any], Callable[[Dict[str, Any]], None]], Awaitable[Dict[str, Any]]]
+
+class JobStore:
+    """任务持久化（SQLite）：请求参数、状态、部分结果（本地规则）与最终报告；重启后保留"""
+
+    _COLUMNS = ("id", "status", "request", "callback_url", "created_at", "started_at", "finished_at",
+                "partial", "result", "error", "callback_status", "owner")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, request TEXT, callback_url TEXT,"
+            " created_at REAL, started_at REAL, finished_at REAL, partial TEXT, result TEXT, error TEXT,"
+            " callback_status TEXT, owner TEXT)"
+        )
+        if "owner" not in {r[1] for r in conn.execute("PRAGMA table_info(jobs)")}:
+            conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _update(self, job_id: str, **fields: Any):
+        conn = self._conn()
+        cols = ", ".join(f"{k} = ?" for k in fields)
+        conn.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+        conn.commit()
+
+    def create(self, request: Dict[str, Any], callback_url: Optional[str]) -> str:
+        job_id = uuid.uuid4().hex
+        conn = self._conn()
+        conn.execute("INSERT INTO jobs (id, status, request, callback_url, created_at) VALUES (?, ?, ?, ?, ?)",
+                     (job_id, QUEUED, json.dumps(request, ensure_ascii=False), callback_url, time.time()))
+        conn.commit()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self._COLUMNS, row))
+        for k in ("request", "partial", "result"):
+            if job[k] is not None:
+                job[k] = json.loads(job[k])
+        return job
+
+    def claim(self, job_id: str) -> bool:
+        """原子地把 queued 任务标记为由本进程执行；已被其他进程/worker 领取时返回 False"""
+        conn = self._conn()
+        cur = conn.execute("UPDATE jobs SET status = ?, started_at = ?, owner = ? WHERE id = ? AND status = ?",
+                           (RUNNING, time.time(), OWNER, job_id, QUEUED))
+        conn.commit()
+        return cur.rowcount == 1
+
+    def set_partial(self, job_id: str, partial: Dict[str, Any]):
+        self._update(job_id, partial=json.dumps(partial, ensure_ascii=False))
+
+    def finish(self, job_id: str, result: Dict[str, Any]):
+        self._update(job_id, status=DONE, finished_at=time.time(), result=json.dumps(result, ensure_ascii=False))
+
+    def fail(self, job_id: str, error: str):
+        self._update(job_id, status=FAILED, finished_at=time.time(), error=error)
+
+    def set_callback_status(self, job_id: str, status: str):
+        self._update(job_id, callback_status=status)
+
+    def recover(self) -> List[str]:
+        """启动时调用：执行者已退出（同机进程不存在）或执行超过 JOBS_STALE_SECONDS 的 running 任务重新排队，
+        返回全部 queued 任务（按提交顺序）；并清理过期任务。其他进程仍在执行的任务保持不动"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, now - JOBS_TTL))
+        for job_id, owner, started_at in conn.execute(
+                "SELECT id, owner, started_at FROM jobs WHERE status = ?", (RUNNING,)).fetchall():
+            if _owner_gone(owner) or (started_at or 0) < now - JOBS_STALE_SECONDS:
+                # 条件更新：多个进程同时启动时只有一个会改动
+                conn.execute("UPDATE jobs SET status = ?, started_at = NULL, owner = NULL"
+                             " WHERE id = ? AND status = ? AND owner IS ?", (QUEUED, job_id, RUNNING, owner))
+        conn.commit()
+        return [r[0] for r in conn.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,))]
+
+class JobQueue:
+    """固定数量的 worker 协程按提交顺序处理任务；突发请求在队列中排队，平滑对 Provider 的压力"""
+
+    def __init__(self, store: JobStore, runner: Runner, workers: int = JOB_WORKERS):
+        self.store = store
+        self.runner = runner
+        self.workers = max(1, workers)
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self.tasks: List["asyncio.Task"] = []
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        for job_id in await asyncio.to_thread(self.store.recover):
+            self.queue.put_nowait(job_id)
+        JOBS_PENDING.set(self.queue.qsize())
+        # 不跟随重定向：否则允许的主机可以把回调转发到任意地址
+        self.client = httpx.AsyncClient(timeout=JOB_CALLBACK_TIMEOUT, follow_redirects=False)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # 执行中的任务保持 running 状态，下次启动时 recover 发现执行者已退出后重新排队
+        for t in self.tasks:
+            t.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def submit(self, request: Dict[str, Any], callback_url: Optional[str] = None) -> str:
+        if self.queue.qsize() >= JOBS_MAX_PENDING:
+            raise QueueFull(f"排队任务数已达上限 {JOBS_MAX_PENDING}")
+        job_id = await asyncio.to_thread(self.store.create, request, callback_url)
+        self.queue.put_nowait(job_id)
+        JOBS_PENDING.inc()
+        return job_id
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run(job_id)
+            except Exception:
+                logger.exception("job %s 处理异常", job_id)
+            finally:
+                JOBS_PENDING.dec()
+
+    async def _run(self, job_id: str):
+        # SQLite 读写都放到线程中执行，不阻塞事件循环
+        store = self.store
+        job = await asyncio.to_thread(store.get, job_id)
+        if job is None or not await asyncio.to_thread(store.claim, job_id):
+            return
+        writes: List["asyncio.Task"] = []
+
+        def on_local(partial: Dict[str, Any]):
+            writes.append(asyncio.create_task(asyncio.to_thread(store.set_partial, job_id, partial)))
+
+        result, error = None, None
+        try:
+            result = await self.runner(job["request"], on_local)
+        except Exception as e:
+            error = str(e)
+        # 部分结果写完后再写最终状态，避免覆盖顺序颠倒
+        await asyncio.gather(*writes, return_exceptions=True)
+        if error is None:
+            await asyncio.to_thread(store.finish, job_id, result)
+            JOBS.inc(DONE)
+        else:
+            await asyncio.to_thread(store.fail, job_id, error)
+            JOBS.inc(FAILED)
+        if job["callback_url"]:
+            try:
+                # 提交后白名单可能已收紧（重启后恢复的任务），发送前再校验一次
+                url = check_callback_url(job["callback_url"])
+            except CallbackRejected:
+                await asyncio.to_thread(store.set_callback_status, job_id, "rejected")
+            else:
+                await self._notify(job_id, url)
+
+    async def _notify(self, job_id: str, url: str):
+        """POST 完整任务视图到 callback_url；非 2xx 或网络错误时退避重试"""
+        body = public_view(await asyncio.to_thread(self.store.get, job_id))
+        status = "failed"
+        for attempt in range(JOB_CALLBACK_RETRIES + 1):
+            try:
+                r = await self.client.post(url, json=body)
+                if r.status_code < 300:
+                    status = "delivered"
+                    break
+                status = f"http_{r.status_code}"
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if attempt < JOB_CALLBACK_RETRIES:
+                await asyncio.sleep(2 ** attempt)
+        await asyncio.to_thread(self.store.set_callback_status, job_id, status)
+
+def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """GET /jobs/{id} 与回调的响应体（不含提交的源代码）"""
+    view = {k: job[k] for k in ("id", "status", "created_at", "started_at", "finished_at", "error")}
+    mode = (job["request"] or {}).get("snippets", "full")
+    view["partial"] = shape_snippets(job["partial"], mode) if job["partial"] else job["partial"]
+    view["result"] = shape_snippets(job["result"], mode) if job["result"] else job["result"]
+    if job["callback_url"]:
+        view["callback_status"] = job["callback_status"]
+    return view
+
+job_store = JobStore(JOBS_SQLITE_PATH) if JOBS_ENABLED else None
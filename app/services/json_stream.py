@@ -0,0 +1,239 @@
+# app/services/json_stream.py
+import re
+import json
+from json.decoder import scanstring
+from typing import Dict, Any, List, Optional, Tuple
+
+CATS = ("issues", "smells", "security")
+
+_WS = re.compile(r"[\s,:]*")
+# 字符串体：遇到未转义的引号或缓冲区末尾停止；末尾孤立的反斜杠留到下一块再判断
+_DQ_BODY = re.compile(r'(?:[^"\\]|\\.)*', re.S)
+_SQ_BODY = re.compile(r"(?:[^'\\]|\\.)*", re.S)
+_SCALAR = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|[A-Za-z_$][\w$.-]*")
+_LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None}
+_UNESCAPED_DQ = re.compile(r'(?<!\\)"')
+_DECODER = json.JSONDecoder(strict=False)
+
+class _Frame:
+    __slots__ = ("value", "key", "parent_key")
+
+    def __init__(self, value, parent_key):
+        self.value = value            # dict / list
+        self.key = None               # dict：已读到、尚未赋值的键
+        self.parent_key = parent_key  # 在父容器中的键（父为 list 时为 None）
+
+def _decode_str(body: str, quote: str) -> str:
+    if quote == "'":
+        body = _UNESCAPED_DQ.sub('\\"', body.replace("\\'", "'"))
+    try:
+        return scanstring(body + '"', 0, False)[0]
+    except ValueError:
+        return body
+
+def _scalar(tok: str):
+    if tok in _LITERALS:
+        return _LITERALS[tok]
+    if tok[0] == "-" or tok[0].isdigit():
+        try:
+            return int(tok)
+        except ValueError:
+            try:
+                return float(tok)
+            except ValueError:
+                return tok
+    return tok  # 未加引号的裸词按字符串处理
+
+class JsonStreamParser:
+    """增量、容错的单遍 JSON 解析器（面向 LLM 回复）。
+
+    - feed(chunk) 可多次调用，返回本块中刚闭合的顶层 issues/smells/security 元素 [(分类, 对象)]；
+    - 跳过第一个 { 之前的说明文字/```json 围栏，根对象闭合后忽略其余内容；
+    - 容忍尾随逗号、缺失逗号、单引号字符串、字符串内的裸换行、未加引号的键；
+    - close() 在截断处补齐未闭合的字符串/数组/对象（未闭合的发现对象丢弃），返回根对象；没有 { 时返回 None。
+
+    不回扫：未完成的字符串记录已扫描位置，后续块从该处继续；完整的子对象/数组先交给 C 解码器一次读完，
+    仅在其失败（截断或畸形）时才逐 token 处理。
+    """
+
+    def __init__(self, categories: Tuple[str, ...] = CATS):
+        self.categories = categories
+        self.buf = ""
+        self.pos = 0
+        self.stack: List[_Frame] = []
+        self.root: Optional[Dict[str, Any]] = None
+        self.started = False
+        self.done = False
+        self.truncated = False
+        self._quote: Optional[str] = None   # 正在读取的字符串的引号
+        self._parts: List[str] = []         # 该字符串已扫描的原始片段
+        self._emitted: List[Tuple[str, Dict[str, Any]]] = []
+
+    # ---- 输入 ----
+    def feed(self, chunk: str) -> List[Tuple[str, Dict[str, Any]]]:
+        if self.done or not chunk:
+            return []
+        self.buf = self.buf[self.pos:] + chunk if self.pos < len(self.buf) else chunk
+        self.pos = 0
+        self._run(final=False)
+        out, self._emitted = self._emitted, []
+        return out
+
+    def close(self) -> Optional[Dict[str, Any]]:
+        if not self.done:
+            self._run(final=True)
+            self._unwind()
+        return self.root
+
+    # ---- 扫描 ----
+    def _run(self, final: bool):
+        buf, n = self.buf, len(self.buf)
+        if not self.started:
+            i = buf.find("{", self.pos)
+            if i < 0:
+                self.pos = n
+                return
+            self.started = True
+            self.stack.append(_Frame({}, None))
+            self.pos = i + 1
+
+        while not self.done:
+            if self._quote is not None:
+                if not self._continue_string():
+                    return
+                continue
+            self.pos = _WS.match(buf, self.pos).end()
+            if self.pos >= n:
+                return
+            c = buf[self.pos]
+            if c == "{" or c == "[":
+                # 快速路径：完整、合法的子结构交给 C 解码器一次读完；失败（截断/畸形）再逐个 token 处理
+                try:
+                    v, end = _DECODER.raw_decode(buf, self.pos)
+                except ValueError:
+                    self._open({} if c == "{" else [])
+                    self.pos += 1
+                else:
+                    self.pos = end
+                    self._attach(v, self._take_key(), whole=True)
+            elif c == "}" or c == "]":
+                self.pos += 1
+                self._close_top()
+            elif c == '"' or c == "'":
+                self._quote = c
+                self._parts = []
+                self.pos += 1
+            else:
+                m = _SCALAR.match(buf, self.pos)
+                if m is None:
+                    self.pos += 1  # 无法识别的字符直接跳过
+                    continue
+                if m.end() >= n and not final:
+                    return  # 数字/字面量可能被分块截断，等待下一块
+                self.pos = m.end()
+                v = _scalar(m.group())
+                self._value(v, is_str=isinstance(v, str))
+
+    def _continue_string(self) -> bool:
+        buf = self.buf
+        body = (_DQ_BODY if self._quote == '"' else _SQ_BODY).match(buf, self.pos)
+        end = body.end()
+        if end < len(buf) and buf[end] == self._quote:
+            self._parts.append(buf[self.pos:end])
+            self.pos = end + 1
+            quote, self._quote = self._quote, None
+            self._value(_decode_str("".join(self._parts), quote), is_str=True)
+            self._parts = []
+            return True
+        # 未闭合：保存已扫描部分，剩余（可能是孤立的反斜杠）留到下一块
+        self._parts.append(buf[self.pos:end])
+        self.pos = end
+        return False
+
+    # ---- 构造 ----
+    def _take_key(self):
+        """容器放入父结构时使用的键：父为 list 时为 None，父为 dict 却缺少键时为 ""（丢弃）"""
+        top = self.stack[-1]
+        if not isinstance(top.value, dict):
+            return None
+        key, top.key = top.key, None
+        return "" if key is None else key
+
+    def _open(self, container):
+        self.stack.append(_Frame(container, self._take_key()))
+
+    def _close_top(self):
+        frame = self.stack.pop()
+        if not self.stack:
+            self.root = frame.value
+            self.done = True
+            return
+        self._attach(frame.value, frame.parent_key)
+
+    def _attach(self, value, key, whole: bool = False):
+        parent = self.stack[-1]
+        if isinstance(parent.value, list):
+            parent.value.append(value)
+            # 根对象 -> 分类数组 -> 元素：发现对象闭合即产出
+            if len(self.stack) == 2 and isinstance(value, dict) and self._category_of(parent) is not None:
+                self._emitted.append((parent.parent_key, value))
+        elif key:
+            parent.value[key] = value
+            # 整个分类数组一次读完（快速路径）时逐个产出其中的发现对象
+            if whole and len(self.stack) == 1 and key in self.categories and isinstance(value, list):
+                self._emitted.extend((key, x) for x in value if isinstance(x, dict))
+
+    def _category_of(self, frame: _Frame) -> Optional[str]:
+        return frame.parent_key if frame.parent_key in self.categories else None
+
+    def _value(self, v, is_str: bool):
+        top = self.stack[-1]
+        if isinstance(top.value, list):
+            top.value.append(v)
+        elif top.key is None:
+            if is_str:
+                top.key = v if isinstance(v, str) else str(v)
+        else:
+            top.value[top.key] = v
+            top.key = None
+
+    def _unwind(self):
+        """截断收尾：未闭合字符串按已有内容取值，未闭合容器逐层补齐；未闭合的发现对象丢弃"""
+        if not self.started:
+            return
+        self.truncated = True
+        if self._quote is not None:
+            raw = "".join(self._parts) + self.buf[self.pos:]
+            quote, self._quote = self._quote, None
+            top = self.stack[-1]
+            if isinstance(top.value, dict) and top.key is not None:
+                self._value(_decode_str(raw.rstrip("\\"), quote), is_str=True)
+        while self.stack:
+            frame = self.stack[-1]
+            if (len(self.stack) == 3 and isinstance(frame.value, dict)
+                    and self._category_of(self.stack[1]) is not None):
+                self.stack.pop()
+                continue
+            self._close_top()
+        self._emitted = []
+
+def parse_reply_ex(text: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """解析完整的 LLM 回复，返回 (根对象, 是否截断)。
+
+    从第一个 { 起先用 C 实现的 raw_decode 一次解析；失败（尾随逗号、截断、单引号等）时
+    用容错解析器单遍恢复。没有 JSON 对象时返回 (None, False)。"""
+    start = text.find("{")
+    if start < 0:
+        return None, False
+    try:
+        obj, _ = _DECODER.raw_decode(text, start)
+        if isinstance(obj, dict):
+            return obj, False
+    except ValueError:
+        pass
+    p = JsonStreamParser()
+    p.feed(text[start:])
+    return p.close(), p.truncated
+
+def parse_reply(text: str) -> Optional[Dict[str, Any]]:
+    return parse_reply_ex(text)[0]
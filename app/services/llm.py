@@ -1,24 +1,41 @@
 # app/services/llm.py
 import os
-import re
 import json
 import asyncio
+import time
 import random
-from typing import Dict, Any, List
+import hashlib
+import logging
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable, AsyncIterator
 
 import httpx
 from dotenv import load_dotenv
-from app.prompt.prompts import build_system_prompt, build_user_prompt
+from app.prompt.prompts import build_system_prompt, build_user_prompt, estimate_tokens
+from app.services.http_pool import get_pool
+from app.services.governor import get_governor
+from app.services.backends import Backend, register_backend, build_backends, hedged_call, LLM_FAILOVERS
+from app.services.md_normalize import normalize_markdown
+from app.services.json_stream import JsonStreamParser, parse_reply, parse_reply_ex
+from app.services.executor import run_cpu
+from app.services.metrics import stage, observe_stage, record_stages, LLM_RETRIES, LLM_INFLIGHT, PROMPT_TOKENS
+from app.services.chunking import Chunk, make_chunks, chunks_for_ranges, findings_for_chunk, merge_chunk_results
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 PROVIDER = os.getenv("LLM_PROVIDER", "deepseek").lower()  # deepseek / openai
 MODEL = os.getenv("MODEL_NAME", "deepseek-chat")
+# 按优先级排列的后端列表（逗号分隔）：首个为主后端，其余用于对冲与故障转移；缺省只用 LLM_PROVIDER
+BACKENDS = [n.strip().lower() for n in os.getenv("LLM_BACKENDS", PROVIDER).split(",") if n.strip()] or [PROVIDER]
 TIMEOUT = int(os.getenv("TIMEOUT_SECONDS", "45"))
 MAX_INPUT_CHARS = int(os.getenv("MAX_INPUT_CHARS", "12000"))
 MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
 BASE_BACKOFF = float(os.getenv("LLM_BASE_BACKOFF", "0.8"))
 JITTER = float(os.getenv("LLM_JITTER", "0.4"))
+CHUNK_CONCURRENCY = int(os.getenv("LLM_CHUNK_CONCURRENCY", "4"))
+# user prompt 的 token 预算（估算）；超出时先丢弃低级别的本地发现，0 表示不限制
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
 
 def _truncate(s: str, limit: int) -> str:
     if len(s) <= limit:
@@ -27,71 +44,14 @@ def _truncate(s: str, limit: int) -> str:
     tail = limit - head
     return s[:head] + "\n...\n/* truncated */\n" + s[-tail:]
 
-def _cleanup_trailing_commas(text: str) -> str:
-    return re.sub(r",\s*([}\]])", r"\1", text)
-
 def _extract_json(text: str) -> Dict[str, Any]:
-    """提取最外层 JSON，增强容错性"""
+    """提取最外层 JSON（单遍容错解析，见 json_stream），没有 JSON 对象时抛出 ValueError"""
     if not isinstance(text, str):
         raise ValueError("not string")
-    
-    # 清理文本
-    t = text.strip().lstrip("\ufeff")
-    
-    # 尝试直接解析
-    try:
-        return json.loads(t)
-    except Exception:
-        pass
-    
-    # 尝试提取最外层的大括号内容
-    start = t.find("{")
-    if start == -1:
+    data = parse_reply(text.lstrip("\ufeff"))
+    if data is None:
         raise ValueError("no { found")
-    
-    # 增强的括号配对扫描
-    depth = 0
-    in_str = False
-    esc = False
-    end_pos = None
-    
-    for i, ch in enumerate(t[start:], start=start):
-        if in_str:
-            if esc:
-                esc = False
-            elif ch == "\\":
-                esc = True
-            elif ch == '"':
-                in_str = False
-            continue
-        
-        if ch == '"':
-            in_str = True
-            esc = False
-        elif ch == "{":
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                end_pos = i + 1
-                break
-    
-    if end_pos:
-        chunk = t[start:end_pos]
-        try:
-            return json.loads(chunk)
-        except Exception as e:
-            # 尝试修复常见的JSON问题
-            try:
-                # 修复尾随逗号
-                cleaned = re.sub(r',\s*([}\]])', r'\1', chunk)
-                # 修复未转义的控制字符
-                cleaned = cleaned.replace('\n', '\\n').replace('\t', '\\t')
-                return json.loads(cleaned)
-            except Exception:
-                raise ValueError(f"JSON parsing failed: {e}")
-    
-    raise ValueError("unbalanced braces or incomplete JSON")
+    return data
 
 
 def detect_truncation(text: str) -> bool:
@@ -126,313 +86,344 @@ def detect_truncation(text: str) -> bool:
     
     return any(indicators)
 
-def deep_clean_markdown(text):
-    """深度清理Markdown文本"""
-    if not text:
-        return ""
-    
-    # 处理多层转义
-    text = (text.replace('\\\\n', '\n')
-               .replace('\\\\t', '\t')
-               .replace('\\\\"', '"')
-               .replace("\\\\'", "'")
-               .replace('\\\\\\\\', '\\'))
-    
-    # 修复常见的格式问题
-    text = (text.replace('# 安全修复建议\\n\\n', '# 安全修复建议\n\n')
-               .replace('\\n## ', '\n## ')
-               .replace('\\n```', '\n```')
-               .replace('```\\n', '```\n'))
-    
-    return text
-
-def extract_inner_suggestions(content_json):
-    """从嵌套结构中提取 suggestions_markdown"""
-    suggestions = content_json.get("suggestions_markdown", "")
-    
-    # 如果 suggestions 本身包含 JSON，尝试提取内层的 suggestions_markdown
-    if isinstance(suggestions, str) and '"suggestions_markdown"' in suggestions:
-        try:
-            # 尝试解析为 JSON
-            inner_data = json.loads(suggestions)
-            if isinstance(inner_data, dict) and "suggestions_markdown" in inner_data:
-                return inner_data["suggestions_markdown"]
-        except:
-            # 如果解析失败，使用正则提取
-            import re
-            match = re.search(r'"suggestions_markdown"\s*:\s*"([^"]*)"', suggestions)
-            if match:
-                return match.group(1)
-    
-    return suggestions
+_INNER_KEYS = ('"suggestions_markdown"', '"issues"', '"smells"', '"security"')
 
-def fix_broken_markdown(text):
-    """修复破损的Markdown格式"""
-    if not text:
-        return ""
-    
-    # 修复空的代码块
-    text = re.sub(r'```\s*\n\s*```', '', text)
-    
-    # 修复转义字符
-    text = (text.replace('\\\\n', '\n')
-               .replace('\\\\t', '\t')
-               .replace('\\\\"', '"')
-               .replace("\\\\'", "'"))
-    
-    # 修复不完整的代码块
-    text = re.sub(r'(##\s*\d+\.\s*[^\n]+)\s*```\s*\n\s*```', r'\1\n\n*代码示例缺失*', text)
-    
-    return text
+def _extract_inner_from_sugg(s: str):
+    """suggestions_markdown 中嵌套了整段 JSON 时解析内层（只解析一遍），否则返回 None"""
+    if not isinstance(s, str) or not any(k in s for k in _INNER_KEYS):
+        return None
+    return parse_reply(s)
 
-# def _normalize_md(s: str) -> str:
-#     if not s: 
-#         return ""
-#     t = s.replace("\r\n", "\n")
-    
-#     # 保护代码块内的内容
-#     code_blocks = []
-#     code_block_index = 0
-    
-#     # 提取代码块
-#     def save_code_block(match):
-#         nonlocal code_block_index
-#         placeholder = f"___CODE_BLOCK_{code_block_index}___"
-#         code_blocks.append({
-#             'placeholder': placeholder,
-#             'content': match.group(0)
-#         })
-#         code_block_index += 1
-#         return placeholder
-    
-#     # 先用占位符替换所有代码块
-#     t = re.sub(r"```(?:\w+)?\n.*?\n```", save_code_block, t, flags=re.DOTALL)
-    
-#     # 统一围栏为 ```
-#     t = re.sub(r"^\s*`{3,}(\w+)?\s*$", lambda m: "```" + (m.group(1) or ""), t, flags=re.MULTILINE)
-#     t = re.sub(r"^\s*`{3,}\s*$", "```", t, flags=re.MULTILINE)
-#     t = re.sub(r"`{4,}\s*$", "```", t)
-    
-#     # 修复常见畸形
-#     t = re.sub(r"(^|\n)\s*`?python`?\s*(?=\n|$)", r"\n```python", t, flags=re.IGNORECASE)
-#     t = re.sub(r"\n`\s*$", "\n```", t)
-    
-#     # 自动补齐闭合
-#     lines = t.split("\n")
-#     out = []
-#     in_fence = False
-    
-#     for i, raw in enumerate(lines):
-#         line = raw.strip()
-#         if in_fence:
-#             if re.match(r"^```", line):
-#                 out.append("```")
-#                 in_fence = False
-#                 continue
-#             out.append(raw)
-#             if i == len(lines)-1:
-#                 out.append("```")
-#                 in_fence = False
-#             continue
-        
-#         m = re.match(r"^```(\w+)?\s*$", line)
-#         if m:
-#             out.append("```" + (m.group(1) or ""))
-#             in_fence = True
-#             continue
-        
-#         if re.match(r"^\s*``\s*$", line):
-#             out.append("```")
-#             continue
-        
-#         out.append(raw)
-    
-#     t = "\n".join(out)
-    
-#     # 恢复代码块
-#     for block in code_blocks:
-#         t = t.replace(block['placeholder'], block['content'])
-    
-#     # 头部像代码但没围栏 → 包起来
-#     head = t.split("\n")[:6]
-#     looks_code = sum(bool(re.search(r"^\s{2,}|[{}();]|:=|^\s*import\s+|^\s*from\s+|^\s*class\s+|^\s*def\s+", l)) for l in head) >= 3
-#     if not re.match(r"^```", t.strip()) and looks_code:
-#         t = "```\n" + t + "\n```"
-    
-#     t = re.sub(r"``\s*$", "```", t)
-#     return t
+def _salvage_broken_json(text: str) -> Dict[str, Any]:
+    """从不完整的JSON文本中抢救数据：截断处补齐，未闭合的发现对象丢弃"""
+    data = parse_reply(text) or {}
+    result = {k: [x for x in data.get(k) or [] if isinstance(x, dict)] for k in ("issues", "smells", "security")}
+    sugg = data.get("suggestions_markdown")
+    result["suggestions_markdown"] = sugg if isinstance(sugg, str) else ""
+    return result
 
-def _normalize_md(s: str) -> str:
-    if not s: 
-        return ""
-    
-    # 基本清理
-    t = s.replace("\r\n", "\n")
-    
-    # 处理转义字符
-    t = (t.replace('\\\\n', '\n')
-         .replace('\\\\t', '\t')
-         .replace('\\\\"', '"')
-         .replace("\\\\'", "'")
-         .replace('\\\\\\\\', '\\')
-         .replace('\\n', '\n')
-         .replace('\\t', '\t')
-         .replace('\\"', '"')
-         .replace("\\'", "'"))
-    
-    # 确保代码块格式正确
-    lines = t.split("\n")
-    result = []
-    in_code_block = False
-    
-    for line in lines:
-        stripped = line.strip()
-        
-        if stripped.startswith('```'):
-            if not in_code_block:
-                # 开始代码块
-                result.append(stripped)
-                in_code_block = True
-            else:
-                # 结束代码块
-                result.append('```')
-                in_code_block = False
-        elif in_code_block:
-            # 在代码块中，保留原样
-            result.append(line)
-        else:
-            # 不在代码块中，简单清理
-            if stripped:
-                result.append(stripped)
-    
-    # 如果最后还在代码块中，添加结束标记
-    if in_code_block:
-        result.append('```')
-    
-    return '\n'.join(result)
+def _backoff(attempt: int) -> float:
+    return BASE_BACKOFF * (2 ** attempt) + random.uniform(0, JITTER)
 
-def _extract_inner_from_sugg(s: str):
-    """从 suggestions_markdown 中解析内层 JSON，增强容错性"""
-    if not isinstance(s, str):
-        return None
-    
-    t = s.strip()
-    
-    # 优先提取 ```json ... ``` 里的内容
-    json_block_match = re.search(r"```json\s*([\s\S]*?)```", t, re.IGNORECASE)
-    if json_block_match:
-        body = json_block_match[1]
+def _retry_delay(r: httpx.Response, attempt: int) -> Tuple[float, bool]:
+    """返回 (等待秒数, 是否来自 retry-after)"""
+    retry_after = r.headers.get("retry-after")
+    if retry_after:
         try:
-            return _extract_json(body)
-        except Exception:
-            # 如果提取失败，继续尝试其他方法
+            return max(0.0, float(retry_after)), True
+        except ValueError:
             pass
-    
-    # 尝试直接提取整个文本中的JSON
-    try:
-        return _extract_json(t)
-    except Exception:
-        # 如果都失败，尝试手动提取关键字段
-        return _salvage_broken_json(t)
-    
-def _salvage_broken_json(text: str) -> Dict[str, Any]:
-    """从不完整的JSON文本中抢救数据"""
-    result = {
-        "issues": [],
-        "smells": [], 
-        "security": [],
-        "suggestions_markdown": ""
-    }
-    
-    # 提取 suggestions_markdown
-    sugg_match = re.search(r'"suggestions_markdown"\s*:\s*"([^"]*)"', text)
-    if sugg_match:
-        result["suggestions_markdown"] = sugg_match.group(1)
-    
-    # 提取各个数组字段
-    for field in ["issues", "smells", "security"]:
-        field_match = re.search(f'"{field}"\\s*:\\s*\\[([\\s\\S]*?)\\]', text)
-        if field_match:
-            array_content = field_match.group(1)
-            # 提取数组中的对象
-            objects = re.findall(r'\{[^{}]*\}', array_content)
-            for obj_str in objects:
-                try:
-                    # 修复常见的JSON问题
-                    fixed_obj = obj_str.replace("'", '"')
-                    obj = json.loads(fixed_obj)
-                    if any(key in obj for key in ["rule_id", "message", "severity"]):
-                        result[field].append(obj)
-                except Exception:
-                    # 如果解析失败，跳过这个对象
-                    continue
-    
-    return result
+    return _backoff(attempt), False
 
-async def _post_with_retry(url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any]:
+def _payload_tokens(payload: Dict[str, Any]) -> int:
+    return sum(estimate_tokens(m.get("content") or "") for m in payload.get("messages", []))
+
+async def _post_with_retry(provider: str, path: str, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any]:
+    # 复用应用级连接池中的长连接，重试不再重新握手；
+    # 每次尝试都经过进程级 governor（限流/并发/全局 retry-after/熔断），熔断打开时抛出 ProviderUnavailable
+    pool = get_pool()
+    gov = get_governor(provider)
+    tokens = _payload_tokens(payload)
     attempt = 0
     while True:
-        try:
-            async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-                r = await client.post(url, headers=headers, json=payload)
-                if r.status_code == 429 or 500 <= r.status_code < 600:
-                    if attempt >= MAX_RETRIES:
-                        r.raise_for_status()
-                    retry_after = r.headers.get("retry-after")
-                    delay = float(retry_after) if retry_after else (BASE_BACKOFF * (2 ** attempt) + random.uniform(0, JITTER))
-                    attempt += 1
-                    await asyncio.sleep(delay)
-                    continue
-                r.raise_for_status()
-                return r.json()
-        except httpx.HTTPError:
+        async with gov.slot(tokens):
+            try:
+                LLM_INFLIGHT.inc(provider)
+                try:
+                    r = await pool.post(provider, path, headers, payload)
+                finally:
+                    LLM_INFLIGHT.dec(provider)
+            except httpx.HTTPError:
+                gov.failure()
+                if attempt >= MAX_RETRIES:
+                    raise
+                r = None
+        if r is None:
+            delay = _backoff(attempt)
+            attempt += 1
+            LLM_RETRIES.inc(provider, "transport")
+            with stage("llm_backoff"):
+                await asyncio.sleep(delay)
+            continue
+        if r.status_code == 429 or 500 <= r.status_code < 600:
+            delay, from_header = _retry_delay(r, attempt)
+            if r.status_code == 429 or from_header:
+                # 限流是全局的：所有请求一起等待，由 governor 错开放行，而不是各自退避后同步重试
+                gov.rate_limited(delay)
+            if r.status_code != 429:
+                gov.failure()
             if attempt >= MAX_RETRIES:
-                raise
-            delay = BASE_BACKOFF * (2 ** attempt) + random.uniform(0, JITTER)
+                r.raise_for_status()
             attempt += 1
-            await asyncio.sleep(delay)
+            LLM_RETRIES.inc(provider, str(r.status_code))
+            if r.status_code != 429 and not from_header:
+                with stage("llm_backoff"):
+                    await asyncio.sleep(delay)
+            continue
+        r.raise_for_status()
+        data = r.json()
+        gov.success((data.get("usage") or {}).get("completion_tokens") or 0)
+        return data
 
-async def _call_deepseek(messages: List[Dict[str, str]]) -> str:
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
-        raise RuntimeError("缺少 DEEPSEEK_API_KEY")
-    base = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    payload = {"model": MODEL, "messages": messages, "temperature": 0.1, "max_tokens": 4096}
-    data = await _post_with_retry(f"{base}/chat/completions", headers, payload)
-    return data["choices"][0]["message"]["content"]
-
-async def _call_openai(messages: List[Dict[str, str]]) -> str:
-    api_key = os.getenv("OPENAI_API_KEY")
+_API_KEY_ENVS = {"deepseek": "DEEPSEEK_API_KEY", "openai": "OPENAI_API_KEY"}
+
+def _auth_headers(provider: str) -> Dict[str, str]:
+    api_key = os.getenv(_API_KEY_ENVS[provider])
     if not api_key:
-        raise RuntimeError("缺少 OPENAI_API_KEY")
-    base = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    payload = {"model": MODEL, "messages": messages, "temperature": 0.1, "max_tokens": 4096}
-    data = await _post_with_retry(f"{base}/chat/completions", headers, payload)
-    return data["choices"][0]["message"]["content"]
+        raise RuntimeError(f"缺少 {_API_KEY_ENVS[provider]}")
+    return {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+
+class ChatCompletionsBackend(Backend):
+    """OpenAI 兼容的 /chat/completions 后端（DeepSeek、OpenAI）；模型名可用 <NAME>_MODEL 单独指定"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.model = MODEL if name == PROVIDER else os.getenv(f"{name.upper()}_MODEL", MODEL)
+
+    async def complete(self, messages: List[Dict[str, str]]) -> str:
+        payload = {"model": self.model, "messages": messages, "temperature": 0.1, "max_tokens": 4096}
+        data = await _post_with_retry(self.name, "/chat/completions", _auth_headers(self.name), payload)
+        return data["choices"][0]["message"]["content"]
+
+    def stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        return _stream_chat(self.name, messages, self.model)
+
+for _name in _API_KEY_ENVS:
+    register_backend(_name, lambda _name=_name: ChatCompletionsBackend(_name))
+
+async def _stream_chat(provider: str, messages: List[Dict[str, str]], model: str = MODEL) -> AsyncIterator[str]:
+    """以 stream: true 调用 chat/completions，逐个产出内容增量（SSE data 行）"""
+    headers = _auth_headers(provider)
+    payload = {"model": model, "messages": messages, "temperature": 0.1, "max_tokens": 4096, "stream": True}
+    pool = get_pool()
+    gov = get_governor(provider)
+    tokens = _payload_tokens(payload)
+    attempt = 0
+    while True:
+        # 仅在收到首个 token 之前重试，之后出错直接抛出
+        delay = None
+        async with gov.slot(tokens):
+            LLM_INFLIGHT.inc(provider)
+            try:
+                async with pool.stream(provider, "/chat/completions", headers, payload) as r:
+                    if r.status_code == 429 or 500 <= r.status_code < 600:
+                        delay, from_header = _retry_delay(r, attempt)
+                        if r.status_code == 429 or from_header:
+                            gov.rate_limited(delay)
+                            delay = 0.0
+                        if r.status_code != 429:
+                            gov.failure()
+                        if attempt < MAX_RETRIES:
+                            attempt += 1
+                            LLM_RETRIES.inc(provider, str(r.status_code))
+                        else:
+                            delay = None
+                    if delay is None:
+                        r.raise_for_status()
+                        async for line in r.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                break
+                            try:
+                                chunk = json.loads(data)
+                            except ValueError:
+                                continue
+                            choices = chunk.get("choices") or [{}]
+                            delta = (choices[0].get("delta") or {}).get("content")
+                            if delta:
+                                yield delta
+                        gov.success()
+                        return
+            except httpx.TransportError:
+                gov.failure()
+                raise
+            finally:
+                LLM_INFLIGHT.dec(provider)
+        if delay:
+            with stage("llm_backoff"):
+                await asyncio.sleep(delay)
+
+class _Flight:
+    """一次进行中的上游调用及其等待者数量"""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+_INFLIGHT: Dict[str, _Flight] = {}
+
+def _fingerprint(provider: str, model: str, messages: List[Dict[str, str]]) -> str:
+    raw = json.dumps([provider, model, messages], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+async def _coalesce(key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """相同指纹的并发调用共享同一个上游任务（single-flight）
+
+    - 上游任务独立于任何调用方运行，单个调用方被取消不影响其他等待者；
+    - 所有等待者都离开后才取消上游任务；
+    - 上游失败时异常传播给全部等待者，不会挂起。
+    """
+    flight = _INFLIGHT.get(key)
+    if flight is None:
+        flight = _Flight(asyncio.ensure_future(factory()))
+        _INFLIGHT[key] = flight
+
+        def _done(t: "asyncio.Task", flight=flight):
+            if _INFLIGHT.get(key) is flight:
+                del _INFLIGHT[key]
+            if not t.cancelled():
+                t.exception()  # 标记异常已取回，避免无人等待时的告警
+
+        flight.task.add_done_callback(_done)
+    flight.waiters += 1
+    try:
+        return await asyncio.shield(flight.task)
+    finally:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            # 最后一个等待者离开：立即摘除，后来者会发起新的上游调用
+            if _INFLIGHT.get(key) is flight:
+                del _INFLIGHT[key]
+            flight.task.cancel()
+
+def _build_messages(language: str, code: str, local_findings: Dict[str, Any]) -> List[Dict[str, str]]:
+    with stage("prompt_build"):
+        safe_code = _truncate(code, MAX_INPUT_CHARS)
+        system = build_system_prompt()
+        user = build_user_prompt(language, safe_code, local_findings, budget=PROMPT_TOKEN_BUDGET)
+        PROMPT_TOKENS.observe(estimate_tokens(system) + estimate_tokens(user))
+        return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+async def _parse(content: str, parsed: Optional[Dict[str, Any]] = None, truncated: bool = False) -> Dict[str, Any]:
+    """在工作池中解析模型输出，并记录其中测得的各阶段耗时"""
+    result = await run_cpu(_postprocess, content, parsed, truncated, size=len(content))
+    record_stages(result["meta"].pop("stages", {}))
+    return result
+
+_backends: Optional[List[Backend]] = None
+
+def _get_backends() -> List[Backend]:
+    global _backends
+    if _backends is None:
+        _backends = build_backends(BACKENDS)
+    return _backends
+
+def backends_tag() -> Tuple[str, ...]:
+    """实际使用的后端（按优先级的 名称:模型），用于结果缓存键：改动后端列表或某个后端的模型即失效"""
+    try:
+        return tuple(f"{b.name}:{b.model}" for b in _get_backends())
+    except RuntimeError:
+        return tuple(BACKENDS)  # 后端配置有误时 LLM 调用会失败，结果不写缓存
+
+def _valid_reply(content: Any) -> bool:
+    # 只做廉价检查：非空且含 JSON 对象起始；完整解析在 _parse 中进行
+    return isinstance(content, str) and "{" in content
+
+def _answer_meta(answer: Dict[str, Any]) -> Dict[str, Any]:
+    meta = {"provider": answer["backend"], "backend": answer["backend"], "hedged": answer["hedged"]}
+    if answer["failed"]:
+        meta["failed_backends"] = answer["failed"]
+    return meta
+
+async def _complete(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    backends = _get_backends()
+    with stage("llm_request"):
+        answer = await _coalesce(_fingerprint(",".join(b.name for b in backends), MODEL, messages),
+                                 lambda: hedged_call(backends, lambda b: b.complete(messages), _valid_reply))
+    result = await _parse(answer["content"])
+    result["meta"].update(_answer_meta(answer))
+    return result
 
 async def llm_review(language: str, code: str, local_findings: Dict[str, Any]) -> Dict[str, Any]:
-    safe_code = _truncate(code, MAX_INPUT_CHARS)
-    system = build_system_prompt()
-    user = build_user_prompt(language, safe_code, local_findings)
-    messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
-
-    if PROVIDER == "deepseek":
-        content = await _call_deepseek(messages)
-    elif PROVIDER == "openai":
-        content = await _call_openai(messages)
+    if len(code) <= MAX_INPUT_CHARS:
+        return await _complete(_build_messages(language, code, local_findings))
+    return await _chunked_review(language, code, local_findings)
+
+async def _chunked_review(language: str, code: str, local_findings: Dict[str, Any],
+                          ranges: Optional[List[Tuple[int, int]]] = None) -> Dict[str, Any]:
+    """大文件按函数/类边界分块并发审查，行号还原后合并，替代首尾截断。
+    ranges 给定时只审查这些行范围（增量审查）。"""
+    if ranges is None:
+        chunks = make_chunks(code, language, MAX_INPUT_CHARS)
     else:
-        raise RuntimeError("Provider not implemented: " + PROVIDER)
+        chunks = chunks_for_ranges(code, language, MAX_INPUT_CHARS, ranges)
+    if not chunks:
+        return {"issues": [], "smells": [], "security": [], "suggestions_markdown": "",
+                "meta": {"llm": True, "provider": PROVIDER, "backend": PROVIDER, "hedged": False, "truncated": False, "chunks": 0}}
+    limit = asyncio.Semaphore(CHUNK_CONCURRENCY)
 
-    print(f"LLM原始响应: {content}")  # 调试输出
+    async def one(chunk: Chunk) -> Dict[str, Any]:
+        async with limit:
+            return await _complete(_build_messages(language, chunk.text, findings_for_chunk(local_findings, chunk)))
 
-    # 先解析顶层 JSON
-    try:
-        content_json = _extract_json(content)
-    except Exception as e:
-        print(f"顶层JSON解析失败: {e}")
+    results = await asyncio.gather(*[one(c) for c in chunks])
+    merged = merge_chunk_results(chunks, results)
+    # 各块可能由不同后端回答
+    answered = list(dict.fromkeys(r["meta"]["backend"] for r in results))
+    failed = list(dict.fromkeys(n for r in results for n in r["meta"].get("failed_backends", [])))
+    merged["meta"] = {"llm": True, "provider": answered[0], "backend": ",".join(answered),
+                      "hedged": any(r["meta"]["hedged"] for r in results), **merged["meta"]}
+    if failed:
+        merged["meta"]["failed_backends"] = failed
+    return merged
+
+async def llm_review_ranges(language: str, code: str, local_findings: Dict[str, Any],
+                            ranges: List[Tuple[int, int]]) -> Dict[str, Any]:
+    """只审查指定行范围，返回绝对行号的结果"""
+    return await _chunked_review(language, code, local_findings, ranges)
+
+async def llm_review_stream(language: str, code: str, local_findings: Dict[str, Any]) -> AsyncIterator[Tuple[str, Any]]:
+    """流式审查：逐个产出 ("token", 文本增量)；每当 issues/smells/security 中的一个发现对象闭合，
+    立即产出 ("finding", {"category", "item"})；最后产出 ("result", 与 llm_review 相同结构的结果)。
+    超出单次输入上限的大文件走分块审查，只产出 result。"""
+    if len(code) > MAX_INPUT_CHARS:
+        yield "result", await _chunked_review(language, code, local_findings)
+        return
+    messages = _build_messages(language, code, local_findings)
+    parts: List[str] = []
+    parser = JsonStreamParser()
+    t0 = time.perf_counter()
+    backends = _get_backends()
+    failed: List[str] = []
+    # 流式不对冲（增量已转发给客户端）；首个 token 之前出错则转向下一个后端
+    for i, backend in enumerate(backends):
+        try:
+            async for delta in backend.stream(messages):
+                parts.append(delta)
+                yield "token", delta
+                for category, item in parser.feed(delta):
+                    yield "finding", {"category": category, "item": item}
+            break
+        except Exception:
+            if parts or i == len(backends) - 1:
+                raise
+            failed.append(backend.name)
+            LLM_FAILOVERS.inc(backend.name)
+    observe_stage("llm_request", time.perf_counter() - t0)
+    content = "".join(parts)
+    # 增量解析已得到根对象，结果整理不再重复解析
+    root = parser.close()
+    result = await _parse(content, root, parser.truncated)
+    result["meta"].update(_answer_meta({"backend": backend.name, "hedged": False, "failed": failed}))
+    yield "result", result
+
+def _postprocess(content: str, parsed: Optional[Dict[str, Any]] = None, parser_truncated: bool = False) -> Dict[str, Any]:
+    """解析模型输出；meta.stages 为各阶段耗时（秒），由调用方取出记录（可能运行在子进程中）。
+    流式审查已边收边解析时传入 parsed/parser_truncated，不再重复解析。"""
+    logger.debug("LLM原始响应: %s", content)
+    t0 = time.perf_counter()
+
+    # 先解析顶层 JSON（单遍，截断/尾随逗号在解析中恢复）
+    if parsed is None:
+        parsed, parser_truncated = parse_reply_ex(content)
+    if parsed is None:
+        logger.info("顶层JSON解析失败: 未找到 JSON 对象")
         content_json = {"suggestions_markdown": content}
+    else:
+        content_json = parsed
 
     # 确保必要字段存在
     for k in ("issues", "smells", "security"):
@@ -440,14 +431,16 @@ async def llm_review(language: str, code: str, local_findings: Dict[str, Any]) -
     
     # 处理 suggestions_markdown - 关键修复！
     raw_suggestions = content_json.get("suggestions_markdown", "")
+    if not isinstance(raw_suggestions, str):
+        raw_suggestions = ""
     
     # 检查是否被截断 - 更严格的检测
    
-    is_truncated = detect_truncation(raw_suggestions)
+    is_truncated = parser_truncated or detect_truncation(raw_suggestions)
    
         
     if is_truncated:
-        print("检测到截断，添加提示...")
+        logger.info("检测到截断，添加提示")
         # 保留原始内容，但添加提示
         content_json["suggestions_markdown"] = raw_suggestions + "\n\n---\n**注意**: 响应可能被截断，建议:\n1. 减少代码长度\n2. 分模块分析\n3. 检查API的token限制设置"
     else:
@@ -461,44 +454,31 @@ async def llm_review(language: str, code: str, local_findings: Dict[str, Any]) -
         try:
             inner_data = _extract_inner_from_sugg(raw_suggestions_content)
         except Exception as e:
-            print(f"内层JSON提取失败: {e}")
+            logger.info("内层JSON提取失败: %s", e)
             inner_data = None
 
     # 合并数据
     if inner_data:
-        def dedup(lst):
-            seen = set()
-            out = []
-            for x in lst or []:
-                k = (x.get("rule_id"), x.get("message"), x.get("start_line"), x.get("end_line"))
-                if k in seen:
-                    continue
-                seen.add(k)
-                out.append(x)
-            return out
-        
-        # 合并数组数据
-        content_json["issues"] = dedup((content_json.get("issues") or []) + (inner_data.get("issues") or []))
-        content_json["smells"] = dedup((content_json.get("smells") or []) + (inner_data.get("smells") or []))
-        content_json["security"] = dedup((content_json.get("security") or []) + (inner_data.get("security") or []))
+        # 合并数组数据；去重在生成报告时统一做一遍（services/report.py）
+        for k in ("issues", "smells", "security"):
+            content_json[k] = (content_json.get(k) or []) + (inner_data.get(k) or [])
         
         # 只有当内层的suggestions_markdown更完整时才使用
         inner_suggestions = inner_data.get("suggestions_markdown", "")
         if inner_suggestions and len(inner_suggestions) > len(raw_suggestions_content):
             content_json["suggestions_markdown"] = inner_suggestions
 
-    # 深度清理和修复Markdown
-    final_suggestions = content_json.get("suggestions_markdown", "")
-    final_suggestions = deep_clean_markdown(final_suggestions)
-    final_suggestions = fix_broken_markdown(final_suggestions)
-    final_suggestions = _normalize_md(final_suggestions)
+    t1 = time.perf_counter()
+    # 单遍规范化 Markdown（反转义、围栏修复、补齐未闭合代码块）
+    final_suggestions = normalize_markdown(content_json.get("suggestions_markdown", ""))
     content_json["suggestions_markdown"] = final_suggestions
 
     # 添加元数据
     content_json["meta"] = {
         "llm": True,
         "truncated": is_truncated,
-        "provider": PROVIDER
+        "provider": PROVIDER,
+        "stages": {"json_extract": t1 - t0, "markdown_normalize": time.perf_counter() - t1},
     }
 
     return content_json
\ No newline at end of file
@@ -0,0 +1,161 @@
+# app/services/md_normalize.py
+import re
+from typing import List
+
+# 反斜杠串 + 可选的被转义字符（\n \t \" \'，也覆盖 \\n 这类多层转义）
+_ESCAPE = re.compile(r"(\\+)([nt\"'])?")
+_UNESCAPED = {"n": "\n", "t": "\t", '"': '"', "'": "'"}
+_SIMPLE = tuple(("\\" * k + c, ch) for k in (2, 1) for c, ch in _UNESCAPED.items())
+_FENCE = "```"
+
+def _collapse(k: int) -> int:
+    """孤立反斜杠串：每 4 个折叠为 1 个（两层转义各一次）"""
+    k = k // 4 + k % 4
+    return k // 4 + k % 4
+
+def _unescape_match(m: "re.Match") -> str:
+    c = m.group(2)
+    if c:
+        return _UNESCAPED[c]
+    return "\\" * _collapse(len(m.group(1)))
+
+def _unescape(text: str) -> str:
+    if "\\\\\\" in text:
+        return _ESCAPE.sub(_unescape_match, text)
+    # 常见情形：反斜杠串不超过 2 个，此时先替换双层、再替换单层转义与逐串判断等价，
+    # 且替换结果不含反斜杠、不会组成新的转义，用 C 实现的 str.replace 更快
+    for esc, ch in _SIMPLE:
+        if esc in text:
+            text = text.replace(esc, ch)
+    return text
+
+class MarkdownNormalizer:
+    """单遍、可流式的 LLM 建议 Markdown 规范化状态机。
+
+    逐块 feed(文本) 返回已可输出的规范化文本，close() 返回剩余部分；输出拼接结果与一次性
+    normalize_markdown(全文) 相同。每块依次经过三个线性阶段，任何字符都不会被回扫：
+
+    1. 反转义：\\n \\t \\" \\'（含多层转义）还原；孤立反斜杠串每 4 个折叠为 1 个。
+       块末尾的反斜杠串暂存，与下一块一起判断；\\r\\n 统一为 \\n；
+    2. 按行切分：未结束的行暂存；
+    3. 围栏状态机：代码块外的行去掉首尾空白、丢弃空行；以 ``` 开头的行开启代码块（保留语言标记），
+       块内原样输出，再次遇到 ``` 开头的行即闭合为 ```；仅含空行的裸 ``` 代码块整体丢弃；
+       结束时仍未闭合的代码块自动补 ```。
+    """
+
+    def __init__(self):
+        self._carry = ""              # 块末尾尚未判断的反斜杠串 / \r
+        self._line_carry = ""         # 尚未结束的行
+        self._in_code = False
+        self._pending: List[str] = []  # 裸 ``` 之后暂存的空行（待判断是否为空代码块）
+        self._pending_open = False
+        self._started = False          # 是否已输出过行（决定是否需要换行分隔）
+
+    def feed(self, chunk: str) -> str:
+        if not chunk:
+            return ""
+        text = self._carry + chunk
+        self._carry = ""
+        if "\r" in text:
+            # 末尾的 \r 可能与下一块的 \n 组成 \r\n
+            if text[-1] == "\r":
+                text, self._carry = text[:-1], "\r"
+            text = text.replace("\r\n", "\n")
+        if "\\" in text:
+            # 末尾的反斜杠串可能与下一块的首字符组成转义
+            tail = len(text) - len(text.rstrip("\\"))
+            if tail:
+                text, self._carry = text[:-tail], text[-tail:] + self._carry
+            text = _unescape(text)
+        if "\n" not in text:
+            self._line_carry += text
+            return ""
+        lines = (self._line_carry + text).split("\n")
+        self._line_carry = lines.pop()
+        out: List[str] = []
+        append = out.append
+        in_code = self._in_code
+        for line in lines:
+            if self._pending_open or _FENCE in line:
+                self._in_code = in_code
+                self._line(line, out)
+                in_code = self._in_code
+            elif in_code:
+                append(line)
+            else:
+                line = line.strip()
+                if line:
+                    append(line)
+        self._in_code = in_code
+        return self._emit(out)
+
+    def close(self) -> str:
+        out: List[str] = []
+        if self._carry:
+            tail = self._carry.rstrip("\r")
+            self._line_carry += "\\" * _collapse(len(tail)) + self._carry[len(tail):]
+            self._carry = ""
+        # 与 split("\n") 一致：最后一段（即使为空）也算一行
+        self._line(self._line_carry, out)
+        self._line_carry = ""
+        if self._pending_open:
+            self._flush_pending(out)
+        if self._in_code:
+            out.append(_FENCE)
+            self._in_code = False
+        return self._emit(out)
+
+    def _emit(self, out: List[str]) -> str:
+        if not out:
+            return ""
+        s = "\n".join(out)
+        if self._started:
+            return "\n" + s
+        self._started = True
+        return s
+
+    def _flush_pending(self, out: List[str]):
+        out.append(_FENCE)
+        out.extend(self._pending)
+        self._pending = []
+        self._pending_open = False
+        self._in_code = True
+
+    def _line(self, line: str, out: List[str]):
+        stripped = line.strip()
+        if self._pending_open:
+            if not stripped:
+                self._pending.append(line)
+                return
+            if stripped == _FENCE:
+                # 裸 ``` + 空行 + ```：空代码块，整体丢弃
+                self._pending = []
+                self._pending_open = False
+                return
+            if stripped.startswith(_FENCE):
+                # 空的裸代码块后紧跟新的代码块：丢弃空块，按新围栏处理
+                self._pending = []
+                self._pending_open = False
+            else:
+                self._flush_pending(out)
+        if self._in_code:
+            if stripped.startswith(_FENCE):
+                out.append(_FENCE)
+                self._in_code = False
+            else:
+                out.append(line)
+        elif stripped.startswith(_FENCE):
+            if stripped == _FENCE:
+                self._pending_open = True
+            else:
+                out.append(stripped)
+                self._in_code = True
+        elif stripped:
+            out.append(stripped)
+
+def normalize_markdown(text: str) -> str:
+    """一次性规范化整段 Markdown（空文本返回空串）"""
+    if not text:
+        return ""
+    n = MarkdownNormalizer()
+    return n.feed(text) + n.close()
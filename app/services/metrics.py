@@ -0,0 +1,153 @@
+# app/services/metrics.py
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 关闭后仍记录单请求耗时（meta.timings），只是不再聚合直方图/计数器
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") in ("1", "true", "True")
+
+_REGISTRY: List["_Metric"] = []
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        _REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, n: float = 1):
+        if METRICS_ENABLED:
+            self.values[labels] = self.values.get(labels, 0) + n
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {v:g}" for k, v in sorted(self.values.items())]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, n: float = 1):
+        self.inc(*labels, n=-n)
+
+    def set(self, value: float, *labels: str):
+        if METRICS_ENABLED:
+            self.values[labels] = value
+
+class Histogram(_Metric):
+    """累计桶直方图：observe 只做一次二分查找与两次加法"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...], labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple[str, ...], list] = {}  # labels -> [各桶计数..., +Inf 计数, sum]
+
+    def observe(self, value: float, *labels: str):
+        if not METRICS_ENABLED:
+            return
+        s = self.series.get(labels)
+        if s is None:
+            s = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        s[bisect_left(self.buckets, value)] += 1
+        s[-1] += value
+
+    def _samples(self) -> List[str]:
+        out = []
+        for labels, s in sorted(self.series.items()):
+            acc = 0
+            for b, c in zip(self.buckets + (float("inf"),), s[:-1]):
+                acc += c
+                le = 'le="+Inf"' if b == float("inf") else f'le="{b:g}"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, le)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {s[-1]:g}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {acc}")
+        return out
+
+def render() -> str:
+    """Prometheus 文本格式（text/plain; version=0.0.4）"""
+    lines: List[str] = []
+    for m in _REGISTRY:
+        lines += m.render()
+    return "\n".join(lines) + "\n"
+
+_SECONDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+STAGE_SECONDS = Histogram("scr_stage_seconds", "Time spent per analysis stage", _SECONDS, ("stage",))
+REQUESTS = Counter("scr_requests_total", "Analysis requests by endpoint", ("endpoint",))
+INPUT_BYTES = Histogram("scr_input_bytes", "Size of submitted source code in bytes", _BYTES, ("language",))
+CACHE_LOOKUPS = Counter("scr_cache_lookups_total", "Result cache lookups by tier (memory/sqlite/miss)", ("tier",))
+LLM_RETRIES = Counter("scr_llm_retries_total", "Provider call retries by reason", ("provider", "reason"))
+LLM_FAILURES = Counter("scr_llm_failures_total", "LLM reviews that fell back to local-only results", ("provider",))
+PROMPT_TOKENS = Histogram("scr_prompt_tokens", "Estimated tokens per LLM prompt (system + user)",
+                          (500, 1000, 2000, 4000, 6000, 8000, 12000, 16000, 32000))
+LLM_INFLIGHT = Gauge("scr_llm_inflight", "Provider HTTP calls currently in flight", ("provider",))
+LLM_REJECTED = Counter("scr_llm_rejected_total", "Provider calls rejected without sending (circuit_open/rate_limited)",
+                       ("provider", "reason"))
+LLM_CIRCUIT_OPEN = Gauge("scr_llm_circuit_open", "1 while the provider circuit breaker is open", ("provider",))
+
+class Timings:
+    """单个请求的分阶段耗时（同名阶段累加，如分块审查的多次调用）"""
+    __slots__ = ("stages",)
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def to_dict(self) -> Dict[str, float]:
+        """毫秒，保留 3 位小数"""
+        return {k: round(v * 1000, 3) for k, v in self.stages.items()}
+
+_current: ContextVar[Optional[Timings]] = ContextVar("scr_timings", default=None)
+
+def start_request() -> Timings:
+    """为当前请求（当前 asyncio 任务的上下文）开启计时；其后创建的子任务共享同一个 Timings"""
+    t = Timings()
+    _current.set(t)
+    return t
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage)
+    t = _current.get()
+    if t is not None:
+        t.add(stage, seconds)
+
+def record_stages(stages: Dict[str, float]):
+    """记录在工作池（线程/进程）中测得的阶段耗时（秒）"""
+    for stage, seconds in stages.items():
+        observe_stage(stage, seconds)
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - t0)
@@ -0,0 +1,73 @@
+# app/services/report.py
+import json
+from typing import Dict, Any, List, Optional
+
+from app.analyzers.common import Finding
+
+try:
+    import orjson  # 可选：pip install orjson，序列化快数倍
+except ImportError:
+    orjson = None
+
+CATS = ("issues", "smells", "security")
+
+def merge_findings(*sources: Optional[Dict[str, Any]]) -> Dict[str, List[Finding]]:
+    """按来源顺序合并各分类的发现，单遍去重（跨来源、同来源内重复均只保留首次出现）"""
+    out: Dict[str, List[Finding]] = {}
+    from_dict = Finding.from_dict
+    for cat in CATS:
+        seen = set()
+        kept: List[Finding] = []
+        for src in sources:
+            for it in (src or {}).get(cat) or ():
+                f = from_dict(it)
+                if f is None or f.key in seen:
+                    continue
+                seen.add(f.key)
+                kept.append(f)
+        out[cat] = kept
+    return out
+
+def build_report(local: Dict[str, Any], llm: Optional[Dict[str, Any]], suggestions_md: str, enable_llm: bool) -> Dict[str, Any]:
+    """合并本地与 LLM 结果并去重（在工作池中执行，返回普通 dict，字段同 AnalyzeResponse）"""
+    merged = merge_findings(local, llm)
+    resp: Dict[str, Any] = {cat: [f.to_dict() for f in merged[cat]] for cat in CATS}
+    resp["suggestions_markdown"] = suggestions_md or "- 暂无额外建议"
+    resp["meta"] = {"llm": enable_llm}
+    return resp
+
+def dumps(obj: Any) -> bytes:
+    """响应体序列化：有 orjson 时使用，否则退回标准库（紧凑分隔符、保留中文）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+SNIPPET_MODES = ("full", "table", "none")
+
+def shape_snippets(resp: Dict[str, Any], mode: str) -> Dict[str, Any]:
+    """按请求的 snippets 模式改写报告（返回新 dict，不改动缓存中的对象）：
+
+    - full：原样返回；
+    - table：相同片段只保留一份，放在顶层 snippets 列表，发现中以 snippet_ref（下标）引用；
+    - none：去掉 snippet，客户端按 start_line/end_line 从源码截取。
+    """
+    if mode == "full" or mode not in SNIPPET_MODES:
+        return resp
+    out = dict(resp)
+    index: Dict[str, int] = {}
+    for cat in CATS:
+        items = []
+        for it in resp.get(cat) or ():
+            snippet = it.get("snippet")
+            if "snippet" in it:
+                it = {k: v for k, v in it.items() if k != "snippet"}
+            if mode == "table" and snippet:
+                ref = index.get(snippet)
+                if ref is None:
+                    ref = index[snippet] = len(index)
+                it["snippet_ref"] = ref
+            items.append(it)
+        out[cat] = items
+    if mode == "table":
+        out["snippets"] = list(index)
+    return out
@@ -0,0 +1,40 @@
+"""分块审查的行号回归检查：LLM 在非首块中返回字符串 / 浮点行号（"12"、12.0）时，合并报告中的行号必须是
+整文件的绝对行号，与返回整数时一致。
+
+    python -m benchmarks.chunk_lines          # 有失败项时退出码 1
+"""
+import sys
+from typing import Any, List
+
+from app.services.chunking import make_chunks, merge_chunk_results
+from app.services.report import build_report
+from benchmarks.corpus import python_corpus
+
+FORMS = (("int", lambda n: n), ("str", str), ("float", float), ("padded", lambda n: f" {n} "))
+
+def main():
+    code = python_corpus(3000, dup=0.0, vuln=0.0, seed=1)
+    chunks = make_chunks(code, "python", budget=4000)
+    failures: List[str] = []
+    if len(chunks) < 3:
+        failures.append(f"语料只切出 {len(chunks)} 块，无法覆盖非首块")
+    for name, form in FORMS:
+        results = []
+        for k, c in enumerate(chunks):
+            rel = min(3, c.end_line - c.start_line + 1)
+            item: Any = {"rule_id": "LLM.CHECK", "severity": "low", "message": f"chunk {k}",
+                         "start_line": form(rel), "end_line": form(rel)}
+            results.append({"issues": [item], "suggestions_markdown": ""})
+        report = build_report({}, merge_chunk_results(chunks, results), "", True)
+        got = {it["message"]: it["start_line"] for it in report["issues"]}
+        for k, c in enumerate(chunks):
+            want = c.start_line + min(3, c.end_line - c.start_line + 1) - 1
+            if got.get(f"chunk {k}") != want:
+                failures.append(f"{name}: 第 {k} 块的发现行号为 {got.get(f'chunk {k}')}，应为 {want}")
+    for f in failures:
+        print(f"FAIL {f}")
+    print(f"{len(chunks)} chunks, {len(FORMS)} forms: " + ("ok" if not failures else f"{len(failures)} failure(s)"))
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
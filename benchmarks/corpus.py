@@ -0,0 +1,116 @@
+"""合成语料：Python/Java 源码（可调重复块密度、漏洞密度）与模拟的 LLM 输出。
+
+同一 (lines, dup, vuln, seed) 总是生成同样的文本，便于基线对比。
+"""
+import json
+import random
+from typing import List
+
+PY_VULN = [
+    "    f = open('log_{n}.txt', 'a')",
+    "    cur.execute(\"SELECT * FROM t WHERE id=\" + user)",
+    "    os.system('echo ' + user)",
+    "    token = random.randint(1, {n})",
+]
+PY_SAFE = [
+    "    data = request.get('payload_{n}')",
+    "    if data and len(data) > {n}:\n        data = [x * 2 for x in data]",
+    "    total = sum(v for v in data if v)",
+    "    with open('cfg_{n}.txt') as fh:\n        cfg = fh.read()",
+    "    name = str(user).strip().lower()",
+]
+JAVA_VULN = [
+    "        FileInputStream in{n} = new FileInputStream(path);",
+    "        st.executeQuery(\"SELECT * FROM t WHERE id=\" + id);",
+    "        Scanner sc{n} = new Scanner(System.in);",
+]
+JAVA_SAFE = [
+    "        int v{n} = Math.max(limit, {n});",
+    "        if (name != null && name.length() > {n}) {{\n            name = name.trim();\n        }}",
+    "        try (BufferedReader br = new BufferedReader(new FileReader(path))) {{\n            br.readLine();\n        }}",
+    "        List<String> xs{n} = new ArrayList<>();",
+    "        PreparedStatement ps{n} = conn.prepareStatement(\"SELECT 1 FROM t WHERE id = ?\");",
+]
+
+def _body(rnd: random.Random, n: int, vuln: float, vuln_stmts: List[str], safe_stmts: List[str]) -> List[str]:
+    # 少量函数刻意写长，覆盖过长函数检测
+    count = rnd.randint(4, 14) if rnd.random() > 0.03 else rnd.randint(30, 45)
+    out: List[str] = []
+    for _ in range(count):
+        pool = vuln_stmts if rnd.random() < vuln else safe_stmts
+        out.extend(rnd.choice(pool).format(n=n).split("\n"))
+    return out
+
+def python_corpus(lines: int, dup: float = 0.1, vuln: float = 0.1, seed: int = 0) -> str:
+    """约 lines 行合法 Python；dup 为函数体整体复制自此前某函数的比例，vuln 为语句触发规则的比例"""
+    rnd = random.Random(seed)
+    out = ["import os", "import random", ""]
+    bodies: List[List[str]] = []
+    n = 0
+    while len(out) < lines:
+        if bodies and rnd.random() < dup:
+            body = rnd.choice(bodies)
+        else:
+            body = _body(rnd, n, vuln, PY_VULN, PY_SAFE)
+            bodies.append(body)
+        out.append(f"def handler_{n}(request, user, cur):")
+        out.extend(body)
+        out.extend(["    return None", ""])
+        n += 1
+    return "\n".join(out[:max(lines, 4)])
+
+def java_corpus(lines: int, dup: float = 0.1, vuln: float = 0.1, seed: int = 0) -> str:
+    """约 lines 行 Java，每个类 20 个方法；参数含义同 python_corpus"""
+    rnd = random.Random(seed)
+    out: List[str] = []
+    bodies: List[List[str]] = []
+    n = 0
+    while len(out) < lines:
+        out.append(f"public class Gen{n} {{")
+        for _ in range(20):
+            if bodies and rnd.random() < dup:
+                body = rnd.choice(bodies)
+            else:
+                body = _body(rnd, n, vuln, JAVA_VULN, JAVA_SAFE)
+                bodies.append(body)
+            out.append(f"    public void handle{n}(Connection conn, Statement st, String path, String name, int id, int limit) throws Exception {{")
+            out.extend(body)
+            out.extend(["    }", ""])
+            n += 1
+        out.append("}")
+    return "\n".join(out)
+
+def suggestions_markdown(lines: int, seed: int = 0) -> str:
+    """带标题、列表、代码块与多层转义的建议 Markdown（模拟模型输出中的常见畸形）"""
+    rnd = random.Random(seed)
+    out: List[str] = ["# 安全修复建议\\n\\n"]
+    k = 0
+    while len(out) < lines:
+        k += 1
+        out.append(f"## {k}. 问题 {k}：SQL 拼接\\\\n")
+        out.append(f"  - 建议使用参数化查询，避免注入（第 {rnd.randint(1, 500)} 行）  ")
+        out.append("```python")
+        for j in range(rnd.randint(2, 6)):
+            out.append(f"    cur.execute(\\\"SELECT * FROM t WHERE id=%s\\\", (uid_{j},))")
+        out.append("```" if rnd.random() > 0.1 else "")
+        out.append("")
+    return "\n".join(out)
+
+def llm_response(findings: int, md_lines: int, seed: int = 0) -> str:
+    """完整、合法的 LLM JSON 输出（外层带说明文字与 ```json 围栏）"""
+    rnd = random.Random(seed)
+    cats = {"issues": [], "smells": [], "security": []}
+    for k in range(findings):
+        cat = rnd.choice(list(cats))
+        line = rnd.randint(1, 5000)
+        cats[cat].append({"rule_id": f"LLM.R{k % 37}", "severity": rnd.choice(["low", "medium", "high"]),
+                          "message": f"第 {k} 条发现：可能的问题描述", "start_line": line, "end_line": line + 2,
+                          "snippet": "cur.execute(\"SELECT * FROM t WHERE id=\" + uid)"})
+    doc = dict(cats, suggestions_markdown=suggestions_markdown(md_lines, seed))
+    return "以下为审查结果：\n```json\n" + json.dumps(doc, ensure_ascii=False, indent=2) + "\n```\n"
+
+def broken_llm_response(findings: int, md_lines: int, seed: int = 0) -> str:
+    """被截断的 LLM 输出：在 security 数组中途断开，需要抢救式解析"""
+    text = llm_response(findings, md_lines, seed)
+    cut = text.rfind('"rule_id"')
+    return text[:cut if cut > 0 else len(text) // 2]
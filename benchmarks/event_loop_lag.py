@@ -0,0 +1,98 @@
+"""事件循环延迟基准：对比本地分析内联执行（改造前）与放入线程池/进程池（改造后）。
+
+混合负载：若干并发的大文件分析请求 + 一个每 5ms 唤醒一次的探针协程（模拟 /health 等轻量请求），
+统计探针实际唤醒时间相对预期的延迟分布。
+
+    python -m benchmarks.event_loop_lag --lines 20000 --requests 16
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from app.services.executor import run_local
+
+BODY = [
+    "    data = request.get('payload')",
+    "    f = open('log_{n}.txt', 'a')",
+    "    cur.execute(\"SELECT * FROM t WHERE id=\" + user)",
+    "    if data and len(data) > {n}:\n        return [x * 2 for x in data]",
+    "    os.system('echo ' + user)",
+    "    token = random.randint(1, {n})",
+    "    total = sum(v for v in data if v)",
+]
+
+def make_code(lines: int, seed: int = 0) -> str:
+    """生成语法合法的 Python 源码（约 lines 行），函数体随机混入会触发规则的语句"""
+    rnd = random.Random(seed)
+    out = ["import os", "import random", ""]
+    n = 0
+    while len(out) < lines:
+        out.append(f"def handler_{n}(request, user):")
+        for _ in range(rnd.randint(3, 12)):
+            out.extend(rnd.choice(BODY).format(n=n).split("\n"))
+        out.extend(["    return None", ""])
+        n += 1
+    return "\n".join(out)
+
+async def _probe(stop: asyncio.Event, lags: list, interval: float = 0.005):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - t - interval)
+
+async def _run(mode: str, code: str, requests: int, workers: int):
+    loop = asyncio.get_running_loop()
+    executor = None
+    if mode == "thread":
+        executor = ThreadPoolExecutor(max_workers=workers)
+    elif mode == "process":
+        executor = ProcessPoolExecutor(max_workers=workers)
+        # 预热进程，避免把进程启动时间计入
+        await asyncio.gather(*[loop.run_in_executor(executor, run_local, "python", "x = 1") for _ in range(workers)])
+
+    async def one():
+        await asyncio.sleep(random.random() * 0.05)
+        if executor is None:
+            return run_local("python", code)
+        return await loop.run_in_executor(executor, run_local, "python", code)
+
+    stop, lags = asyncio.Event(), []
+    probe = asyncio.create_task(_probe(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(requests)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    if executor is not None:
+        executor.shutdown()
+    lags.sort()
+    ms = lambda x: round(x * 1000, 2)
+    return {
+        "mode": mode,
+        "wall_s": round(elapsed, 3),
+        "probe_samples": len(lags),
+        "lag_p50_ms": ms(statistics.median(lags)) if lags else None,
+        "lag_p99_ms": ms(lags[int(len(lags) * 0.99)]) if lags else None,
+        "lag_max_ms": ms(lags[-1]) if lags else None,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--lines", type=int, default=20000)
+    ap.add_argument("--requests", type=int, default=16)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--modes", default="inline,thread,process")
+    args = ap.parse_args()
+
+    code = make_code(args.lines)
+    print(f"{'mode':<8} {'wall_s':>8} {'samples':>8} {'p50_ms':>8} {'p99_ms':>8} {'max_ms':>8}")
+    for mode in args.modes.split(","):
+        r = asyncio.run(_run(mode, code, args.requests, args.workers))
+        print(f"{r['mode']:<8} {r['wall_s']:>8} {r['probe_samples']:>8} {r['lag_p50_ms']:>8} {r['lag_p99_ms']:>8} {r['lag_max_ms']:>8}")
+
+if __name__ == "__main__":
+    main()
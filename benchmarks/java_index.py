@@ -0,0 +1,74 @@
+"""Java 结构索引的规模测试：不同行数下建索引与全部 Java 规则的耗时、峰值内存，检查是否线性增长。
+
+    python -m benchmarks.java_index --lines 12500 25000 50000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from app.analyzers.java_index import build_index
+from app.analyzers.java_static import analyze_index
+
+METHOD = '''    /** 第 {k} 个方法，注释里的 new Scanner(System.in) 不应被计入 */
+    @SuppressWarnings("unchecked")
+    public List<String> handle{k}(Connection conn, String name,
+                                  int limit) throws SQLException {{
+        List<String> out = new ArrayList<>();
+        try (BufferedReader br =
+                 new BufferedReader(new FileReader("f{k}.txt"))) {{
+            String line = br.readLine();
+            out.add(line == null ? "{{}}" : line);
+        }}
+        String sql = "SELECT * FROM t{k} WHERE name = '" + name + "'";
+        Statement st = conn.createStatement();
+        for (int i = 0; i < limit; i++) {{
+            out.forEach(s -> {{ if (s.isEmpty()) {{ return; }} }});
+        }}
+        st.executeQuery(sql);
+        return out;
+    }}
+'''
+
+def make_java(lines: int, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    parts, n, k = [], 0, 0
+    while n < lines:
+        parts.append(f"public class Gen{k} {{\n    private int counter = {rnd.randint(0, 9)};\n\n")
+        for _ in range(20):
+            body = METHOD.format(k=k)
+            parts.append(body)
+            n += body.count("\n")
+            k += 1
+        parts.append("}\n")
+        n += 4
+    return "".join(parts)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lines", type=int, nargs="+", default=[12500, 25000, 50000])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"{'lines':>8} {'index ms':>10} {'rules ms':>10} {'us/line':>9} {'peak KiB':>10} {'methods':>8}")
+    for n in args.lines:
+        code = make_java(n)
+        real = code.count("\n")
+        best_idx = best_rules = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            idx = build_index(code)
+            t1 = time.perf_counter()
+            analyze_index(idx)
+            t2 = time.perf_counter()
+            best_idx, best_rules = min(best_idx, t1 - t0), min(best_rules, t2 - t1)
+        tracemalloc.start()
+        build_index(code)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        total = best_idx + best_rules
+        print(f"{real:>8} {best_idx * 1000:>10.1f} {best_rules * 1000:>10.1f} {total / real * 1e6:>9.2f} "
+              f"{peak / 1024:>10.0f} {len(idx.method_start):>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""LLM 不可用时的降级回归检查：/analyze、/analyze/stream、/analyze/batch 必须返回 200 和本地规则结果，
+并在建议中提示 LLM 调用失败（scr_llm_failures_total 随之增加），而不是 500。
+
+依次覆盖：Provider 地址不可达（连接被拒）→ 连续失败后熔断打开（meta.llm_unavailable）→ 缺少 API Key。
+
+    python -m benchmarks.llm_fallback          # 有失败项时退出码 1
+"""
+import json
+import os
+import socket
+import sys
+from typing import List
+
+def _closed_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# 须在导入 app.main 之前设置：连接池、缓存、熔断参数在导入时读取
+os.environ.update({
+    "LLM_PROVIDER": "deepseek", "LLM_BACKENDS": "deepseek", "DEEPSEEK_API_KEY": "sk-unreachable",
+    "DEEPSEEK_BASE_URL": f"http://127.0.0.1:{_closed_port()}/v1", "LLM_MAX_RETRIES": "0",
+    "LLM_BREAKER_FAILURES": "3", "LLM_BREAKER_COOLDOWN": "600",
+    "CACHE_ENABLED": "0", "JOBS_ENABLED": "0", "CLONE_INDEX_ENABLED": "0",
+})
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.services.metrics import LLM_FAILURES  # noqa: E402
+
+CODE = 'f = open("a.txt", "w")\nconn.execute("SELECT * FROM t WHERE id=" + uid)\n'
+NOTE = "LLM 调用失败"
+
+def _failures() -> float:
+    return sum(LLM_FAILURES.values.values())
+
+def check_report(name: str, resp: dict, failures: List[str]):
+    rules = {it["rule_id"] for cat in ("issues", "security") for it in resp.get(cat) or ()}
+    if not {"BUG.FILE_NOT_CLOSED", "SEC.SQLI"} <= rules:
+        failures.append(f"{name}: 缺少本地规则发现 {sorted(rules)}")
+    if NOTE not in resp.get("suggestions_markdown", ""):
+        failures.append(f"{name}: suggestions_markdown 中没有降级提示")
+
+def run(client: TestClient) -> List[str]:
+    failures: List[str] = []
+    body = {"language": "python", "code": CODE, "enable_llm": True}
+
+    def analyze(name: str) -> dict:
+        r = client.post("/analyze", json=body)
+        if r.status_code != 200:
+            failures.append(f"{name}: /analyze 返回 {r.status_code}")
+            return {}
+        check_report(name, r.json(), failures)
+        return r.json()
+
+    analyze("unreachable")
+
+    r = client.post("/analyze/stream", json=body)
+    events = [ln[len("event: "):] for ln in r.text.splitlines() if ln.startswith("event: ")]
+    if r.status_code != 200 or not events or events[-1] != "report":
+        failures.append(f"stream: 状态 {r.status_code}，事件 {events[-3:]}")
+    else:
+        data = [ln[len("data: "):] for ln in r.text.splitlines() if ln.startswith("data: ")]
+        check_report("stream", json.loads(data[-1]), failures)
+
+    r = client.post("/analyze/batch", json={"files": [{"path": "a.py", "code": CODE}], "enable_llm": True})
+    lines = [json.loads(ln) for ln in r.text.splitlines() if ln.strip()]
+    files = [ln for ln in lines if ln.get("type") == "file"]
+    if r.status_code != 200 or len(files) != 1 or files[0].get("error") or not files[0].get("result"):
+        failures.append(f"batch: 状态 {r.status_code}，输出 {lines[:2]}")
+    else:
+        check_report("batch", files[0]["result"], failures)
+
+    # 上面三次连接失败已使熔断打开：不再发出请求，仍降级并给出 llm_unavailable
+    resp = analyze("breaker_open")
+    if resp and "llm_unavailable" not in resp.get("meta", {}):
+        failures.append(f"breaker_open: meta 中没有 llm_unavailable {resp.get('meta')}")
+
+    os.environ.pop("DEEPSEEK_API_KEY")
+    analyze("missing_key")
+    return failures
+
+def main():
+    before = _failures()
+    with TestClient(app, raise_server_exceptions=False) as client:
+        failures = run(client)
+    if _failures() - before < 5:
+        failures.append(f"scr_llm_failures_total 只增加了 {_failures() - before}（应为 5）")
+    for f in failures:
+        print(f"FAIL {f}")
+    print(f"{'ok' if not failures else f'{len(failures)} failure(s)'}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""/analyze 压测：固定并发发送请求，统计吞吐、p50/p95/p99 延迟、HTTP 错误率、LLM 降级率与上游重试次数。
+
+配合 benchmarks.mock_llm 使用（见其说明），离线调整 LLM_MAX_RETRIES / LLM_BASE_BACKOFF / 并发上限：
+
+    python -m benchmarks.load_driver --url http://127.0.0.1:8000 --mock http://127.0.0.1:9100 \\
+        --requests 200 --concurrency 16 --lines 300
+
+每个请求的代码按序号生成不同内容，避免被结果缓存与 single-flight 合并；--same 则全部相同。
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.corpus import python_corpus, java_corpus
+
+def percentile(sorted_vals: List[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, math.ceil(p / 100 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+async def _mock_stats(client: httpx.AsyncClient, mock: Optional[str], reset: bool = False) -> Dict[str, int]:
+    if not mock:
+        return {}
+    try:
+        if reset:
+            await client.post(f"{mock}/_stats/reset")
+            return {}
+        return (await client.get(f"{mock}/_stats")).json()
+    except httpx.HTTPError:
+        return {}
+
+async def run(args) -> Dict[str, Any]:
+    gen = python_corpus if args.language == "python" else java_corpus
+    latencies: List[float] = []
+    outcomes: Counter = Counter()
+    queue: asyncio.Queue = asyncio.Queue()
+    for k in range(args.requests):
+        queue.put_nowait(k)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        await _mock_stats(client, args.mock, reset=True)
+
+        async def worker():
+            while True:
+                try:
+                    k = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                code = gen(args.lines, seed=0 if args.same else k)
+                body = {"language": args.language, "code": code, "enable_llm": not args.no_llm}
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post(f"{args.url}/analyze", json=body)
+                except httpx.HTTPError as e:
+                    outcomes[f"transport_{type(e).__name__}"] += 1
+                    continue
+                latencies.append(time.perf_counter() - t0)
+                if r.status_code != 200:
+                    outcomes[f"http_{r.status_code}"] += 1
+                    continue
+                data = r.json()
+                if "[LLM 调用失败" in (data.get("suggestions_markdown") or ""):
+                    outcomes["llm_fallback"] += 1
+                else:
+                    outcomes["ok"] += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+        elapsed = time.perf_counter() - t0
+        upstream = await _mock_stats(client, args.mock)
+
+    lat = sorted(latencies)
+    total = args.requests
+    http_errors = sum(v for k, v in outcomes.items() if k.startswith(("http_", "transport_")))
+    ok_upstream = upstream.get("status_200", 0)
+    return {
+        "requests": total,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {f"p{p}": round(percentile(lat, p) * 1000, 1) for p in (50, 95, 99)} | {"max": round(lat[-1] * 1000, 1) if lat else 0.0},
+        "error_rate": round(http_errors / total, 4) if total else 0.0,
+        "llm_fallback_rate": round(outcomes["llm_fallback"] / total, 4) if total else 0.0,
+        "outcomes": dict(outcomes),
+        # 上游请求数减去成功数即为被 429/5xx 拒绝、需要重试（或最终放弃）的次数
+        "upstream": upstream,
+        "upstream_retries": max(0, upstream.get("requests", 0) - ok_upstream) if upstream else None,
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:8000", help="被测后端")
+    ap.add_argument("--mock", default="http://127.0.0.1:9100", help="模拟 Provider（用于读取重试统计，留空则不读取）")
+    ap.add_argument("--requests", type=int, default=100)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--language", choices=("python", "java"), default="python")
+    ap.add_argument("--lines", type=int, default=200, help="每个请求的代码行数")
+    ap.add_argument("--same", action="store_true", help="所有请求使用相同代码（测缓存/合并）")
+    ap.add_argument("--no-llm", action="store_true", help="只测本地规则")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = ap.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    lat = report["latency_ms"]
+    print(f"requests={report['requests']} concurrency={report['concurrency']} elapsed={report['elapsed_s']}s "
+          f"throughput={report['throughput_rps']} req/s")
+    print(f"latency p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms max={lat['max']}ms")
+    print(f"error_rate={report['error_rate']:.2%} llm_fallback_rate={report['llm_fallback_rate']:.2%} outcomes={report['outcomes']}")
+    if report["upstream"]:
+        print(f"upstream={report['upstream']} retries={report['upstream_retries']}")
+
+if __name__ == "__main__":
+    main()
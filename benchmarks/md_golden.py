@@ -0,0 +1,77 @@
+"""Markdown 规范化的金标准对照：固定 normalize_markdown 的输出。
+
+golden_markdown.json 中的期望值由替换前的三段清理链（deep_clean_markdown → fix_broken_markdown →
+_normalize_md）生成；note 非空的用例是有意修正的旧行为，期望值为新实现的输出。
+每个用例既整段校验，也按随机大小分块喂给 MarkdownNormalizer 校验（模拟 token 流）：
+
+    python -m benchmarks.md_golden             # 校验，有不一致则退出码 1
+    python -m benchmarks.md_golden --update    # 有意改变行为后重写期望值（务必审阅 diff）
+"""
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+from app.services.md_normalize import MarkdownNormalizer, normalize_markdown
+from benchmarks.corpus import suggestions_markdown, llm_response
+
+GOLDEN = Path(__file__).with_name("golden_markdown.json")
+
+def case_input(case: Dict[str, Any]) -> str:
+    gen = case.get("gen")
+    if gen is None:
+        return case["input"]
+    if gen["kind"] == "suggestions":
+        return suggestions_markdown(gen["lines"], gen["seed"])
+    reply = llm_response(gen["findings"], gen["lines"], gen["seed"])
+    return json.loads(reply[reply.find("{"):reply.rfind("}") + 1])["suggestions_markdown"]
+
+def stream(text: str, rnd: random.Random, max_chunk: int) -> str:
+    n = MarkdownNormalizer()
+    out: List[str] = []
+    i = 0
+    while i < len(text):
+        k = rnd.randint(1, max_chunk)
+        out.append(n.feed(text[i:i + k]))
+        i += k
+    out.append(n.close())
+    return "".join(out)
+
+def check(cases: List[Dict[str, Any]], rounds: int) -> List[str]:
+    failures = []
+    for case in cases:
+        text = case_input(case)
+        if normalize_markdown(text) != case["expected"]:
+            failures.append(f"{case['name']}: 整段输出与期望不一致")
+            continue
+        for seed in range(rounds):
+            rnd = random.Random(seed)
+            if stream(text, rnd, rnd.choice((1, 4, 16, 64))) != case["expected"]:
+                failures.append(f"{case['name']}: 分块输出（seed={seed}）与整段输出不一致")
+                break
+    return failures
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--update", action="store_true", help="用当前实现重写期望值")
+    ap.add_argument("--rounds", type=int, default=20, help="每个用例的随机分块轮数")
+    args = ap.parse_args()
+
+    golden = json.loads(GOLDEN.read_text(encoding="utf-8"))
+    if args.update:
+        for case in golden["cases"]:
+            case["expected"] = normalize_markdown(case_input(case))
+        GOLDEN.write_text(json.dumps(golden, ensure_ascii=False, indent=1) + "\n", encoding="utf-8")
+        print(f"已更新 {len(golden['cases'])} 个用例 -> {GOLDEN}")
+        return
+
+    failures = check(golden["cases"], args.rounds)
+    for f in failures:
+        print(f)
+    print(f"{len(golden['cases']) - len(failures)}/{len(golden['cases'])} 通过")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""热点函数微基准：本地分析器、重复块/过长函数检测、LLM 输出解析与 Markdown 清理链。
+
+每个 (用例, 规模) 取多次运行的最好成绩，另用 tracemalloc 单独跑一次记录峰值内存。
+
+    python -m benchmarks.micro                                  # 默认规模 100/1k/10k/100k 行
+    python -m benchmarks.micro --out benchmarks/baseline.json    # 写基线
+    python -m benchmarks.micro --compare benchmarks/baseline.json --threshold 0.2
+                                                                # 任一用例耗时（或峰值内存）比基线高出 20% 以上即退出码 1
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.analyzers.common import duplicate_block_hash, long_function_detector
+from app.analyzers.java_static import analyze_java
+from app.analyzers.python_static import analyze_python
+from app.services.llm import _extract_json, _salvage_broken_json
+from app.services.md_normalize import MarkdownNormalizer, normalize_markdown
+from benchmarks.corpus import python_corpus, java_corpus, suggestions_markdown, llm_response, broken_llm_response
+
+def markdown_stream(s: str, chunk: int = 16) -> str:
+    """按 token 流大小分块喂给规范化状态机"""
+    n = MarkdownNormalizer()
+    out = [n.feed(s[k:k + chunk]) for k in range(0, len(s), chunk)]
+    out.append(n.close())
+    return "".join(out)
+
+def cases(lines: int, dup: float, vuln: float) -> List[Tuple[str, Callable[[], Any], int, str]]:
+    """(名称, 无参调用, 工作量, 单位)；工作量按行或按字节计"""
+    py = python_corpus(lines, dup, vuln)
+    java = java_corpus(lines, dup, vuln)
+    py_lines = py.splitlines()
+    findings = max(1, lines // 20)
+    resp = llm_response(findings, max(10, lines // 10))
+    broken = broken_llm_response(findings, max(10, lines // 10))
+    md = suggestions_markdown(lines)
+    return [
+        ("analyze_python", lambda: analyze_python(py), len(py_lines), "lines"),
+        ("analyze_java", lambda: analyze_java(java), java.count("\n") + 1, "lines"),
+        ("duplicate_block_hash", lambda: duplicate_block_hash(py_lines, window=6), len(py_lines), "lines"),
+        ("long_function_detector", lambda: long_function_detector(py_lines, threshold=50), len(py_lines), "lines"),
+        ("_extract_json", lambda: _extract_json(resp), len(resp.encode()), "bytes"),
+        ("_salvage_broken_json", lambda: _salvage_broken_json(broken), len(broken.encode()), "bytes"),
+        ("markdown_chain", lambda: normalize_markdown(md), len(md.encode()), "bytes"),
+        ("markdown_stream", lambda: markdown_stream(md), len(md.encode()), "bytes"),
+    ]
+
+def measure(fn: Callable[[], Any], min_time: float, max_repeat: int) -> Tuple[float, int]:
+    """重复执行直到累计 min_time 秒（至少 1 次），返回 (最好单次耗时, 次数)"""
+    best, total, n = float("inf"), 0.0, 0
+    while n < max_repeat and (n == 0 or total < min_time):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best, total, n = min(best, dt), total + dt, n + 1
+    return best, n
+
+def peak_memory(fn: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run(sizes: List[int], dup: float, vuln: float, min_time: float, max_repeat: int, only: List[str]) -> Dict[str, Any]:
+    results: Dict[str, Dict[str, Any]] = {}
+    for lines in sizes:
+        for name, fn, work, unit in cases(lines, dup, vuln):
+            if only and name not in only:
+                continue
+            fn()  # 预热（正则编译、引擎构建等一次性开销）
+            best, n = measure(fn, min_time, max_repeat)
+            peak = peak_memory(fn)
+            key = f"{name}@{lines}"
+            results[key] = {"seconds": best, "repeat": n, "work": work, "unit": unit,
+                            "throughput": work / best if best > 0 else 0.0, "peak_bytes": peak}
+            print(f"{key:<32} {best * 1000:>10.3f} ms {work / best if best > 0 else 0:>14,.0f} {unit}/s "
+                  f"{peak / 1024:>10.0f} KiB  (x{n})", flush=True)
+    return {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "sizes": sizes, "dup": dup, "vuln": vuln},
+        "results": results,
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float, mem_threshold: float) -> List[str]:
+    """返回超出阈值的用例说明；只比较两边都存在的用例"""
+    failures = []
+    print(f"\n{'case':<32} {'time':>9} {'memory':>9}")
+    for key, cur in current["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if not base:
+            continue
+        t_ratio = cur["seconds"] / base["seconds"] if base["seconds"] else 1.0
+        m_ratio = cur["peak_bytes"] / base["peak_bytes"] if base["peak_bytes"] else 1.0
+        flag = ""
+        if t_ratio > 1 + threshold:
+            flag += " TIME"
+            failures.append(f"{key}: 耗时 x{t_ratio:.2f}（阈值 x{1 + threshold:.2f}）")
+        if mem_threshold >= 0 and m_ratio > 1 + mem_threshold:
+            flag += " MEM"
+            failures.append(f"{key}: 峰值内存 x{m_ratio:.2f}（阈值 x{1 + mem_threshold:.2f}）")
+        print(f"{key:<32} {t_ratio:>8.2f}x {m_ratio:>8.2f}x{flag}")
+    return failures
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    ap.add_argument("--dup", type=float, default=0.1, help="函数体重复比例")
+    ap.add_argument("--vuln", type=float, default=0.1, help="触发规则的语句比例")
+    ap.add_argument("--min-time", type=float, default=0.2, help="每个用例累计运行的最少秒数")
+    ap.add_argument("--max-repeat", type=int, default=200)
+    ap.add_argument("--only", nargs="*", default=[], help="只运行指定用例")
+    ap.add_argument("--out", help="把结果写为 JSON 基线")
+    ap.add_argument("--compare", help="与已有 JSON 基线对比")
+    ap.add_argument("--threshold", type=float, default=0.2, help="允许的耗时回退比例")
+    ap.add_argument("--mem-threshold", type=float, default=-1, help="允许的峰值内存回退比例（负数表示不检查）")
+    args = ap.parse_args()
+
+    current = run(args.sizes, args.dup, args.vuln, args.min_time, args.max_repeat, args.only)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已写入 {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        failures = compare(current, baseline, args.threshold, args.mem_threshold)
+        if failures:
+            print("\n性能回退：\n  " + "\n  ".join(failures))
+            sys.exit(1)
+        print("\n未超出阈值")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""本地模拟 LLM Provider：兼容 OpenAI/DeepSeek 的 POST /v1/chat/completions（含 stream: true）。
+
+可配置延迟分布、429/5xx 注入（可带 retry-after）、截断与畸形 JSON 输出，用于离线压测 /analyze：
+
+    python -m benchmarks.mock_llm --port 9100 --latency lognormal:0.8,0.5 --p429 0.05 --p5xx 0.02 --retry-after 1
+    # 后端指向模拟服务
+    LLM_PROVIDER=openai OPENAI_BASE_URL=http://127.0.0.1:9100/v1 OPENAI_API_KEY=mock CACHE_ENABLED=0 \\
+        uvicorn app.main:app --port 8000
+
+GET /_stats 返回按状态码/输出类型的计数，POST /_stats/reset 清零（压测脚本用于统计重试次数）。
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.corpus import llm_response
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """延迟分布（秒）：const:0.5 / uniform:0.2,1.5 / exp:0.8（均值）/ lognormal:median,sigma（中位数秒数与对数标准差）"""
+    kind, _, args = spec.partition(":")
+    vals = [float(x) for x in args.split(",")] if args else []
+    if kind == "const":
+        return lambda rnd: vals[0]
+    if kind == "uniform":
+        return lambda rnd: rnd.uniform(vals[0], vals[1])
+    if kind == "exp":
+        return lambda rnd: rnd.expovariate(1.0 / vals[0])
+    if kind == "lognormal":
+        mu = math.log(vals[0])
+        return lambda rnd: rnd.lognormvariate(mu, vals[1])
+    raise ValueError(f"未知的延迟分布: {spec}")
+
+def malform(content: str, rnd: random.Random) -> str:
+    """制造模型常见的 JSON 畸形：尾随逗号、单引号、缺失右括号"""
+    kind = rnd.choice(("trailing_comma", "single_quote", "unclosed"))
+    if kind == "trailing_comma":
+        return content.replace("\n  ]", ",\n  ]", 1)
+    if kind == "single_quote":
+        return content.replace('"severity"', "'severity'", 1)
+    return content.replace("\n}", "\n", 1)
+
+def create_app(args) -> FastAPI:
+    app = FastAPI(title="Mock LLM Provider")
+    rnd = random.Random(args.seed)
+    latency = parse_latency(args.latency)
+    stats: Counter = Counter()
+
+    def make_content() -> Tuple[str, str]:
+        roll = rnd.random()
+        content = llm_response(rnd.randint(0, args.findings), args.md_lines, seed=rnd.randint(0, 1 << 30))
+        if roll < args.p_truncated:
+            return "truncated", content[:rnd.randint(len(content) // 4, len(content) * 3 // 4)]
+        if roll < args.p_truncated + args.p_malformed:
+            return "malformed", malform(content, rnd)
+        return "ok", content
+
+    def inject_error():
+        roll = rnd.random()
+        if roll < args.p429:
+            headers = {"retry-after": str(args.retry_after)} if args.retry_after > 0 else {}
+            return JSONResponse({"error": {"message": "rate limited", "type": "rate_limit"}}, status_code=429, headers=headers)
+        if roll < args.p429 + args.p5xx:
+            status = rnd.choice((500, 502, 503))
+            headers = {"retry-after": str(args.retry_after)} if status == 503 and args.retry_after > 0 else {}
+            return JSONResponse({"error": {"message": "upstream error", "type": "server_error"}}, status_code=status, headers=headers)
+        return None
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat(request: Request):
+        body: Dict[str, Any] = await request.json()
+        stats["requests"] += 1
+        err = inject_error()
+        if err is not None:
+            stats[f"status_{err.status_code}"] += 1
+            await asyncio.sleep(min(latency(rnd), 0.05))
+            return err
+        kind, content = make_content()
+        stats["status_200"] += 1
+        stats[f"content_{kind}"] += 1
+        model = body.get("model", "mock")
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency(rnd))
+            return {"id": f"mock-{stats['requests']}", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}
+
+        async def events():
+            # 首 token 延迟取自延迟分布，其后按 --tokens-per-sec 匀速输出（每块约 4 字符）
+            await asyncio.sleep(latency(rnd))
+            step = 4.0 / args.tokens_per_sec if args.tokens_per_sec > 0 else 0.0
+            for k in range(0, len(content), args.chunk_chars):
+                chunk = {"choices": [{"index": 0, "delta": {"content": content[k:k + args.chunk_chars]}}], "model": model}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                if step:
+                    await asyncio.sleep(step * args.chunk_chars / 4)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/_stats")
+    async def get_stats():
+        return dict(stats)
+
+    @app.post("/_stats/reset")
+    async def reset_stats():
+        stats.clear()
+        return {"ok": True}
+
+    return app
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--latency", default="lognormal:0.8,0.4", help="const:S / uniform:A,B / exp:MEAN / lognormal:MEDIAN,SIGMA（秒）")
+    ap.add_argument("--p429", type=float, default=0.0, help="返回 429 的概率")
+    ap.add_argument("--p5xx", type=float, default=0.0, help="返回 500/502/503 的概率")
+    ap.add_argument("--retry-after", type=float, default=0, help="429/503 携带的 retry-after 秒数（0 表示不带）")
+    ap.add_argument("--p-truncated", type=float, default=0.0, help="输出被截断的概率")
+    ap.add_argument("--p-malformed", type=float, default=0.0, help="输出为畸形 JSON 的概率")
+    ap.add_argument("--findings", type=int, default=8, help="每次输出的最多发现数")
+    ap.add_argument("--md-lines", type=int, default=40, help="suggestions_markdown 行数")
+    ap.add_argument("--tokens-per-sec", type=float, default=400, help="流式输出速度（0 表示不限速）")
+    ap.add_argument("--chunk-chars", type=int, default=16, help="流式输出每个增量的字符数")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
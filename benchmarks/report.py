@@ -0,0 +1,112 @@
+"""报告合并与响应序列化基准：大量发现（默认 1 万条）时，旧路径与新路径的耗时对比。
+
+旧路径（改造前）：LLM 结果内去重 → 合并后再次去重 → 每条 Issue(**x) 校验 → model_dump
+              → response_model 再校验一遍 → JSON 序列化。
+新路径：Finding 单遍去重（键预先算好）→ to_dict → 直接序列化（orjson 可用时使用）。
+
+    python -m benchmarks.report                      # 1 万条发现，本地/LLM 各半，20% 重复
+    python -m benchmarks.report --findings 50000 --dup 0.5
+"""
+import argparse
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from app.services.report import CATS, build_report, dumps, orjson
+
+class Issue(BaseModel):
+    rule_id: str
+    severity: str
+    message: str
+    start_line: Optional[int] = None
+    end_line: Optional[int] = None
+    snippet: Optional[str] = None
+
+class AnalyzeResponse(BaseModel):
+    issues: List[Issue]
+    smells: List[Issue]
+    security: List[Issue]
+    suggestions_markdown: str
+    meta: Dict[str, Any] = {}
+
+def _dedup(lst):
+    seen, out = set(), []
+    for it in lst:
+        k = (it.get("rule_id"), it.get("message"), it.get("start_line"), it.get("end_line"))
+        if k in seen:
+            continue
+        seen.add(k)
+        out.append(it)
+    return out
+
+def legacy(local: Dict[str, Any], llm: Dict[str, Any], md: str) -> bytes:
+    llm = {k: _dedup(llm.get(k, [])) for k in CATS}
+    resp = AnalyzeResponse(
+        issues=[Issue(**x) for x in _dedup(local.get("issues", []) + llm.get("issues", []))],
+        smells=[Issue(**x) for x in _dedup(local.get("smells", []) + llm.get("smells", []))],
+        security=[Issue(**x) for x in _dedup(local.get("security", []) + llm.get("security", []))],
+        suggestions_markdown=md,
+        meta={"llm": True},
+    ).model_dump()
+    return AnalyzeResponse.model_validate(resp).model_dump_json().encode()
+
+def fast(local: Dict[str, Any], llm: Dict[str, Any], md: str) -> bytes:
+    return dumps(build_report(local, llm, md, True))
+
+def findings(n: int, dup: float, seed: int = 0) -> Dict[str, Any]:
+    """本地与 LLM 各约一半；dup 比例的 LLM 发现与本地发现重复"""
+    rnd = random.Random(seed)
+    local: Dict[str, List[Dict[str, Any]]] = {k: [] for k in CATS}
+    llm: Dict[str, List[Dict[str, Any]]] = {k: [] for k in CATS}
+    for k in range(n // 2):
+        cat = rnd.choice(CATS)
+        line = rnd.randint(1, 20000)
+        local[cat].append({"rule_id": f"SEC.R{k % 23}", "severity": rnd.choice(["low", "medium", "high"]),
+                           "message": f"第 {k} 条本地发现", "start_line": line, "end_line": line,
+                           "snippet": "cur.execute(\"SELECT * FROM t WHERE id=\" + uid)"})
+    pool = [(c, x) for c in CATS for x in local[c]]
+    for k in range(n - n // 2):
+        if pool and rnd.random() < dup:
+            cat, x = rnd.choice(pool)
+            llm[cat].append(dict(x))
+            continue
+        cat = rnd.choice(CATS)
+        line = rnd.randint(1, 20000)
+        llm[cat].append({"rule_id": f"LLM.R{k % 37}", "severity": rnd.choice(["low", "medium", "high"]),
+                         "message": f"第 {k} 条 LLM 发现", "start_line": line, "end_line": line + 2, "snippet": None})
+    return {"local": local, "llm": llm}
+
+def best_of(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--findings", type=int, default=10000)
+    ap.add_argument("--dup", type=float, default=0.2, help="LLM 发现与本地发现重复的比例")
+    ap.add_argument("--repeat", type=int, default=10)
+    args = ap.parse_args()
+
+    data = findings(args.findings, args.dup)
+    md = "### 修复建议\n\n- 使用参数化查询\n" * 50
+    a, b = legacy(data["local"], data["llm"], md), fast(data["local"], data["llm"], md)
+    # 两条路径的结果必须一致
+    assert json.loads(a) == json.loads(b), "新旧路径结果不一致"
+
+    t_legacy = best_of(lambda: legacy(data["local"], data["llm"], md), args.repeat)
+    t_fast = best_of(lambda: fast(data["local"], data["llm"], md), args.repeat)
+    kept = sum(len(v) for k, v in json.loads(b).items() if k in CATS)
+    print(f"findings: {args.findings} in, {kept} after dedup, {len(b) / 1024:.0f} KiB response, "
+          f"serializer: {'orjson' if orjson is not None else 'json'}")
+    print(f"{'legacy (pydantic)':<20} {t_legacy * 1000:>10.2f} ms")
+    print(f"{'fast (Finding)':<20} {t_fast * 1000:>10.2f} ms   x{t_legacy / t_fast:.1f}")
+
+if __name__ == "__main__":
+    main()